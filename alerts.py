@@ -0,0 +1,214 @@
+"""
+Kinetic - Event-driven alerting on monitor state transitions
+
+The ingest workers compare each monitor's columns before and after a volley
+and hand the state transitions to the alert engine:
+
+    down / up            every probe lost in two volleys in a row, and back
+    latency / latency ok current median above ALERT_LATENCY ms, and back
+    loss / loss ok       current loss at or above ALERT_LOSS percent, and back
+
+Alert work grows with the number of transitions, not with the number of
+monitors. The engine keeps the raised conditions per monitor in memory: a
+raise for a condition already raised, or a clear for one that was never
+raised, is dropped, and a condition raised again within NOTIFY_PERIOD seconds
+of its last alert is held back along with its clear. Alerts are collected for
+KINETIC_ALERT_INTERVAL seconds and mailed as one message; a raise and its
+clear inside the same batch cancel out.
+
+Raised conditions do not survive a restart, so a monitor that recovers after
+one does not produce an "up" alert.
+
+Server environment variables:
+    KINETIC_ALERT_INTERVAL   seconds alerts are collected before they are mailed (default 10)
+"""
+
+import logging
+from datetime import datetime
+from os import environ
+from threading import Event, Lock, Thread
+from fastapi.templating import Jinja2Templates
+from humanize import naturaltime
+from database import SessionLocal
+from models import Agents, Targets, Monitors
+from notify import notifier
+
+logger = logging.getLogger(__name__)
+
+templates = Jinja2Templates(directory="templates")
+
+# Condition each alert raises or clears
+RAISES = {"down": "down", "latency": "latency", "loss": "loss"}
+CLEARS = {"up": "down", "latency ok": "latency", "loss ok": "loss"}
+
+# Row colors per alert, raises stand out and clears are green
+COLORS = {"down": "#DC4C64", "latency": "#E4A11B", "loss": "#E4A11B", "up": "#14A44D", "latency ok": "#14A44D", "loss ok": "#14A44D"}
+
+# Seconds before a condition alerts again for the same monitor unless NOTIFY_PERIOD is set
+NOTIFY_PERIOD = 300
+
+def is_down(row: dict) -> bool:
+    """ Every probe lost in the last two volleys """
+    return row["current_loss"] == row["pollcount"] and row["prev_loss"] == row["pollcount"]
+
+def transitions(before: dict, after: dict, latency: float = None, loss: float = None) -> list[str]:
+    """
+    Alerts for one volley.
+
+    Args:
+        before (dict): Monitor columns before the volley
+        after (dict): Monitor columns after the volley
+        latency (float): ALERT_LATENCY threshold in ms, None to skip
+        loss (float): ALERT_LOSS threshold in percent, None to skip
+
+    Returns:
+        list[str]: Alert names, empty if nothing changed
+    """
+    down = is_down(after)
+    if down != is_down(before):
+        return ["down" if down else "up"]
+    if down:
+        # latency and loss are meaningless while down
+        return []
+
+    alerts = []
+    if latency is not None:
+        breach = after["current_median"] > latency
+        if breach != (before["current_median"] > latency):
+            alerts.append("latency" if breach else "latency ok")
+    if loss is not None:
+        breach = after["current_loss"] * 100 >= loss * after["pollcount"]
+        if breach != (before["current_loss"] * 100 >= loss * before["pollcount"]):
+            alerts.append("loss" if breach else "loss ok")
+    return alerts
+
+class AlertEngine:
+    """
+    Deduplicates alerts per monitor and mails them in batches.
+
+    Args:
+        interval (int): Seconds alerts are collected before they are mailed
+    """
+
+    def __init__(self, interval: int = None):
+        self.interval = max(1, interval or int(environ.get("KINETIC_ALERT_INTERVAL", 10)))
+        self.lock = Lock()
+        self.stopped = Event()
+        self.thread = None
+        self.raised = {}
+        self.pending = []
+
+    def start(self):
+        """ Start the delivery thread """
+        if self.thread:
+            return
+        self.stopped.clear()
+        self.thread = Thread(target=self.worker, name="kinetic-alerts", daemon=True)
+        self.thread.start()
+
+    def stop(self, timeout: float = 10.0):
+        """ Mail what is pending and stop the delivery thread """
+        self.stopped.set()
+        if self.thread:
+            self.thread.join(timeout)
+        self.thread = None
+
+    def thresholds(self, db) -> tuple:
+        """ ALERT_LATENCY and ALERT_LOSS from the cached env settings, None when unset """
+        config = notifier.settings(db)
+        latency, loss = config.get("ALERT_LATENCY"), config.get("ALERT_LOSS")
+        return (float(latency) if latency else None, float(loss) if loss else None)
+
+    def observe(self, events: list[tuple]):
+        """
+        Record alerts computed during ingest, called from the ingest workers.
+
+        Args:
+            events (list[tuple]): (monitor id, alert name, datetime) in volley order
+        """
+        if not events:
+            return
+        with self.lock:
+            period = float((notifier.config or {}).get("NOTIFY_PERIOD") or NOTIFY_PERIOD)
+            for monitor_id, alert, when in events:
+                raised = self.raised.setdefault(monitor_id, {})
+                if alert in RAISES:
+                    condition = RAISES[alert]
+                    last = raised.get(condition)
+                    if last is not None and (last[1] or when.timestamp() - last[0] < period):
+                        # already raised, or flapping inside the hold-off
+                        continue
+                    raised[condition] = (when.timestamp(), True)
+                    self.pending.append((monitor_id, alert, when))
+                else:
+                    condition = CLEARS[alert]
+                    last = raised.get(condition)
+                    if last is None or not last[1]:
+                        # never alerted, or held back
+                        continue
+                    raised[condition] = (last[0], False)
+
+                    # "up" clears every condition, latency and loss are not tracked while down
+                    if alert == "up":
+                        for other, (since, active) in raised.items():
+                            raised[other] = (since, False)
+
+                    # a raise still waiting in this batch cancels out with its clear
+                    for i, (pending_id, pending_alert, _) in enumerate(self.pending):
+                        if pending_id == monitor_id and RAISES.get(pending_alert) == condition:
+                            del self.pending[i]
+                            break
+                    else:
+                        self.pending.append((monitor_id, alert, when))
+
+    def worker(self):
+        """ Mail pending alerts every interval until stopped, then once more """
+        while not self.stopped.wait(self.interval):
+            self.flush()
+        self.flush()
+
+    def flush(self):
+        """ Mail everything pending as one message """
+        with self.lock:
+            pending, self.pending = self.pending, []
+        if not pending:
+            return
+
+        try:
+            db = SessionLocal()
+            try:
+                config = notifier.settings(db)
+                if not notifier.enabled(config):
+                    return
+                names = {row.id: row for row in db.query(Monitors.id, Monitors.description, Agents.name, Targets.address).\
+                    join(Agents, Agents.id == Monitors.agent_id).join(Targets, Targets.id == Monitors.target_id).\
+                    filter(Monitors.id.in_({monitor_id for monitor_id, _, _ in pending})).all()}
+            finally:
+                db.close()
+
+            monitors = []
+            for monitor_id, alert, when in pending:
+                row = names.get(monitor_id)
+                if not row:
+                    # deleted since
+                    continue
+                monitors.append({
+                    "alert": alert,
+                    "agent": row.name,
+                    "target": row.address,
+                    "description": row.description,
+                    "last_down": naturaltime(when),
+                    "color": COLORS[alert]
+                })
+            if not monitors:
+                return
+
+            context = notifier.context(monitors)
+            context["alerts"] = True
+            context["heading"] = f"{len(monitors)} monitor alert{'s' if len(monitors) > 1 else ''} as of {datetime.now().strftime('%H:%M:%S')}"
+            notifier.send(config, "Monitor Alerts", templates.get_template("volley_notify.html").render(context))
+        except Exception:
+            logger.exception("alerts: dropped %d alerts", len(pending))
+
+# Fed by the ingest workers, started and stopped by the app lifespan
+alerts = AlertEngine()
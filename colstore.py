@@ -0,0 +1,490 @@
+"""
+Kinetic - Chunked columnar time-series store
+
+Backend for tsdb (KINETIC_TSDB=columnar) built for many monitors. Instead of
+one RRD file per monitor, every volley is reduced to a fixed-size record
+
+    monitor index, timestamp, loss %, median, min, p25, p75, p95, max, volleys
+
+and records of all monitors are kept together in time chunks
+(KINETIC_TSDB_CHUNK seconds, default one hour):
+
+    hot/<chunk>.<format>.bin   append-only records of the current chunk, read memory-mapped
+    seg/<chunk>.npz            sealed chunk: compressed, sorted by monitor and time,
+                               with 5 minute and 1 hour rollups and a per-monitor index
+
+Ingest only appends to an in-memory buffer, written to the hot files every
+KINETIC_TSDB_FLUSH seconds by a background thread (readers flush first). The
+same thread seals a chunk once it is KINETIC_TSDB_LATE seconds past its end;
+results arriving for a sealed chunk go to a new hot file and are merged in by
+the next seal. A range scan reads the coarsest level that still fits the
+requested width, so a year of history is a few thousand rollup rows, and
+reads any number of monitors in one pass per chunk.
+
+Monitor ids map to small integer indexes in monitors.txt, one line per
+monitor ("<agent_id> <monitor_id> <step>", a line starting with "-" deletes).
+Records do not depend on the pollcount, so monitors can change it freely.
+Hot files carry their record format in the name and segments store it, older
+formats are widened to the current one when read, missing columns as NaN.
+
+Raw records are dropped from segments older than KINETIC_TSDB_RAW days, whole
+segments after KINETIC_TSDB_RETAIN days, like the RRA lengths of the RRD files.
+
+Server environment variables:
+    KINETIC_TSDB_PATH      store directory (default ./data/tsdb)
+    KINETIC_TSDB_CHUNK     seconds per chunk (default 3600)
+    KINETIC_TSDB_FLUSH     seconds buffered records may wait (default 10)
+    KINETIC_TSDB_LATE      seconds after its end a chunk is sealed (default 600)
+    KINETIC_TSDB_RAW       days raw records are kept (default 7)
+    KINETIC_TSDB_RETAIN    days rollups are kept (default 400)
+    KINETIC_TSDB_SEGMENTS  sealed segments kept decompressed in memory (default 48)
+"""
+
+import logging
+import warnings
+from collections import OrderedDict
+from glob import glob
+from math import ceil
+from os import environ, makedirs, path, remove, replace
+from threading import Event, Lock, Thread
+from time import time
+from typing import Optional
+import numpy as np
+from tsdb import SERIES_COLUMNS, TimeSeriesBackend, volley_summary
+
+logger = logging.getLogger(__name__)
+
+# Record formats by version, readers widen older ones to the current one
+FORMATS = {
+    1: np.dtype([("mon", "<u4"), ("ts", "<u4")] + [(name, "<f4") for name in SERIES_COLUMNS] + [("n", "<u4")])
+}
+FORMAT = max(FORMATS)
+RECORD = FORMATS[FORMAT]
+
+# Segment levels, finest first: name and seconds per row (0 = one row per volley)
+LEVELS = (("raw", 0), ("r300", 300), ("r3600", 3600))
+
+def widen(records: np.ndarray) -> np.ndarray:
+    """ Records of an older format in the current one, new columns NaN """
+    if records.dtype == RECORD:
+        return records
+    wide = np.zeros(len(records), dtype=RECORD)
+    for name in SERIES_COLUMNS:
+        wide[name] = np.nan
+    for name in records.dtype.names:
+        if name in RECORD.names:
+            wide[name] = records[name]
+    return wide
+
+def aggregate(records: np.ndarray, group: np.ndarray, size: int) -> dict:
+    """
+    Combine records into groups.
+
+    Means (loss, median, percentiles) are weighted by the volleys behind each
+    record and skip missing values, min and max are the extremes. The same
+    rule builds the rollups and the rows of a scan, so any mix of levels
+    combines consistently.
+
+    Args:
+        records (np.ndarray): RECORD array
+        group (np.ndarray): Group number of every record
+        size (int): Number of groups
+
+    Returns:
+        dict: Column name -> float array of length size, NaN for empty groups, plus "n"
+    """
+    weight = records["n"].astype(float)
+    columns = {"n": np.bincount(group, weight, size)}
+    with np.errstate(invalid="ignore", divide="ignore"):
+        for name in SERIES_COLUMNS:
+            values = records[name].astype(float)
+            if name in ("min", "max"):
+                extreme = np.full(size, np.nan)
+                (np.fmin if name == "min" else np.fmax).at(extreme, group, values)
+                columns[name] = extreme
+            else:
+                valid = ~np.isnan(values)
+                weights = np.bincount(group[valid], weight[valid], size)
+                columns[name] = np.bincount(group[valid], values[valid] * weight[valid], size) / weights
+    return columns
+
+def rollup(records: np.ndarray, seconds: int) -> np.ndarray:
+    """ Records (or rollups) combined into one record per monitor per `seconds`, sorted by monitor and time """
+    if not len(records):
+        return records
+    bucket = records["ts"] // seconds * seconds
+    key = records["mon"].astype(np.uint64) << np.uint64(32) | bucket.astype(np.uint64)
+    keys, group = np.unique(key, return_inverse=True)
+    columns = aggregate(records, group.ravel(), len(keys))
+    rolled = np.zeros(len(keys), dtype=RECORD)
+    rolled["mon"] = keys >> np.uint64(32)
+    rolled["ts"] = keys & np.uint64(0xFFFFFFFF)
+    rolled["n"] = columns["n"]
+    for name in SERIES_COLUMNS:
+        rolled[name] = columns[name]
+    return rolled
+
+def index(records: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """ Monitors present in records sorted by monitor, and where each one's run starts (one extra end offset) """
+    mons, starts = np.unique(records["mon"], return_index=True)
+    return mons, np.append(starts, len(records))
+
+class ColumnarBackend(TimeSeriesBackend):
+    """
+    Chunked columnar store with rollups.
+
+    Args:
+        root (str): Store directory
+        chunk (int): Seconds per chunk
+        interval (int): Seconds buffered records may wait
+    """
+
+    name = "columnar"
+
+    def __init__(self, root: str = None, chunk: int = None, interval: int = None):
+        self.root = root or environ.get("KINETIC_TSDB_PATH", "./data/tsdb")
+        self.chunk = max(60, chunk or int(environ.get("KINETIC_TSDB_CHUNK", 3600)))
+        self.interval = max(1, interval or int(environ.get("KINETIC_TSDB_FLUSH", 10)))
+        self.late = int(environ.get("KINETIC_TSDB_LATE", 600))
+        self.raw_days = int(environ.get("KINETIC_TSDB_RAW", 7))
+        self.retain_days = int(environ.get("KINETIC_TSDB_RETAIN", 400))
+        self.cache_size = max(1, int(environ.get("KINETIC_TSDB_SEGMENTS", 48)))
+        makedirs(path.join(self.root, "hot"), exist_ok=True)
+        makedirs(path.join(self.root, "seg"), exist_ok=True)
+
+        self.lock = Lock()
+        self.write_lock = Lock()
+        self.stopped = Event()
+        self.thread = None
+        self.pending = []
+        self.count = 0
+        self.segments = OrderedDict()
+        self.appended = 0
+        self.flushes = 0
+        self.sealed = 0
+        self.hits = 0
+        self.misses = 0
+        self.trimmed = 0
+
+        # monitor registry
+        self.registry = path.join(self.root, "monitors.txt")
+        self.monitors = {}
+        self.steps = {}
+        self.next = 0
+        if path.exists(self.registry):
+            with open(self.registry) as f:
+                for line in f:
+                    self.register(line.split())
+
+    def register(self, fields: list[str]) -> Optional[int]:
+        """ Apply one registry line, returns the monitor index """
+        if not fields:
+            return None
+        if fields[0] == "-":
+            self.monitors.pop((fields[1], fields[2]), None)
+            return None
+        key = (fields[0], fields[1])
+        mon = self.monitors.get(key)
+        if mon is None:
+            mon = self.monitors[key] = self.next
+            self.next += 1
+        self.steps[mon] = int(fields[2])
+        return mon
+
+    def monitor(self, agent_id: str, monitor_id: str, step: int) -> int:
+        """ Index of a monitor, registered on first sight or when its step changes (caller holds the lock) """
+        key = (str(agent_id), str(monitor_id))
+        mon = self.monitors.get(key)
+        if mon is None or self.steps[mon] != step:
+            fields = [key[0], key[1], str(int(step))]
+            with open(self.registry, "a") as f:
+                f.write(" ".join(fields) + "\n")
+            mon = self.register(fields)
+        return mon
+
+    def start(self):
+        """ Start the flush and seal thread """
+        if self.thread:
+            return
+        self.stopped.clear()
+        self.thread = Thread(target=self.worker, name="kinetic-tsdb", daemon=True)
+        self.thread.start()
+
+    def stop(self, timeout: float = 30.0):
+        """ Stop the thread and write everything buffered """
+        self.stopped.set()
+        if self.thread:
+            self.thread.join(timeout)
+        self.thread = None
+        self.flush()
+
+    def append(self, updates: list[tuple]):
+        """ Summarize a batch of volleys and buffer the records """
+        if not updates:
+            return
+        rows = [results for _, _, _, results, _ in updates]
+        columns = volley_summary(rows, np.array([max(len(results), 1) for results in rows]))
+        records = np.zeros(len(updates), dtype=RECORD)
+        records["ts"] = [int(timestamp or time()) for _, _, _, _, timestamp in updates]
+        records["n"] = 1
+        for name in SERIES_COLUMNS:
+            records[name] = columns[name]
+
+        with self.lock:
+            records["mon"] = [self.monitor(agent_id, monitor_id, step) for agent_id, monitor_id, step, _, _ in updates]
+            self.pending.append(records)
+            self.count += len(records)
+            self.appended += len(records)
+
+    def flush(self, keys: Optional[list[tuple]] = None):
+        """ Append buffered records to the hot files of their chunks, every monitor at once """
+        with self.write_lock:
+            with self.lock:
+                if not self.pending:
+                    return
+                records = np.concatenate(self.pending)
+                self.pending = []
+                self.count = 0
+
+            chunks = records["ts"] // self.chunk
+            for chunk in np.unique(chunks):
+                with open(self.hot(int(chunk)), "ab") as f:
+                    f.write(records[chunks == chunk].tobytes())
+            with self.lock:
+                self.flushes += 1
+
+    def hot(self, chunk: int) -> str:
+        """ Hot file of a chunk in the current format """
+        return path.join(self.root, "hot", f"{chunk}.{FORMAT}.bin")
+
+    def hot_files(self) -> dict:
+        """ chunk -> [(hot file, format)] of every format on disk """
+        files = {}
+        for name in glob(path.join(self.root, "hot", "*.bin")):
+            chunk, version, _ = path.basename(name).split(".")
+            files.setdefault(int(chunk), []).append((name, int(version)))
+        return files
+
+    def seg_chunks(self) -> list[int]:
+        """ Chunks with a sealed segment """
+        return sorted(int(path.basename(name).split(".")[0]) for name in glob(path.join(self.root, "seg", "*.npz")))
+
+    @staticmethod
+    def read_hot(name: str, version: int) -> np.ndarray:
+        """ Records of a hot file, memory-mapped """
+        dtype = FORMATS[version]
+        size = path.getsize(name) // dtype.itemsize
+        if not size:
+            return np.zeros(0, dtype=RECORD)
+        return widen(np.memmap(name, dtype=dtype, mode="r", shape=(size,)))
+
+    def segment(self, chunk: int, levels: tuple[str, ...]) -> Optional[tuple[str, np.ndarray, np.ndarray, np.ndarray]]:
+        """
+        The first of `levels` stored in a chunk's segment, decompressed on first use and kept in an LRU.
+
+        Returns:
+            tuple: (level, records, monitors present, run offsets), None without a segment
+        """
+        name = path.join(self.root, "seg", f"{chunk}.npz")
+        try:
+            stamp = path.getmtime(name)
+        except OSError:
+            return None
+        with self.lock:
+            cached = self.segments.get(chunk)
+            if cached and cached[0] == stamp:
+                self.segments.move_to_end(chunk)
+            else:
+                cached = None
+
+        with np.load(name) as npz:
+            if cached is None:
+                cached = (stamp, set(npz.files), {})
+            level = next((level for level in levels if level in cached[1]), None)
+            if level is None:
+                return None
+            loaded = cached[2].get(level)
+            if loaded is None:
+                records = widen(npz[level].view(FORMATS[int(npz["format"])]))
+                loaded = cached[2][level] = (records, *index(records))
+                with self.lock:
+                    self.misses += 1
+            else:
+                with self.lock:
+                    self.hits += 1
+
+        with self.lock:
+            self.segments[chunk] = cached
+            self.segments.move_to_end(chunk)
+            while len(self.segments) > self.cache_size:
+                self.segments.popitem(last=False)
+        return (level, *loaded)
+
+    def save(self, chunk: int, levels: dict):
+        """ Write a segment, replacing any previous one atomically """
+        name = path.join(self.root, "seg", f"{chunk}.npz")
+        temp = name + ".tmp.npz"
+        np.savez_compressed(temp, format=np.array(FORMAT), **{level: records.view(np.uint8) for level, records in levels.items()})
+        replace(temp, name)
+
+    def seal(self, chunk: int, files: list[tuple]):
+        """
+        Merge a chunk's hot files (and its existing segment) into a sorted, compressed segment.
+
+        Args:
+            chunk (int): Chunk number
+            files (list): (hot file, format) of the chunk
+        """
+        with self.write_lock:
+            records = np.concatenate([np.array(self.read_hot(name, version)) for name, version in files])
+            old = self.segment(chunk, ("raw",))
+            trimmed = old is None and path.exists(path.join(self.root, "seg", f"{chunk}.npz"))
+            if old:
+                records = np.concatenate([old[1], records])
+
+            # drop deleted monitors, then sort by monitor and time
+            with self.lock:
+                live = np.array(sorted(self.monitors.values()), dtype=np.uint32)
+            records = records[np.isin(records["mon"], live)]
+            records = records[np.lexsort((records["ts"], records["mon"]))]
+
+            # raw records of a trimmed chunk are gone, late ones only add to its rollups
+            levels = {} if trimmed else {"raw": records}
+            for level, seconds in LEVELS[1:]:
+                kept = self.segment(chunk, (level,)) if trimmed else None
+                levels[level] = rollup(np.concatenate([kept[1], records]) if kept else records, seconds)
+
+            self.save(chunk, levels)
+            for name, _ in files:
+                remove(name)
+            with self.lock:
+                self.sealed += 1
+
+    def trim(self, now: float):
+        """ Drop raw records and whole segments past their retention """
+        raw_before = (now - self.raw_days * 86400) // self.chunk
+        retain_before = (now - self.retain_days * 86400) // self.chunk
+        for chunk in self.seg_chunks():
+            if chunk >= raw_before:
+                break
+            name = path.join(self.root, "seg", f"{chunk}.npz")
+            with self.write_lock:
+                if chunk < retain_before:
+                    remove(name)
+                    with self.lock:
+                        self.trimmed += 1
+                    continue
+                if self.segment(chunk, ("raw",)):
+                    self.save(chunk, {level: self.segment(chunk, (level,))[1] for level, _ in LEVELS[1:]})
+                    with self.lock:
+                        self.trimmed += 1
+
+    def worker(self):
+        """ Flush every interval, seal chunks that are done, trim hourly """
+        trimmed = 0
+        while not self.stopped.wait(self.interval):
+            try:
+                self.flush()
+                now = time()
+                for chunk, files in sorted(self.hot_files().items()):
+                    if (chunk + 1) * self.chunk + self.late <= now:
+                        self.seal(chunk, files)
+                if now - trimmed >= 3600:
+                    self.trim(now)
+                    trimmed = now
+            except Exception:
+                logger.exception("tsdb: flush or seal failed")
+
+    def scan(self, keys: list[tuple], start: int, end: int, width: int) -> dict:
+        """
+        Read many monitors over one time range, one pass per chunk.
+
+        The row step is the larger of the width resolution and the monitors'
+        own step; each chunk is read at the coarsest level not wider than it.
+        """
+        self.flush()
+        with self.lock:
+            mons = {key[:2]: self.monitors.get((str(key[0]), str(key[1]))) for key in keys}
+            mons = {key: mon for key, mon in mons.items() if mon is not None}
+            steps = [self.steps[mon] for mon in mons.values()]
+        if not mons:
+            return {}
+
+        # a whole number of monitor steps, so every row holds the same number of volleys
+        base = max(max(steps), 1)
+        step = ceil(max(ceil((end - start) / width), base) / base) * base
+        start = start // step * step
+        rows = ceil((end - start) / step)
+        wanted = np.array(sorted(mons.values()), dtype=np.uint32)
+        # coarsest level not wider than a row first, then finer ones, then coarser ones
+        fits = [name for name, seconds in LEVELS if seconds <= step]
+        order = tuple(reversed(fits)) + tuple(name for name, _ in LEVELS if name not in fits)
+
+        # records of the wanted monitors in range, from segments and hot files
+        # the write lock keeps a seal from moving records between the segment and hot files mid-read
+        with self.write_lock:
+            parts = []
+            hot = self.hot_files()
+            for chunk in range(start // self.chunk, (start + rows * step - 1) // self.chunk + 1):
+                stored = self.segment(chunk, order)
+                if stored:
+                    _, records, present, offsets = stored
+                    if len(wanted) <= 64:
+                        # index lookup, a slice per monitor
+                        at = np.searchsorted(present, wanted)
+                        parts.extend(records[offsets[i]:offsets[i + 1]] for i, mon in zip(at, wanted) if i < len(present) and present[i] == mon)
+                    else:
+                        parts.append(records[np.isin(records["mon"], wanted)])
+                for name, version in hot.get(chunk, []):
+                    records = self.read_hot(name, version)
+                    parts.append(np.array(records[np.isin(records["mon"], wanted)]))
+
+        records = np.concatenate(parts) if parts else np.zeros(0, dtype=RECORD)
+        records = records[(records["ts"] >= start) & (records["ts"] < start + rows * step)]
+        if not len(records):
+            return {}
+
+        # one row per monitor per step, monitors without records are left out
+        position = np.searchsorted(wanted, records["mon"])
+        bucket = (records["ts"].astype(np.int64) - start) // step
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", RuntimeWarning)
+            columns = aggregate(records, position * rows + bucket, len(wanted) * rows)
+        found = {}
+        present = set(np.unique(position).tolist())
+        for key, mon in mons.items():
+            i = int(np.searchsorted(wanted, mon))
+            if i in present:
+                found[key] = {"start": start, "step": step, "rows": rows,
+                    "columns": {name: columns[name][i * rows:(i + 1) * rows] for name in SERIES_COLUMNS}}
+        return found
+
+    def delete(self, agent_id: str, monitor_id: str):
+        """ Forget a monitor, its records are dropped when their chunks are (re)sealed """
+        key = (str(agent_id), str(monitor_id))
+        with self.lock:
+            mon = self.monitors.get(key)
+            if mon is None:
+                return
+            with open(self.registry, "a") as f:
+                f.write(f"- {key[0]} {key[1]}\n")
+            self.register(["-", *key])
+            self.pending = [records[records["mon"] != mon] for records in self.pending]
+            self.count = sum(len(records) for records in self.pending)
+
+    def stats(self) -> dict:
+        """ Buffer size, files and counters """
+        hot = self.hot_files()
+        with self.lock:
+            return {
+                "backend": self.name,
+                "monitors": len(self.monitors),
+                "pending": self.count,
+                "appended": self.appended,
+                "flushes": self.flushes,
+                "hot_chunks": len(hot),
+                "segments": len(glob(path.join(self.root, "seg", "*.npz"))),
+                "sealed": self.sealed,
+                "trimmed": self.trimmed,
+                "cache": {"segments": len(self.segments), "hits": self.hits, "misses": self.misses}
+            }
@@ -1,16 +1,47 @@
 """ Database configuration file """
 
-from sqlalchemy import create_engine
+from os import environ
+from sqlalchemy import create_engine, event, inspect, text
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.ext.declarative import declarative_base
 
 
 SQLALCHEMY_DATABASE_URL = "sqlite:///./data/kinetic.db"
 
+# Blocking routes run in a threadpool of this size, every thread may hold a
+# connection, the overflow covers the ingest workers
+DB_THREADS = int(environ.get("KINETIC_THREADS", 40))
+
 engine = create_engine(
-    SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
+    SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False, "timeout": 15},
+    pool_size=DB_THREADS, max_overflow=10
 )
 
+@event.listens_for(engine, "connect")
+def sqlite_pragmas(dbapi_connection, connection_record):
+    """ WAL lets readers carry on while a writer commits """
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.close()
+
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 Base = declarative_base()
+
+def add_missing_columns():
+    """
+    Add model columns that an existing database does not have yet.
+
+    create_all() only creates missing tables; new nullable columns are added
+    with ALTER TABLE so older kinetic.db files keep working.
+    """
+    inspector = inspect(engine)
+    with engine.begin() as connection:
+        for table in Base.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in existing:
+                    connection.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column.type.compile(engine.dialect)}"))
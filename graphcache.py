@@ -0,0 +1,122 @@
+"""
+Kinetic - Rendered graph cache for the console
+
+Console pages reference their graphs by URL (/console/graph/...) instead of
+inlining them, and the graph route renders through this cache. Entries are
+keyed by monitor, graph kind, start and end rounded to the RRD step, and
+size, so every operator looking at the same window shares one render until
+the next step starts. Concurrent requests for a graph that is being rendered
+wait for that render instead of starting their own.
+
+A window that was complete when it was rendered never changes and is kept
+until evicted. A window still receiving volleys is rendered with a ttl and
+drawn again once that has passed, so a fixed (start, end) key does not
+serve a graph missing its last volleys forever.
+
+The cache is an LRU bounded by the total size of the PNGs it holds.
+
+Server environment variables:
+    KINETIC_GRAPH_CACHE   bytes of rendered graphs kept in memory (default 33554432)
+"""
+
+from collections import OrderedDict
+from hashlib import md5
+from os import environ
+from threading import Event, Lock
+from time import time
+from typing import Callable, Optional
+
+class GraphCache:
+    """
+    LRU of rendered PNGs with a byte budget.
+
+    Args:
+        budget (int): Total bytes of PNG data kept
+    """
+
+    def __init__(self, budget: int = None):
+        self.budget = max(0, budget if budget is not None else int(environ.get("KINETIC_GRAPH_CACHE", 32 * 1024 * 1024)))
+        self.lock = Lock()
+        self.entries = OrderedDict()
+        self.rendering = {}
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+
+    def lookup(self, key: tuple) -> Optional[tuple[bytes, str, Optional[float]]]:
+        """ The entry for key unless it has expired, caller holds the lock """
+        entry = self.entries.get(key)
+        if entry and entry[2] is not None and entry[2] <= time():
+            self.size -= len(self.entries.pop(key)[0])
+            return None
+        if entry:
+            self.entries.move_to_end(key)
+            self.hits += 1
+        return entry
+
+    def get(self, key: tuple, render: Callable[[], Optional[bytes]], ttl: Optional[float] = None) -> Optional[tuple[bytes, str, Optional[float]]]:
+        """
+        A cached graph, rendered on a miss.
+
+        Args:
+            key (tuple): (monitor id, kind, start, end, width)
+            render (callable): Returns the PNG, or None when there is nothing to draw
+            ttl (float): Seconds a new render stays valid, None if the window is complete and it never changes
+
+        Returns:
+            tuple: (png, etag, expires), expires in epoch seconds or None for a final render,
+                None if render returned None
+        """
+        with self.lock:
+            entry = self.lookup(key)
+            if entry:
+                return entry
+            rendering = self.rendering.get(key)
+            if rendering is None:
+                rendering = self.rendering[key] = Event()
+                owner = True
+            else:
+                owner = False
+
+        # someone else is rendering it, use theirs
+        if not owner:
+            rendering.wait(30)
+            with self.lock:
+                entry = self.lookup(key)
+                if entry:
+                    return entry
+
+        try:
+            expires = None if ttl is None else time() + ttl
+            png = render()
+            entry = (png, f'"{md5(png).hexdigest()}"', expires) if png else None
+            with self.lock:
+                self.misses += 1
+                if entry and len(png) <= self.budget:
+                    if key in self.entries:
+                        self.size -= len(self.entries.pop(key)[0])
+                    self.entries[key] = entry
+                    self.size += len(png)
+                    while self.size > self.budget:
+                        _, (old, _, _) = self.entries.popitem(last=False)
+                        self.size -= len(old)
+            return entry
+        finally:
+            if owner:
+                with self.lock:
+                    self.rendering.pop(key, None)
+                rendering.set()
+
+    def stats(self) -> dict:
+        """ Cache size and counters """
+        with self.lock:
+            return {
+                "entries": len(self.entries),
+                "bytes": self.size,
+                "budget": self.budget,
+                "hits": self.hits,
+                "misses": self.misses
+            }
+
+# Shared by every console request thread
+graphcache = GraphCache()
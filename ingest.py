@@ -0,0 +1,135 @@
+"""
+Kinetic - Asynchronous ingest queue for agent volley submissions
+
+PUT /volley/{agent_id} only validates a submission and hands it to this queue;
+a small pool of worker threads drains it into the database and RRD files in
+batches. Submissions are sharded by agent id so every agent is always handled
+by the same worker, which keeps the per-monitor statistics and RRD updates in
+submission order without any locking between workers.
+
+Server environment variables:
+    KINETIC_INGEST_WORKERS   worker threads (default 2)
+    KINETIC_INGEST_QUEUE     queued submissions before PUT answers 503 (default 1000)
+    KINETIC_INGEST_BATCH     submissions handled per database transaction (default 50)
+"""
+
+import logging
+from os import environ
+from queue import Queue, Empty, Full
+from threading import Thread, Lock
+from zlib import crc32
+
+logger = logging.getLogger(__name__)
+
+# sentinel telling a worker to exit once its queue is drained
+STOP = object()
+
+class IngestQueue:
+    """
+    Bounded in-process queue drained by a pool of worker threads.
+
+    Args:
+        handler (callable): Called from a worker thread with a list of queued items
+        workers (int): Number of worker threads
+        maxsize (int): Total number of items held before put() refuses more
+        batch (int): Maximum number of items handed to handler at once
+    """
+
+    def __init__(self, handler, workers: int = None, maxsize: int = None, batch: int = None):
+        self.handler = handler
+        self.workers = max(1, workers or int(environ.get("KINETIC_INGEST_WORKERS", 2)))
+        self.maxsize = max(self.workers, maxsize or int(environ.get("KINETIC_INGEST_QUEUE", 1000)))
+        self.batch = max(1, batch or int(environ.get("KINETIC_INGEST_BATCH", 50)))
+        self.queues = [Queue(maxsize=self.maxsize // self.workers) for _ in range(self.workers)]
+        self.threads = []
+        self.lock = Lock()
+        self.accepted = 0
+        self.rejected = 0
+        self.processed = 0
+        self.failed = 0
+
+    def start(self):
+        """ Start the worker threads """
+        if self.threads:
+            return
+        for shard in self.queues:
+            thread = Thread(target=self.worker, args=(shard,), name="kinetic-ingest", daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+    def stop(self, timeout: float = 30.0):
+        """ Drain the queues and stop the worker threads """
+        for shard in self.queues:
+            shard.put(STOP)
+        for thread in self.threads:
+            thread.join(timeout)
+        self.threads = []
+
+    def put(self, key: str, item) -> bool:
+        """
+        Queue an item without blocking.
+
+        Args:
+            key (str): Shard key, items with the same key are handled in order by one worker
+            item: Anything the handler understands
+
+        Returns:
+            bool: False if the shard is full and the item was not queued
+        """
+        try:
+            self.queues[crc32(key.encode()) % self.workers].put_nowait(item)
+        except Full:
+            with self.lock:
+                self.rejected += 1
+            return False
+        with self.lock:
+            self.accepted += 1
+        return True
+
+    def depth(self) -> int:
+        """ Number of items waiting in all shards """
+        return sum(shard.qsize() for shard in self.queues)
+
+    def stats(self) -> dict:
+        """ Queue depth and counters """
+        with self.lock:
+            return {
+                "depth": self.depth(),
+                "capacity": sum(shard.maxsize for shard in self.queues),
+                "workers": len(self.threads),
+                "batch": self.batch,
+                "accepted": self.accepted,
+                "rejected": self.rejected,
+                "processed": self.processed,
+                "failed": self.failed
+            }
+
+    def worker(self, shard: Queue):
+        """ Block for one item, then take whatever else is already waiting up to the batch size """
+        while True:
+            item = shard.get()
+            if item is STOP:
+                return
+            items = [item]
+            stop = False
+            while len(items) < self.batch:
+                try:
+                    item = shard.get_nowait()
+                except Empty:
+                    break
+                if item is STOP:
+                    stop = True
+                    break
+                items.append(item)
+
+            try:
+                self.handler(items)
+                with self.lock:
+                    self.processed += len(items)
+            except Exception:
+                logger.exception("ingest: dropped a batch of %d submissions", len(items))
+                with self.lock:
+                    self.failed += len(items)
+
+            if stop:
+                return
@@ -0,0 +1,193 @@
+"""
+Kinetic - Per-agent job list cache for GET /volley/{agent_id}
+
+Each agent's job list (monitors joined with their target address) is built
+with one query on first poll and kept in memory with a due-time index, so a
+poll only has to cut the sorted index at "now". The agents, targets and
+monitors routers invalidate the cache whenever they change something; the
+ingest workers move a monitor's due time when its results arrive.
+
+Every cached list carries the configuration version it was built from, which
+is the ETag agents send back in If-None-Match. Long-polling requests wait on
+the cache until the agent's configuration changes.
+
+The cache lives in the server process; run a single worker process, as the
+Docker image does, or every process keeps its own copy.
+"""
+
+import asyncio
+from bisect import bisect_right, insort
+from threading import Lock
+from time import time
+from typing import Optional
+from zlib import crc32
+from models import Agents, Targets, Monitors
+
+# ETags from before a restart never match, versions start again at zero
+BOOT = f"{int(time()):x}"
+
+# Seconds between last_seen writes for an agent that only polls
+LAST_SEEN_INTERVAL = 60
+
+class AgentJobs:
+    """
+    Cached job list of one agent.
+
+    Attributes:
+        jobs (dict): monitor id -> job dict as returned to the agent
+        due (list): sorted (due time, monitor id) index
+        address (str): Agent address as stored in the database
+        last_seen (float): Last time last_seen was written to the database
+        version (int): Configuration version the list was built from
+    """
+
+    def __init__(self, address: Optional[str], last_seen: float, version: int):
+        self.version = version
+        self.jobs = {}
+        self.due = []
+        self.due_at = {}
+        self.address = address
+        self.last_seen = last_seen
+
+    def schedule(self, monitor_id: str, due: float):
+        """ Move a monitor to a new due time """
+        if monitor_id in self.due_at:
+            self.due.remove((self.due_at[monitor_id], monitor_id))
+        self.due_at[monitor_id] = due
+        insort(self.due, (due, monitor_id))
+
+class JobCache:
+    """ Per-agent job lists with a due-time index, shared by every request thread """
+
+    def __init__(self):
+        self.lock = Lock()
+        self.agents = {}
+        self.generation = 0
+        self.waiters = {}
+
+    def invalidate(self, agent_id: Optional[str] = None):
+        """
+        Drop cached job lists.
+
+        Args:
+            agent_id (str): Only this agent, None for every agent (target changes affect all of them)
+        """
+        with self.lock:
+            self.generation += 1
+            if agent_id is None:
+                self.agents.clear()
+                waiters = [waiter for waiting in self.waiters.values() for waiter in waiting]
+            else:
+                self.agents.pop(agent_id, None)
+                waiters = list(self.waiters.get(agent_id, ()))
+
+        # wake long-polling requests on their own event loop
+        for loop, future in waiters:
+            loop.call_soon_threadsafe(JobCache.wake, future)
+
+    @staticmethod
+    def wake(future: asyncio.Future):
+        """ Resolve a waiter unless it already timed out """
+        if not future.done():
+            future.set_result(True)
+
+    async def wait(self, agent_id: str, entry: AgentJobs, timeout: float):
+        """
+        Wait until the agent's configuration changes or timeout seconds pass.
+
+        Args:
+            agent_id (str): Agent id
+            entry (AgentJobs): The list the caller is looking at, returns at once if it is already stale
+            timeout (float): Seconds to wait
+        """
+        loop = asyncio.get_running_loop()
+        waiter = (loop, loop.create_future())
+        with self.lock:
+            if self.agents.get(agent_id) is not entry:
+                return
+            self.waiters.setdefault(agent_id, []).append(waiter)
+        try:
+            await asyncio.wait_for(waiter[1], timeout)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            with self.lock:
+                waiting = self.waiters.get(agent_id, [])
+                if waiter in waiting:
+                    waiting.remove(waiter)
+                if not waiting:
+                    self.waiters.pop(agent_id, None)
+
+    def load(self, db, agent_id: str) -> Optional[AgentJobs]:
+        """ Build an agent's job list with one query, None if the agent does not exist or is disabled """
+        with self.lock:
+            entry = self.agents.get(agent_id)
+            generation = self.generation
+        if entry:
+            return entry
+
+        agent = db.query(Agents.address, Agents.last_seen).filter(Agents.id == agent_id).filter(Agents.is_active == True).first()
+        if not agent:
+            return None
+
+        entry = AgentJobs(agent.address, agent.last_seen.timestamp() if agent.last_seen else 0, generation)
+        rows = db.query(Monitors.id, Monitors.protocol, Monitors.port, Monitors.dscp, Monitors.pollcount,
+            Monitors.pollinterval, Monitors.last_update, Targets.address).\
+            join(Targets, Targets.id == Monitors.target_id).\
+            filter(Monitors.agent_id == agent_id).filter(Monitors.is_active == True).filter(Targets.is_active == True).all()
+        for row in rows:
+            entry.jobs[row.id] = {
+                "id": row.id,
+                "address": row.address,
+                "protocol": row.protocol,
+                "port": row.port,
+                "dscp": row.dscp,
+                "pollcount": row.pollcount,
+                "pollinterval": row.pollinterval
+            }
+            entry.schedule(row.id, row.last_update.timestamp() + row.pollinterval)
+
+        # keep it unless something changed while the query ran
+        with self.lock:
+            if self.generation == generation:
+                self.agents[agent_id] = entry
+        return entry
+
+    def jobs(self, entry: AgentJobs, all_jobs: bool = False) -> list[dict]:
+        """ The agent's jobs, only those due now unless all_jobs is set """
+        with self.lock:
+            if all_jobs:
+                return list(entry.jobs.values())
+            return [entry.jobs[monitor_id] for _, monitor_id in entry.due[:bisect_right(entry.due, time(), key=lambda item: item[0])]]
+
+    def next_due(self, entry: AgentJobs) -> Optional[float]:
+        """ When the agent's next monitor is due, None without monitors """
+        with self.lock:
+            return entry.due[0][0] if entry.due else None
+
+    def etag(self, entry: AgentJobs, jobs: list[dict], all_jobs: bool = False) -> str:
+        """ ETag of a job list: the configuration version, plus the due monitors unless all_jobs is set """
+        if all_jobs:
+            return f'"{BOOT}-{entry.version}"'
+        return f'"{BOOT}-{entry.version}-{crc32(",".join(job["id"] for job in jobs).encode()):x}"'
+
+    def updated(self, agent_id: str, monitor_id: str, last_update: float):
+        """ Results for a monitor arrived, it is next due one pollinterval later """
+        with self.lock:
+            entry = self.agents.get(agent_id)
+            if entry and monitor_id in entry.jobs:
+                entry.schedule(monitor_id, last_update + entry.jobs[monitor_id]["pollinterval"])
+
+    def seen(self, entry: AgentJobs, address: Optional[str]) -> bool:
+        """ Record a poll, True if address or last_seen should be written to the database """
+        now = time()
+        with self.lock:
+            if (address and address != entry.address) or now - entry.last_seen >= LAST_SEEN_INTERVAL:
+                if address:
+                    entry.address = address
+                entry.last_seen = now
+                return True
+        return False
+
+# Shared by the volley, agents, targets and monitors routers
+jobcache = JobCache()
@@ -3,11 +3,30 @@
 import uvicorn
 from fastapi import Depends, FastAPI, HTTPException
 from fastapi.responses import FileResponse
-from database import engine
+from database import engine, DB_THREADS, add_missing_columns
+from anyio import to_thread
 import models
-from routers import agents, targets, monitors, console, volley, env
+from routers import agents, targets, monitors, console, volley, env, api
+from notify import notifier
+from alerts import alerts
+from tsdb import tsdb
 from starlette.staticfiles import StaticFiles
 from datetime import datetime
+from contextlib import asynccontextmanager
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """ Size the route threadpool, start the volley ingest workers and background services, drain them on shutdown """
+    to_thread.current_default_thread_limiter().total_tokens = DB_THREADS
+    notifier.start(app)
+    alerts.start()
+    tsdb.start()
+    volley.ingest.start()
+    yield
+    volley.ingest.stop()
+    tsdb.stop()
+    alerts.stop()
+    notifier.stop()
 
 # Create FastAPI instance
 app = FastAPI(
@@ -16,11 +35,13 @@ app = FastAPI(
     version="0.1.0",
     docs_url="/docs",
     openapi_url="/openapi.json",
-    redoc_url="/redoc"
+    redoc_url="/redoc",
+    lifespan=lifespan
 )
 
 # Load SQLAlchemy mapper from models
 models.Base.metadata.create_all(bind=engine)
+add_missing_columns()
 
 # Static files
 app.mount("/static", StaticFiles(directory="static"), name="static")
@@ -43,6 +64,9 @@ app.include_router(volley.router)
 # App UI operations pass server_start_time to console.router
 app.include_router(console.router)
 
+# JSON data for browser-side charts
+app.include_router(api.router)
+
 @app.get("/favicon.ico", include_in_schema=False)
 async def favicon():
     """ Favicon """
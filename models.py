@@ -1,7 +1,7 @@
 """ Database Models """
 
 from datetime import datetime
-from sqlalchemy import Boolean, Column, ForeignKey, Integer, String, Float, DateTime, BigInteger
+from sqlalchemy import Boolean, Column, ForeignKey, Integer, String, Float, DateTime, BigInteger, LargeBinary
 from sqlalchemy.orm import relationship, backref
 from database import Base
 from uuid import uuid4 as UUID
@@ -59,6 +59,7 @@ class Monitors(Base):
     last_down      = Column(DateTime, default=datetime.now())
     last_update    = Column(DateTime, default=datetime.now())
     total_down     = Column(Integer, default=0)
+    stats          = Column(LargeBinary, nullable=True)
     agent_id       = Column(String, ForeignKey('agents.id'), nullable=False)
     target_id      = Column(String, ForeignKey('targets.id'), nullable=False)
     protocol       = Column(String, default="icmp")
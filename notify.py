@@ -0,0 +1,238 @@
+"""
+Kinetic - Down monitor list and mail delivery
+
+A background thread refreshes the list of down monitors shown by /volley/down
+every KINETIC_NOTIFY_INTERVAL seconds. Alert mails are triggered by state
+transitions in alerts.py and delivered here through a small pool of SMTP
+connections that stay open between batches. None of this runs on an agent
+request: polls and submissions never wait on the down query, template
+rendering or an SMTP session.
+
+The NOTIFY_*, ALERT_* and SMTP_* settings are read from the env table once and
+cached until the env router changes them.
+
+Server environment variables:
+    KINETIC_NOTIFY_INTERVAL   seconds between down list refreshes (default 60)
+    KINETIC_SMTP_POOL         SMTP connections kept open for reuse (default 2)
+"""
+
+import logging
+import smtplib
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+from os import environ
+from queue import LifoQueue, Empty
+from threading import Event, Lock, Thread
+from fastapi.templating import Jinja2Templates
+from humanize import naturaldelta, naturaltime
+from database import SessionLocal
+from models import Agents, Targets, Monitors, Env
+
+logger = logging.getLogger(__name__)
+
+templates = Jinja2Templates(directory="templates")
+
+# Env keys read by the notifier and the alert engine
+NOTIFY_KEYS = ("NOTIFY_EMAIL", "NOTIFY_ENABLED", "NOTIFY_PERIOD", "ALERT_LATENCY", "ALERT_LOSS",
+    "SMTP_SERVER", "SMTP_PORT", "SMTP_USERNAME", "SMTP_PASSWORD")
+
+class SMTPPool:
+    """
+    Open SMTP sessions reused across sends.
+
+    Idle connections are checked with NOOP before reuse and dropped when the
+    SMTP settings change.
+
+    Args:
+        size (int): Idle connections kept open
+    """
+
+    def __init__(self, size: int = None):
+        self.size = max(1, size or int(environ.get("KINETIC_SMTP_POOL", 2)))
+        self.idle = LifoQueue()
+        self.lock = Lock()
+        self.key = None
+
+    def connect(self, config: dict) -> smtplib.SMTP:
+        """ Open and authenticate a new session """
+        server = smtplib.SMTP(config["SMTP_SERVER"], int(config["SMTP_PORT"]), timeout=30)
+        server.starttls()                                                   # Enable secure connection
+        if config.get("SMTP_USERNAME") and config.get("SMTP_PASSWORD"):
+            server.login(config["SMTP_USERNAME"], config["SMTP_PASSWORD"])  # Login to the sender's email account
+        return server
+
+    @contextmanager
+    def connection(self, config: dict):
+        """ Borrow a live session for the given settings, returned to the pool unless it failed """
+        key = (config.get("SMTP_SERVER"), config.get("SMTP_PORT"), config.get("SMTP_USERNAME"), config.get("SMTP_PASSWORD"))
+        with self.lock:
+            if key != self.key:
+                self.close()
+                self.key = key
+
+        server = None
+        while server is None:
+            try:
+                server = self.idle.get_nowait()
+            except Empty:
+                server = self.connect(config)
+                break
+            try:
+                if server.noop()[0] != 250:
+                    raise smtplib.SMTPException("NOOP failed")
+            except (smtplib.SMTPException, OSError):
+                self.discard(server)
+                server = None
+
+        try:
+            yield server
+        except Exception:
+            self.discard(server)
+            raise
+        if self.idle.qsize() < self.size:
+            self.idle.put(server)
+        else:
+            self.discard(server)
+
+    def discard(self, server: smtplib.SMTP):
+        """ Close a session, ignoring a server that already hung up """
+        try:
+            server.quit()
+        except (smtplib.SMTPException, OSError):
+            server.close()
+
+    def close(self):
+        """ Close every idle session """
+        while True:
+            try:
+                self.discard(self.idle.get_nowait())
+            except Empty:
+                return
+
+class Notifier:
+    """
+    Periodic down monitor evaluation and notification.
+
+    Args:
+        interval (int): Seconds between evaluations
+    """
+
+    def __init__(self, interval: int = None):
+        self.interval = max(1, interval or int(environ.get("KINETIC_NOTIFY_INTERVAL", 60)))
+        self.lock = Lock()
+        self.stopped = Event()
+        self.thread = None
+        self.app = None
+        self.config = None
+        self.monitors = []
+        self.pool = SMTPPool()
+
+    def start(self, app):
+        """ Start the evaluation thread, app supplies the title and uptime for the message """
+        if self.thread:
+            return
+        self.app = app
+        self.stopped.clear()
+        self.thread = Thread(target=self.worker, name="kinetic-notify", daemon=True)
+        self.thread.start()
+
+    def stop(self, timeout: float = 10.0):
+        """ Stop the evaluation thread """
+        self.stopped.set()
+        if self.thread:
+            self.thread.join(timeout)
+        self.thread = None
+        self.pool.close()
+
+    def invalidate(self):
+        """ Drop the cached env configuration, called by the env router """
+        with self.lock:
+            self.config = None
+
+    def settings(self, db) -> dict:
+        """ NOTIFY_*, ALERT_* and SMTP_* values, one query on a cache miss """
+        with self.lock:
+            if self.config is not None:
+                return self.config
+        config = {row.key: row.value for row in db.query(Env.key, Env.value).filter(Env.key.in_(NOTIFY_KEYS)).all()}
+        with self.lock:
+            self.config = config
+        return config
+
+    def enabled(self, config: dict) -> bool:
+        """ Mail is configured and not turned off with NOTIFY_ENABLED """
+        if str(config.get("NOTIFY_ENABLED", "true")).lower() in ("false", "0", "no", "off"):
+            return False
+        return bool(config.get("SMTP_SERVER") and config.get("SMTP_PORT") and config.get("NOTIFY_EMAIL"))
+
+    def worker(self):
+        """ Refresh every interval until stopped """
+        while not self.stopped.wait(self.interval):
+            try:
+                self.evaluate()
+            except Exception:
+                logger.exception("notify: down evaluation failed")
+
+    def context(self, monitors: list = None) -> dict:
+        """ Template context for the mail template, the current down list unless monitors are given """
+        now = datetime.now()
+        return {
+            "title": self.app.title,
+            "description": self.app.description,
+            "server_localtime": now.strftime("%Y-%m-%d %H:%M:%S %Z"),
+            "server_timezone": self.app.server_timezone,
+            "server_start_time": self.app.server_start_time,
+            "server_run_time": naturaldelta(now - self.app.server_start_time),
+            "monitors": self.monitors if monitors is None else monitors
+        }
+
+    def evaluate(self):
+        """ Refresh the down list """
+        db = SessionLocal()
+        try:
+            # monitors that lost every probe in the last two volleys, with agent and target in one query
+            rows = db.query(Monitors.id, Monitors.description, Monitors.last_down, Agents.name, Targets.address).\
+                join(Agents, Agents.id == Monitors.agent_id).join(Targets, Targets.id == Monitors.target_id).\
+                filter(Monitors.is_active == True).filter(Agents.is_active == True).filter(Targets.is_active == True).\
+                filter(Monitors.current_loss == Monitors.pollcount).\
+                filter(Monitors.prev_loss == Monitors.pollcount).order_by(Monitors.id).all()
+
+            now = datetime.now()
+            monitors = []
+            for row in rows:
+                # if down for 2hrs, blue, 5hrs, yellow, 12hrs, red
+                color = None
+                if now - row.last_down > timedelta(hours=12):
+                    color = "#DC4C64"
+                elif now - row.last_down > timedelta(hours=5):
+                    color = "#E4A11B"
+                elif now - row.last_down > timedelta(hours=2):
+                    color = "#54B4D3"
+
+                monitors.append({
+                    "agent": row.name,
+                    "target": row.address,
+                    "description": row.description,
+                    "last_down": naturaltime(row.last_down),
+                    "color": color
+                })
+            self.monitors = monitors
+        finally:
+            db.close()
+
+    def send(self, config: dict, subject: str, html: str):
+        """ Mail a rendered message to NOTIFY_EMAIL (comma separated) over a pooled session """
+        message = MIMEMultipart()
+        message["From"] = config.get("SMTP_USERNAME")
+        message["To"] = config["NOTIFY_EMAIL"]
+        message["Subject"] = f"{self.app.title} - {subject}"
+        message.attach(MIMEText(html, "html"))
+
+        recipients = [address.strip() for address in config["NOTIFY_EMAIL"].split(",") if address.strip()]
+        with self.pool.connection(config) as server:
+            server.sendmail(config.get("SMTP_USERNAME"), recipients, message.as_string())
+
+# Started and stopped by the app lifespan
+notifier = Notifier()
@@ -10,6 +10,7 @@ from fastapi.encoders import jsonable_encoder
 from starlette import status
 from models import Agents
 from database import SessionLocal
+from jobcache import jobcache
 from uuid import uuid4 as UUID
 
 router = APIRouter(
@@ -48,7 +49,7 @@ class AgentModel(BaseModel):
         }
     }
 )
-async def read_agent_all(db: DBDependency):
+def read_agent_all(db: DBDependency):
     """ Get all agents """
     # Check the number of agents in the database
     count = db.query(Agents).count()
@@ -79,7 +80,7 @@ async def read_agent_all(db: DBDependency):
         }
     }
 )
-async def read_agent_id(db: DBDependency, agent_id: str = Path(..., min_length=36, max_length=36, pattern="^[a-f0-9]{8}-?[a-f0-9]{4}-?4[a-f0-9]{3}-?[89ab][a-f0-9]{3}-?[a-f0-9]{12}$")):
+def read_agent_id(db: DBDependency, agent_id: str = Path(..., min_length=36, max_length=36, pattern="^[a-f0-9]{8}-?[a-f0-9]{4}-?4[a-f0-9]{3}-?[89ab][a-f0-9]{3}-?[a-f0-9]{12}$")):
     """ Get agent by id """
     agent = db.query(Agents).filter(Agents.id == agent_id).first()
     if not agent:
@@ -101,7 +102,7 @@ async def read_agent_id(db: DBDependency, agent_id: str = Path(..., min_length=3
         }
     }
 )
-async def create_agent_id(db: DBDependency, agent: AgentModel):
+def create_agent_id(db: DBDependency, agent: AgentModel):
     """ Create an agent """
 
     # Check if agent already exists from post data
@@ -146,7 +147,7 @@ async def create_agent_id(db: DBDependency, agent: AgentModel):
         }
     }
 )
-async def update_agent_id(db: DBDependency, agent: AgentModel, agent_id: str = Path(..., min_length=36, max_length=36, pattern="^[a-f0-9]{8}-?[a-f0-9]{4}-?4[a-f0-9]{3}-?[89ab][a-f0-9]{3}-?[a-f0-9]{12}$")):
+def update_agent_id(db: DBDependency, agent: AgentModel, agent_id: str = Path(..., min_length=36, max_length=36, pattern="^[a-f0-9]{8}-?[a-f0-9]{4}-?4[a-f0-9]{3}-?[89ab][a-f0-9]{3}-?[a-f0-9]{12}$")):
     """ Update an agent """
     db_agent = db.query(Agents).filter(Agents.id == agent_id).first()
     if not db_agent:
@@ -157,6 +158,7 @@ async def update_agent_id(db: DBDependency, agent: AgentModel, agent_id: str = P
         db_agent.is_active = agent.is_active
         db.commit()
         db.refresh(db_agent)
+        jobcache.invalidate(agent_id)
     return db_agent
 
 @router.delete("/{agent_id}", status_code=status.HTTP_204_NO_CONTENT,
@@ -173,19 +175,20 @@ async def update_agent_id(db: DBDependency, agent: AgentModel, agent_id: str = P
         }}
     }
 )
-async def delete_agent_id(db: DBDependency, agent_id: str = Path(..., min_length=36, max_length=36, pattern="^[a-f0-9]{8}-?[a-f0-9]{4}-?4[a-f0-9]{3}-?[89ab][a-f0-9]{3}-?[a-f0-9]{12}$")):
+def delete_agent_id(db: DBDependency, agent_id: str = Path(..., min_length=36, max_length=36, pattern="^[a-f0-9]{8}-?[a-f0-9]{4}-?4[a-f0-9]{3}-?[89ab][a-f0-9]{3}-?[a-f0-9]{12}$")):
     """ Delete an agent """
     db_agent = db.query(Agents).filter(Agents.id == agent_id).first()
     if not db_agent:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Agent not found")
     db.delete(db_agent)
     db.commit()
+    jobcache.invalidate(agent_id)
 
     # Return 204 if monitor deleted
     return {"detail": "No Content"}
 
 @router.get("/name/{agent_name}", status_code=status.HTTP_200_OK, summary="Get a single agent by name")
-async def read_agent_name(db: DBDependency, agent_name: str = Path(..., min_length=4, max_length=16)):
+def read_agent_name(db: DBDependency, agent_name: str = Path(..., min_length=4, max_length=16)):
     """ Get agent by name """
     agent = db.query(Agents).filter(Agents.name == agent_name).first()
     if not agent:
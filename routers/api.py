@@ -0,0 +1,131 @@
+"""
+Kinetic - JSON data API for browser-side charts
+"""
+
+import gzip
+import json
+from datetime import datetime, timedelta
+from typing import Annotated, Optional
+import numpy as np
+from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Path, Query, Request, Response
+from starlette import status
+from models import Agents, Targets, Monitors
+from database import SessionLocal
+from tsdb import tsdb
+
+router = APIRouter(
+    prefix="/api",
+    tags=["api"]
+)
+
+def get_db():
+    """ Get database """
+    db = SessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+DBDependency = Annotated[Session, Depends(get_db)]
+
+# Fixed point scale of delta encoded values
+DELTA_SCALE = 1000
+
+def delta_encode(values: list[Optional[float]]) -> list[Optional[int]]:
+    """ Scale to integers and replace each value by its difference to the previous one, gaps stay null """
+    encoded, previous = [], 0
+    for value in values:
+        if value is None:
+            encoded.append(None)
+        else:
+            value = round(value * DELTA_SCALE)
+            encoded.append(value - previous)
+            previous = value
+    return encoded
+
+def column(values: np.ndarray, digits: int) -> list[Optional[float]]:
+    """ Rounded plain floats, NaN as null """
+    return [None if np.isnan(value) else value for value in np.round(values, digits).tolist()]
+
+@router.get("/monitors/{monitor_id}/series", status_code=status.HTTP_200_OK,
+    responses={
+        200: { "content": {
+            "application/json": {
+                "example": {
+                    "start": 1700000000,
+                    "step": 60,
+                    "rows": 3,
+                    "encoding": "plain",
+                    "columns": {
+                        "loss": [0.0, 5.0, None],
+                        "median": [3.21, 3.4, None],
+                        "min": [1.02, 1.1, None],
+                        "p25": [2.5, 2.61, None],
+                        "p75": [3.9, 4.02, None],
+                        "p95": [6.2, 7.11, None],
+                        "max": [7.05, 8.3, None]
+                        }
+                    }
+                }
+            }
+        },
+        404: { "content": {
+            "application/json": {
+                "example": {
+                    "detail": "Not Found"
+                    }
+                }
+            }
+        }
+    }
+)
+def read_monitor_series(request: Request, db: DBDependency,
+    monitor_id: str = Path(..., min_length=36, max_length=36, pattern="^[a-f0-9]{8}-?[a-f0-9]{4}-?4[a-f0-9]{3}-?[89ab][a-f0-9]{3}-?[a-f0-9]{12}$"),
+    start: Optional[int] = Query(None, description="Window start, epoch seconds, default 3 hours before end"),
+    end: Optional[int] = Query(None, description="Window end, epoch seconds, default now"),
+    width: int = Query(600, ge=10, le=4000, description="Chart width in pixels, the most rows returned"),
+    encoding: str = Query("plain", pattern="^(plain|delta)$", description="delta: integers in 1/1000 units, each the difference to the previous non-null value")):
+    """
+    Monitor time series for client side charts.
+
+    Loss (percent of the volley), median, and min/percentiles/max over the
+    individual results, one row per step of the time-series backend picked
+    so there are at most `width` rows. Columns share the time axis start + i * step. Sent
+    gzip-compressed when the client accepts it.
+    """
+    monitor = db.query(Monitors.pollcount, Monitors.agent_id).\
+        join(Agents, Agents.id == Monitors.agent_id).join(Targets, Targets.id == Monitors.target_id).\
+        filter(Monitors.id == monitor_id).filter(Monitors.is_active == True).\
+        filter(Agents.is_active == True).filter(Targets.is_active == True).first()
+    if not monitor:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND)
+
+    end = end or int(datetime.now().timestamp())
+    start = start or end - int(timedelta(hours=3).total_seconds())
+    if start >= end:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="start time is greater than end time")
+
+    series = tsdb.series(monitor.agent_id, monitor_id, monitor.pollcount, start, end, width)
+    if not series:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="no data for monitor_id")
+
+    # latencies in ms to the microsecond, loss to a tenth of a percent
+    columns = {name: column(values, 1 if name == "loss" else 3) for name, values in series["columns"].items()}
+    if encoding == "delta":
+        columns = {name: delta_encode(values) for name, values in columns.items()}
+
+    body = json.dumps({
+        "start": series["start"],
+        "step": series["step"],
+        "rows": series["rows"],
+        "encoding": encoding,
+        "scale": DELTA_SCALE if encoding == "delta" else 1,
+        "columns": columns
+    }, separators=(",", ":")).encode()
+
+    headers = {"Cache-Control": f"public, max-age={series['step']}", "Vary": "Accept-Encoding"}
+    if "gzip" in request.headers.get("Accept-Encoding", ""):
+        body = gzip.compress(body, 5)
+        headers["Content-Encoding"] = "gzip"
+    return Response(content=body, media_type="application/json", headers=headers)
@@ -5,12 +5,15 @@ Kinetic - Server Console
 from starlette import status
 from starlette.responses import RedirectResponse
 
-from typing import Annotated
+from typing import Annotated, Optional
 from sqlalchemy.orm import Session
-from fastapi import Depends, APIRouter, Request, HTTPException, Path
-from fastapi.responses import HTMLResponse
+from fastapi import Depends, APIRouter, Request, HTTPException, Path, Query
+from fastapi.responses import HTMLResponse, Response
 from models import Agents, Targets, Monitors
 from database import SessionLocal
+from streamstats import StreamStats
+from rrdcache import rrdcache
+from graphcache import graphcache
 from datetime import datetime
 from humanize import naturaldelta, naturaltime
 from fastapi.responses import HTMLResponse
@@ -18,13 +21,12 @@ from fastapi.templating import Jinja2Templates
 from dataclasses import dataclass
 
 from pathlib import Path as FSPath
-from random import randint
+from functools import lru_cache
+from colorsys import hsv_to_rgb
 from re import sub
 from hashlib import md5
-from base64 import b64encode, decode
-from rrdtool import graph
+from rrdtool import graphv
 from datetime import datetime, timedelta
-import tempfile
 
 router = APIRouter(
     prefix="/console",
@@ -90,19 +92,70 @@ class MonitorStats:
     average_stddev_color: str
     average_loss_color: str
 
+    # Long-run, from the incremental statistics state
+    percentile_50: Optional[float] = None
+    percentile_95: Optional[float] = None
+    percentile_99: Optional[float] = None
+    ewma_median: Optional[float] = None
+    sample_mean: Optional[float] = None
+    sample_stddev: Optional[float] = None
+
+# Overlay colors, in the order series are drawn; more series continue around the hue circle
+PALETTE = ("#0D6EFD", "#DC3545", "#198754", "#FD7E14", "#6F42C1", "#20C997", "#D63384", "#795548",
+    "#0DCAF0", "#FFC107", "#6C757D", "#3F51B5", "#8BC34A", "#E91E63", "#009688", "#FF5722")
+
+# Most series drawn in one overlay graph
+OVERLAY_MAX = 48
+
+def series_color(index: int, count: int) -> str:
+    """ Color of the index-th of count series, the same on every render """
+    if count == 1:
+        return "#FF0000"
+    if index < len(PALETTE):
+        return PALETTE[index]
+    # golden ratio steps keep neighbouring hues apart
+    r, g, b = hsv_to_rgb((index * 0.618033988749895) % 1, 0.75, 0.85)
+    return "#%02X%02X%02X" % (int(r * 255), int(g * 255), int(b * 255))
+
+@lru_cache(maxsize=64)
+def smoke_chain(polls: int) -> tuple[str, ...]:
+    """
+    DEF/CDEF chain of a smoke graph for one RRD file, built once per pollcount.
+
+    Every element is a format string taking {i} (series index) and {rrd}
+    (file path); the smoke graph fills them in for each file.
+
+    Args:
+        polls (int): Result data sources in the file
+    """
+    chain = ["DEF:median{i}={rrd}:median:AVERAGE", "DEF:loss{i}={rrd}:loss:AVERAGE"]
+    chain += [f"DEF:result{{i}}p{n}={{rrd}}:result{n}:AVERAGE" for n in range(1, polls + 1)]
+    chain.append(f"CDEF:ploss{{i}}=loss{{i}},{polls},/,100,*")
+    chain.append("CDEF:dm{i}=median{i},0,100000,LIMIT")
+    chain += [f"CDEF:p{{i}}p{n}=result{{i}}p{n},UN,0,result{{i}}p{n},IF" for n in range(1, polls + 1)]
+
+    # replies per row, their mean and standard deviation
+    chain.append(f"CDEF:results{{i}}={polls},p{{i}}p1,UN" + "".join(f",p{{i}}p{n},UN,+" for n in range(2, polls + 1)) + ",-")
+    chain.append("CDEF:m{i}=p{i}p1" + "".join(f",p{{i}}p{n},+" for n in range(2, polls + 1)) + ",results{i},/")
+    chain.append("CDEF:sdev{i}=p{i}p1,m{i},-,DUP,*" + "".join(f",p{{i}}p{n},m{{i}},-,DUP,*,+" for n in range(2, polls + 1)) + ",results{i},/,SQRT")
+
+    chain.append("CDEF:dmlow{i}=dm{i},sdev{i},2,/,-")
+    chain.append("CDEF:s2d{i}=sdev{i}")
+    return tuple(chain)
+
 # Class to generate RRD graphs
 class RRDGraph:
     def __init__() -> None: pass
 
-    def loss(rrds, polls, step, description, start_time, end_time):
-        png_file = tempfile.mktemp(suffix='.png', prefix='rrd_')
-
+    def loss(rrds, polls, step, description, start_time, end_time, width=600):
         rrd_files = []
     
         # for each agent/monitor
+        # [label, agent_id, monitor_id] or [label, agent_id, monitor_id, pollcount] for overlays of mixed pollcounts
         for rrd_temp in rrds:
-            rrd_file = [rrd_temp[0], "./data/" + md5((str(rrd_temp[1]) + "-" + str(rrd_temp[2])).encode()).hexdigest() + ".rrd"]
+            rrd_file = [rrd_temp[0], rrdcache.path(str(rrd_temp[1]), str(rrd_temp[2]))]
             if FSPath(rrd_file[1]).is_file():
+                rrd_file.append(rrdcache.width(rrd_file[1], rrd_temp[3] if len(rrd_temp) > 3 else polls))
                 rrd_files.append(rrd_file)
 
         if rrd_files:
@@ -117,7 +170,7 @@ class RRDGraph:
             rrd_graph_str.append("--height")
             rrd_graph_str.append("55")
             rrd_graph_str.append("--width")
-            rrd_graph_str.append("600")
+            rrd_graph_str.append(f"{width}")
             rrd_graph_str.append("--vertical-label")
             rrd_graph_str.append("Percent")
             rrd_graph_str.append("--color")
@@ -157,17 +210,14 @@ class RRDGraph:
             rrd_graph_str.append("0")
 
             for rrd_idx, rrd_file in enumerate(rrd_files, 0):
-                if len(rrd_files) > 1:
-                    rrd_color = lambda: randint(0, 255)
-                    rrd_color = '#%02X%02X%02X' % (rrd_color(),rrd_color(),rrd_color())
-                else:
-                    rrd_color = '#FF0000'
+                rrd_color = series_color(rrd_idx, len(rrd_files))
 
                 # If {rrd_file[0]} contains ':' replace with '\:'
                 rrd_file[0] = sub(r':', r'\\:', rrd_file[0])
 
+                # loss is counted out of the results the file holds
                 rrd_graph_str.append(f"DEF:loss{rrd_idx}={rrd_file[1]}:loss:LAST")
-                rrd_graph_str.append(f"CDEF:ploss{rrd_idx}=loss{rrd_idx},{polls},/,100,*")
+                rrd_graph_str.append(f"CDEF:ploss{rrd_idx}=loss{rrd_idx},{rrd_file[2]},/,100,*")
                 rrd_graph_str.append(f"LINE2:ploss{rrd_idx}{rrd_color}:{rrd_file[0]}\t")
                 rrd_graph_str.append(f"GPRINT:ploss{rrd_idx}:LAST:Current Loss\\: %5.1lf%%\\j")
 
@@ -181,27 +231,22 @@ class RRDGraph:
 
             #print("### rrd_graph_str ###\n", rrd_graph_str)
             
-            graph(png_file, rrd_graph_str)
-            png_output = "data:image/png;base64, "
-            with open(png_file, "rb") as image_file:
-                png_output += b64encode(image_file.read()).decode('UTF-8')
-            FSPath(png_file).unlink()
-            
-            return png_output
-
-    def smoke(rrds, polls, step, description, start_time, end_time):
-        png_file = tempfile.mktemp(suffix='.png', prefix='rrd_')
+            # write buffered results first so the graph is current
+            rrdcache.flush([rrd_file[1] for rrd_file in rrd_files])
+            # render to memory ("-" is stdout), no temp file
+            return graphv("-", rrd_graph_str)["image"]
 
+    def smoke(rrds, polls, step, description, start_time, end_time, width=600):
         rrd_files = []
     
         # for each agent/monitor
+        # [label, agent_id, monitor_id] or [label, agent_id, monitor_id, pollcount] for overlays of mixed pollcounts
         for rrd_temp in rrds:
-            rrd_file = [rrd_temp[0], "./data/" + md5((str(rrd_temp[1]) + "-" + str(rrd_temp[2])).encode()).hexdigest() + ".rrd"]
+            rrd_file = [rrd_temp[0], rrdcache.path(str(rrd_temp[1]), str(rrd_temp[2]))]
             if FSPath(rrd_file[1]).is_file():
+                rrd_file.append(rrdcache.width(rrd_file[1], rrd_temp[3] if len(rrd_temp) > 3 else polls))
                 rrd_files.append(rrd_file)
 
-        #rrd_files.append("./data/" + md5((str(rrds[0]) + "-" + str(rrds[1])).encode()).hexdigest() + ".rrd")
-
         if rrd_files:
             rrd_graph_str = []
 
@@ -214,7 +259,7 @@ class RRDGraph:
             rrd_graph_str.append("--height")
             rrd_graph_str.append("95")
             rrd_graph_str.append("--width")
-            rrd_graph_str.append("600")
+            rrd_graph_str.append(f"{width}")
             rrd_graph_str.append("--vertical-label")
             rrd_graph_str.append("Milliseconds")
             rrd_graph_str.append("--color")
@@ -249,49 +294,26 @@ class RRDGraph:
             rrd_graph_str.append("PNG")
             rrd_graph_str.append("--rigid")
 
+            overlay = len(rrd_files) > 1
             for rrd_idx, rrd_file in enumerate(rrd_files, 0):
-                if len(rrd_files) > 1:
-                    rrd_color = lambda: randint(0, 255)
-                    rrd_color = '#%02X%02X%02X' % (rrd_color(),rrd_color(),rrd_color())
-                else:
-                    rrd_color = '#FF0000'
+                rrd_color = series_color(rrd_idx, len(rrd_files))
 
                 # If {rrd_file[0]} contains ':' replace with '\:'
                 rrd_file[0] = sub(r':', r'\\:', rrd_file[0])
 
-                rrd_graph_str.append(f"DEF:median{rrd_idx}={rrd_file[1]}:median:AVERAGE")
-                rrd_graph_str.append(f"DEF:loss{rrd_idx}={rrd_file[1]}:loss:AVERAGE")
-                for result_num in range(1, polls+1):
-                    rrd_graph_str.append(f"DEF:result{rrd_idx}p{result_num}={rrd_file[1]}:result{result_num}:AVERAGE")
-
-                rrd_graph_str.append(f"CDEF:ploss{rrd_idx}=loss{rrd_idx},20,/,100,*")
-                rrd_graph_str.append(f"CDEF:dm{rrd_idx}=median{rrd_idx},0,100000,LIMIT")
-                for result_num in range(1, polls+1):
-                    rrd_graph_str.append(f"CDEF:p{rrd_idx}p{result_num}=result{rrd_idx}p{result_num},UN,0,result{rrd_idx}p{result_num},IF")
-
-                temp_str = f"CDEF:results{rrd_idx}={polls},p{rrd_idx}p1,UN"
-                for result_num in range(2, polls+1):
-                    temp_str += f",p{rrd_idx}p{result_num},UN,+"
-                temp_str += ",-"
-                rrd_graph_str.append(temp_str)
-                temp_str = None
-
-                temp_str = f"CDEF:m{rrd_idx}=p{rrd_idx}p1"
-                for result_num in range(2, polls+1):
-                    temp_str += f",p{rrd_idx}p{result_num},+"
-                temp_str += f",results{rrd_idx},/"
-                rrd_graph_str.append(temp_str)
-                temp_str = None
-
-                temp_str = f"CDEF:sdev{rrd_idx}=p{rrd_idx}p1,m{rrd_idx},-,DUP,*"
-                for result_num in range(2, polls+1):
-                    temp_str += f",p{rrd_idx}p{result_num},m{rrd_idx},-,DUP,*,+"
-                temp_str += f",results{rrd_idx},/,SQRT"
-                rrd_graph_str.append(temp_str)
-                temp_str = None
-
-                rrd_graph_str.append(f"CDEF:dmlow{rrd_idx}=dm{rrd_idx},sdev{rrd_idx},2,/,-")
-                rrd_graph_str.append(f"CDEF:s2d{rrd_idx}=sdev{rrd_idx}")
+                if overlay:
+                    # median line per series, two DEFs instead of one per result keeps dozens of series fast
+                    rrd_graph_str.append(f"DEF:median{rrd_idx}={rrd_file[1]}:median:AVERAGE")
+                    rrd_graph_str.append(f"DEF:loss{rrd_idx}={rrd_file[1]}:loss:AVERAGE")
+                    rrd_graph_str.append(f"CDEF:ploss{rrd_idx}=loss{rrd_idx},{rrd_file[2]},/,100,*")
+                    rrd_graph_str.append(f"CDEF:dm{rrd_idx}=median{rrd_idx},0,100000,LIMIT")
+                    rrd_graph_str.append(f"LINE1:dm{rrd_idx}{rrd_color}:{rrd_file[0]}\t")
+                    rrd_graph_str.append(f"VDEF:avmed{rrd_idx}=median{rrd_idx},AVERAGE")
+                    rrd_graph_str.append(f"GPRINT:avmed{rrd_idx}:RTT\\: %5.2lfms ")
+                    rrd_graph_str.append(f"GPRINT:ploss{rrd_idx}:AVERAGE:Loss\\: %5.1lf%%\\j")
+                    continue
+
+                rrd_graph_str.extend(part.format(i=rrd_idx, rrd=rrd_file[1]) for part in smoke_chain(rrd_file[2]))
                 rrd_graph_str.append(f"AREA:dmlow{rrd_idx}")
                 rrd_graph_str.append(f"AREA:s2d{rrd_idx}{rrd_color}30:STACK")
                 rrd_graph_str.append(f"LINE2:dm{rrd_idx}{rrd_color}:{rrd_file[0]}\t")
@@ -314,13 +336,10 @@ class RRDGraph:
 
             #print("### rrd_graph_str ###\n", rrd_graph_str)
             
-            graph(png_file, rrd_graph_str)
-            png_output = "data:image/png;base64, "
-            with open(png_file, "rb") as image_file:
-                png_output += b64encode(image_file.read()).decode('UTF-8')
-            FSPath(png_file).unlink()
-            
-            return png_output
+            # write buffered results first so the graph is current
+            rrdcache.flush([rrd_file[1] for rrd_file in rrd_files])
+            # render to memory ("-" is stdout), no temp file
+            return graphv("-", rrd_graph_str)["image"]
 
 # StatReport Function: console_agent and console_search
 def StatReport(db: DBDependency, monitors):
@@ -437,6 +456,19 @@ def StatReport(db: DBDependency, monitors):
             else:
                 average_loss_color = "bg-danger" #red
 
+            # long-run percentiles without touching the RRD history
+            stream = StreamStats.load(monitor.stats)
+            long_run = {}
+            if stream.samples:
+                long_run = {
+                    "percentile_50": round(stream.percentile(0.50), 2),
+                    "percentile_95": round(stream.percentile(0.95), 2),
+                    "percentile_99": round(stream.percentile(0.99), 2),
+                    "ewma_median": round(stream.ewma, 2),
+                    "sample_mean": round(stream.sample_mean, 2),
+                    "sample_stddev": round(stream.sample_stddev, 2)
+                }
+
             # create a MonitorStats object of the monitor
             monitor_stats.append(MonitorStats(
                 agent_id=monitor.agent_id,
@@ -467,7 +499,8 @@ def StatReport(db: DBDependency, monitors):
                 average_minimum_color=average_minimum_color,
                 average_maximum_color=average_maximum_color,
                 average_stddev_color=average_stddev_color,
-                average_loss_color=average_loss_color
+                average_loss_color=average_loss_color,
+                **long_run
             ))
 
             # append to context
@@ -478,7 +511,7 @@ def StatReport(db: DBDependency, monitors):
     return context
 
 @router.get("/", response_class=HTMLResponse)
-async def console_home(request: Request, db: DBDependency):
+def console_home(request: Request, db: DBDependency):
     """ Console - Home """
 
     # get a list of all agents where is_active is True
@@ -527,7 +560,7 @@ async def console_home(request: Request, db: DBDependency):
 
 @router.get("/agent/{agent_id}", response_class=HTMLResponse)
 # get agent_id from path and pass it to console_agent
-async def console_agent(request: Request, db: DBDependency, agent_id: str = Path(..., min_length=36, max_length=36, pattern="^[a-f0-9]{8}-?[a-f0-9]{4}-?4[a-f0-9]{3}-?[89ab][a-f0-9]{3}-?[a-f0-9]{12}$")):
+def console_agent(request: Request, db: DBDependency, agent_id: str = Path(..., min_length=36, max_length=36, pattern="^[a-f0-9]{8}-?[a-f0-9]{4}-?4[a-f0-9]{3}-?[89ab][a-f0-9]{3}-?[a-f0-9]{12}$")):
     """ Console - Monitors by Agent """
 
     # get agent from database by agent_id
@@ -551,13 +584,21 @@ async def console_agent(request: Request, db: DBDependency, agent_id: str = Path
             "agent": agent
         }
 
+        # every monitor of the agent in one graph over the last 3 hours
+        overlay = overlay_monitors(db, "agent", agent.id)
+        if len(overlay) > 1:
+            end = datetime.now().strftime("%Y-%m-%dT%H:%M")
+            start = (datetime.now() - timedelta(hours=3)).strftime("%Y-%m-%dT%H:%M")
+            step = max(monitor.pollinterval for monitor in overlay)
+            context["overlay"] = {kind: overlay_url("agent", agent.id, step, start, end, kind) for kind in GRAPHS}
+
         # append StatReport to context
         context.update(StatReport(db, monitor_match))
 
         return templates.TemplateResponse("stats.html", context=context)
 
 @router.get("/target/{target_id}", response_class=HTMLResponse)
-async def console_target(request: Request, db: DBDependency, target_id: str = Path(..., min_length=36, max_length=36, pattern="^[a-f0-9]{8}-?[a-f0-9]{4}-?4[a-f0-9]{3}-?[89ab][a-f0-9]{3}-?[a-f0-9]{12}$")):
+def console_target(request: Request, db: DBDependency, target_id: str = Path(..., min_length=36, max_length=36, pattern="^[a-f0-9]{8}-?[a-f0-9]{4}-?4[a-f0-9]{3}-?[89ab][a-f0-9]{3}-?[a-f0-9]{12}$")):
     """ Console - Monitors by target """
 
     # get target from database by target_id
@@ -580,13 +621,21 @@ async def console_target(request: Request, db: DBDependency, target_id: str = Pa
             "target": target
         }
 
+        # every monitor of the target in one graph over the last 3 hours
+        overlay = overlay_monitors(db, "target", target.id)
+        if len(overlay) > 1:
+            end = datetime.now().strftime("%Y-%m-%dT%H:%M")
+            start = (datetime.now() - timedelta(hours=3)).strftime("%Y-%m-%dT%H:%M")
+            step = max(monitor.pollinterval for monitor in overlay)
+            context["overlay"] = {kind: overlay_url("target", target.id, step, start, end, kind) for kind in GRAPHS}
+
         # append StatReport to context
         context.update(StatReport(db, monitor_match))
 
         return templates.TemplateResponse("stats.html", context=context)
 
 @router.get("/monitor/{monitor_id}", response_class=HTMLResponse)
-async def console_monitor(request: Request, db: DBDependency, monitor_id: str = Path(..., min_length=36, max_length=36, pattern="^[a-f0-9]{8}-?[a-f0-9]{4}-?4[a-f0-9]{3}-?[89ab][a-f0-9]{3}-?[a-f0-9]{12}$")):
+def console_monitor(request: Request, db: DBDependency, monitor_id: str = Path(..., min_length=36, max_length=36, pattern="^[a-f0-9]{8}-?[a-f0-9]{4}-?4[a-f0-9]{3}-?[89ab][a-f0-9]{3}-?[a-f0-9]{12}$")):
     """ Console - Monitor Graphs """
     # get monitor from database by monitor_id
     monitor = db.query(Monitors).filter(Monitors.id == monitor_id).first()
@@ -616,9 +665,6 @@ async def console_monitor(request: Request, db: DBDependency, monitor_id: str =
             if datetime.strptime(rrd_start, '%Y-%m-%dT%H:%M') > datetime.strptime(rrd_end, '%Y-%m-%dT%H:%M'):
                 raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"start time is greater than end time")
             else:
-                rrds = []
-                rrds.append([target.address, agent.id, monitor.id])
-
                 # Create context dictionary with monitor data
                 context = {
                     "request": request,
@@ -631,21 +677,20 @@ async def console_monitor(request: Request, db: DBDependency, monitor_id: str =
                     "end": rrd_end,
                     "timezone": request.app.server_timezone,
                     "graph": {
-                        "smoke": RRDGraph.smoke(rrds,
-                                            monitor.pollcount,
-                                            monitor.pollinterval,
-                                            f"{agent.name}: {monitor.description}",
-                                            datetime.strptime(rrd_start, '%Y-%m-%dT%H:%M').strftime("%s"),
-                                            datetime.strptime(rrd_end, '%Y-%m-%dT%H:%M').strftime("%s")),
-                        "loss": RRDGraph.loss(rrds,
-                                            monitor.pollcount,
-                                            monitor.pollinterval,
-                                            f"{agent.name}: {monitor.description}",
-                                            datetime.strptime(rrd_start, '%Y-%m-%dT%H:%M').strftime("%s"),
-                                            datetime.strptime(rrd_end, '%Y-%m-%dT%H:%M').strftime("%s"))
+                        "smoke": graph_url(monitor, "smoke", rrd_start, rrd_end),
+                        "loss": graph_url(monitor, "loss", rrd_start, rrd_end),
+                        "series": series_url(monitor, rrd_start, rrd_end)
                     }
                 }
 
+                # the same target seen from the other agents
+                peers = overlay_monitors(db, "target", target.id)
+                if len({peer.agent_id for peer in peers}) > 1:
+                    context["multi"] = {
+                        "graph": overlay_url("target", target.id, max(peer.pollinterval for peer in peers), rrd_start, rrd_end),
+                        "link": f"/console/target/{target.id}"
+                    }
+
                 # Append the stats to the context for the monitor
                 context.update(StatReport(db, [monitor_id]))
 
@@ -654,8 +699,131 @@ async def console_monitor(request: Request, db: DBDependency, monitor_id: str =
     # Default raise HTTPException with 404 status code
     raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"monitor_id not found")
 
+def graph_url(monitor: Monitors, kind: str, start: str, end: str) -> str:
+    """ URL of a cached graph, the window rounded to the monitor's step so viewers share renders """
+    step = monitor.pollinterval
+    start = int(datetime.strptime(start, '%Y-%m-%dT%H:%M').timestamp()) // step * step
+    end = int(datetime.strptime(end, '%Y-%m-%dT%H:%M').timestamp()) // step * step
+    return f"/console/graph/{monitor.id}/{kind}.png?start={start}&end={end}"
+
+def series_url(monitor: Monitors, start: str, end: str, width: int = 690) -> str:
+    """ URL of the JSON series the monitor page charts in the browser """
+    start = int(datetime.strptime(start, '%Y-%m-%dT%H:%M').timestamp())
+    end = int(datetime.strptime(end, '%Y-%m-%dT%H:%M').timestamp())
+    return f"/api/monitors/{monitor.id}/series?start={start}&end={end}&width={width}&encoding=delta"
+
+# Graph kinds served by console_graph
+GRAPHS = {"smoke": RRDGraph.smoke, "loss": RRDGraph.loss}
+
+def graph_ttl(end: int, step: int) -> Optional[int]:
+    """ How long a render of a window ending at end stays valid, None once the window is complete """
+    return None if end + 2 * step <= datetime.now().timestamp() else step
+
+def graph_max_age(expires: Optional[float]) -> int:
+    """ Cache-Control max-age of a cached render, long only for renders of a window that was already complete """
+    return 86400 if expires is None else max(1, int(expires - datetime.now().timestamp()))
+
+@router.get("/graph/{monitor_id}/{kind}.png", response_class=Response,
+    responses={200: {"content": {"image/png": {}}}, 304: {"description": "Not Modified"}})
+def console_graph(request: Request, db: DBDependency,
+    monitor_id: str = Path(..., min_length=36, max_length=36, pattern="^[a-f0-9]{8}-?[a-f0-9]{4}-?4[a-f0-9]{3}-?[89ab][a-f0-9]{3}-?[a-f0-9]{12}$"),
+    kind: str = Path(..., pattern="^(smoke|loss)$"),
+    start: int = Query(..., description="Window start, epoch seconds"),
+    end: int = Query(..., description="Window end, epoch seconds"),
+    width: int = Query(600, ge=200, le=2000, description="Graph width in pixels")):
+    """ Console - Monitor graph image, rendered once per window and step for every viewer """
+
+    # monitor with its agent and target, all active
+    monitor = db.query(Monitors.pollcount, Monitors.pollinterval, Monitors.description, Agents.id.label("agent_id"), Agents.name, Targets.address).\
+        join(Agents, Agents.id == Monitors.agent_id).join(Targets, Targets.id == Monitors.target_id).\
+        filter(Monitors.id == monitor_id).filter(Monitors.is_active == True).\
+        filter(Agents.is_active == True).filter(Targets.is_active == True).first()
+    if not monitor:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"monitor_id not found")
+
+    # round the window to the RRD step, every URL for the same step shares one render
+    step = monitor.pollinterval
+    start, end = start // step * step, end // step * step
+    if start >= end:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"start time is greater than end time")
+
+    # a window that ended a full volley ago never changes (RRD completes the last step with the next update),
+    # a current one is rendered again after a step
+    graph = graphcache.get((monitor_id, kind, start, end, width), lambda: GRAPHS[kind]([[monitor.address, monitor.agent_id, monitor_id]],
+        monitor.pollcount, step, f"{monitor.name}: {monitor.description}", start, end, width), graph_ttl(end, step))
+    if not graph:
+        # no RRD file yet
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"no data for monitor_id")
+    png, etag, expires = graph
+
+    headers = {"ETag": etag, "Cache-Control": f"public, max-age={graph_max_age(expires)}"}
+    if etag in [tag.strip() for tag in request.headers.get("If-None-Match", "").split(",")]:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return Response(content=png, media_type="image/png", headers=headers)
+
+def overlay_monitors(db: Session, view: str, object_id: str) -> list:
+    """
+    Active monitors of an overlay view, in a stable order so every render gets the same colors.
+
+    Args:
+        view (str): "target" for one target from every agent, "agent" for every target of one agent
+        object_id (str): Target or agent id
+    """
+    monitors = db.query(Monitors.id, Monitors.pollcount, Monitors.pollinterval, Monitors.description,
+        Agents.id.label("agent_id"), Agents.name, Targets.address).\
+        join(Agents, Agents.id == Monitors.agent_id).join(Targets, Targets.id == Monitors.target_id).\
+        filter((Monitors.target_id if view == "target" else Monitors.agent_id) == object_id).\
+        filter(Monitors.is_active == True).filter(Agents.is_active == True).filter(Targets.is_active == True).all()
+    return sorted(monitors, key=lambda monitor: (overlay_label(view, monitor), monitor.id))[:OVERLAY_MAX]
+
+def overlay_label(view: str, monitor) -> str:
+    """ Legend of a series: the agent when comparing agents, the target when comparing targets """
+    return f"{monitor.name} {monitor.description}" if view == "target" else f"{monitor.address} {monitor.description}"
+
+def overlay_url(view: str, object_id: str, step: int, start: str, end: str, kind: str = "smoke") -> str:
+    """ URL of a cached overlay graph, the window rounded to the largest step of its monitors """
+    start = int(datetime.strptime(start, '%Y-%m-%dT%H:%M').timestamp()) // step * step
+    end = int(datetime.strptime(end, '%Y-%m-%dT%H:%M').timestamp()) // step * step
+    return f"/console/overlay/{view}/{object_id}/{kind}.png?start={start}&end={end}"
+
+@router.get("/overlay/{view}/{object_id}/{kind}.png", response_class=Response,
+    responses={200: {"content": {"image/png": {}}}, 304: {"description": "Not Modified"}})
+def console_overlay(request: Request, db: DBDependency,
+    view: str = Path(..., pattern="^(agent|target)$"),
+    object_id: str = Path(..., min_length=36, max_length=36, pattern="^[a-f0-9]{8}-?[a-f0-9]{4}-?4[a-f0-9]{3}-?[89ab][a-f0-9]{3}-?[a-f0-9]{12}$"),
+    kind: str = Path(..., pattern="^(smoke|loss)$"),
+    start: int = Query(..., description="Window start, epoch seconds"),
+    end: int = Query(..., description="Window end, epoch seconds"),
+    width: int = Query(600, ge=200, le=2000, description="Graph width in pixels")):
+    """ Console - One target from every agent, or every target of one agent, in one graph """
+
+    monitors = overlay_monitors(db, view, object_id)
+    if not monitors:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"{view}_id not found")
+
+    # round the window to the slowest monitor's step, every URL for the same step shares one render
+    step = max(monitor.pollinterval for monitor in monitors)
+    start, end = start // step * step, end // step * step
+    if start >= end:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"start time is greater than end time")
+
+    # the monitor list is part of the key, adding or removing one renders anew
+    rrds = [[overlay_label(view, monitor), monitor.agent_id, monitor.id, monitor.pollcount] for monitor in monitors]
+    description = f"Agent: {monitors[0].name}" if view == "agent" else f"Target: {monitors[0].address}"
+    graph = graphcache.get((f"{view}/{object_id}", kind, start, end, width, tuple(monitor.id for monitor in monitors)),
+        lambda: GRAPHS[kind](rrds, max(monitor.pollcount for monitor in monitors), step, description, start, end, width),
+        graph_ttl(end, step))
+    if not graph:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"no data for {view}_id")
+    png, etag, expires = graph
+
+    headers = {"ETag": etag, "Cache-Control": f"public, max-age={graph_max_age(expires)}"}
+    if etag in [tag.strip() for tag in request.headers.get("If-None-Match", "").split(",")]:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return Response(content=png, media_type="image/png", headers=headers)
+
 @router.get("/down", response_class=HTMLResponse)
-async def console_down(request: Request, db: DBDependency):
+def console_down(request: Request, db: DBDependency):
     """ Console - Down Monitors """
 
     # get all monitors where is_active is True
@@ -680,7 +848,7 @@ async def console_down(request: Request, db: DBDependency):
     return templates.TemplateResponse("stats.html", context=context)
 
 @router.get("/latency", response_class=HTMLResponse)
-async def console_latency(request: Request, db: DBDependency):
+def console_latency(request: Request, db: DBDependency):
     """ Console - Latency Monitors """
 
     # get all monitors where is_active is True
@@ -704,7 +872,7 @@ async def console_latency(request: Request, db: DBDependency):
     return templates.TemplateResponse("stats.html", context=context)
 
 @router.get("/loss", response_class=HTMLResponse)
-async def console_loss(request: Request, db: DBDependency):
+def console_loss(request: Request, db: DBDependency):
     """ Console - Loss Monitors """
 
     # get all monitors where is_active is True
@@ -729,7 +897,7 @@ async def console_loss(request: Request, db: DBDependency):
     return templates.TemplateResponse("stats.html", context=context)
 
 @router.get("/search", response_class=HTMLResponse)
-async def console_search(request: Request, db: DBDependency):
+def console_search(request: Request, db: DBDependency):
     """ Console - Search monitors by target, agent or monitor description """
 
     # get search query from query parameters
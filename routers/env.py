@@ -10,6 +10,7 @@ from fastapi.encoders import jsonable_encoder
 from starlette import status
 from models import Env
 from database import SessionLocal
+from notify import notifier
 
 router = APIRouter(
     prefix="/env",
@@ -21,6 +22,8 @@ allowed_keys = [
     "NOTIFY_EMAIL", # email to send notifications to
     "NOTIFY_ENABLED", # enable/disable notifications
     "NOTIFY_PERIOD", # notification period in seconds
+    "ALERT_LATENCY", # alert when the median latency rises above this many ms
+    "ALERT_LOSS", # alert when the loss of a volley reaches this percentage
     "SMTP_SERVER", # smtp server to use
     "SMTP_PORT", # smtp port to use
     "SMTP_USERNAME", # smtp username to use
@@ -60,7 +63,7 @@ class EnvModel(BaseModel):
         204: {"description": "No Content"}
     }
 )
-async def read_env_all(db: DBDependency):
+def read_env_all(db: DBDependency):
     """ Get all environment keys """
     env = db.query(Env).all()
     if not env:
@@ -84,7 +87,7 @@ async def read_env_all(db: DBDependency):
         400: {"description": "Environment key already exists"}
     }
 )
-async def create_env(db: DBDependency, body: EnvModel):
+def create_env(db: DBDependency, body: EnvModel):
     """ Create an allowed environment key value pair """
 
     # check if environment key already exists
@@ -97,6 +100,7 @@ async def create_env(db: DBDependency, body: EnvModel):
     db.add(env)
     db.commit()
     db.refresh(env)
+    notifier.invalidate()
     return {"detail": "Created"}
 
 @router.get("/{key}", status_code=status.HTTP_200_OK,
@@ -116,7 +120,7 @@ async def create_env(db: DBDependency, body: EnvModel):
         204: {"description": "No Content"}
     }
 )
-async def read_env(db: DBDependency, key: str = Path(..., description="Environment variable name")):
+def read_env(db: DBDependency, key: str = Path(..., description="Environment variable name")):
     """ Get an environment key value pair """
     env = db.query(Env).filter(Env.key == key).first()
     if not env:
@@ -140,13 +144,14 @@ async def read_env(db: DBDependency, key: str = Path(..., description="Environme
         204: {"description": "No Content"}
     }
 )
-async def update_env(db: DBDependency, key: str = Path(..., description="Environment key name"), body: EnvModel = None):
+def update_env(db: DBDependency, key: str = Path(..., description="Environment key name"), body: EnvModel = None):
     """ Update an environment key value pair """
     env = db.query(Env).filter(Env.key == key).first()
     if not env:
         raise HTTPException(status_code=204, detail="No Content")
     env.value = body.value
     db.commit()
+    notifier.invalidate()
     return {"detail": "Updated"}
 
 @router.delete("/{key}", status_code=status.HTTP_200_OK,
@@ -166,11 +171,12 @@ async def update_env(db: DBDependency, key: str = Path(..., description="Environ
         204: {"description": "No Content"}
     }
 )
-async def delete_env(db: DBDependency, key: str = Path(..., description="Environment key name")):
+def delete_env(db: DBDependency, key: str = Path(..., description="Environment key name")):
     """ Delete an environment key """
     env = db.query(Env).filter(Env.key == key).first()
     if not env:
         raise HTTPException(status_code=204, detail="No Content")
     db.delete(env)
     db.commit()
+    notifier.invalidate()
     return {"detail": "Deleted"}
\ No newline at end of file
@@ -2,8 +2,6 @@
 Kinetic - CRUD operations for monitors db table
 """
 
-from os import remove
-from hashlib import md5
 from datetime import datetime
 from typing import Annotated, Optional
 from pydantic import BaseModel, Field, field_validator
@@ -13,6 +11,8 @@ from fastapi.encoders import jsonable_encoder
 from starlette import status
 from models import Agents, Targets, Monitors
 from database import SessionLocal
+from jobcache import jobcache
+from tsdb import tsdb
 from uuid import uuid4 as UUID
 
 router = APIRouter(
@@ -119,7 +119,7 @@ class MonitorUpdateModel(BaseModel):
         }
     }
 )
-async def read_monitor_all(db: DBDependency):
+def read_monitor_all(db: DBDependency):
     """ Get all monitors """
 
     # Check the number of monitors in the database
@@ -169,7 +169,7 @@ async def read_monitor_all(db: DBDependency):
         }},
     }
 )
-async def read_monitor_id(db: DBDependency, monitor_id: str = Path(..., min_length=36, max_length=36, pattern="^[a-f0-9]{8}-?[a-f0-9]{4}-?4[a-f0-9]{3}-?[89ab][a-f0-9]{3}-?[a-f0-9]{12}$")):
+def read_monitor_id(db: DBDependency, monitor_id: str = Path(..., min_length=36, max_length=36, pattern="^[a-f0-9]{8}-?[a-f0-9]{4}-?4[a-f0-9]{3}-?[89ab][a-f0-9]{3}-?[a-f0-9]{12}$")):
     """ Get a monitor by ID """
 
     # Get monitor from database
@@ -218,7 +218,7 @@ async def read_monitor_id(db: DBDependency, monitor_id: str = Path(..., min_leng
         }},
     }
 )
-async def read_monitor_by_agent_id(db: DBDependency, agent_id: str = Path(..., min_length=36, max_length=36, pattern="^[a-f0-9]{8}-?[a-f0-9]{4}-?4[a-f0-9]{3}-?[89ab][a-f0-9]{3}-?[a-f0-9]{12}$")):
+def read_monitor_by_agent_id(db: DBDependency, agent_id: str = Path(..., min_length=36, max_length=36, pattern="^[a-f0-9]{8}-?[a-f0-9]{4}-?4[a-f0-9]{3}-?[89ab][a-f0-9]{3}-?[a-f0-9]{12}$")):
     """ Get all monitors by agent ID """
 
     # Get agent from database
@@ -275,7 +275,7 @@ async def read_monitor_by_agent_id(db: DBDependency, agent_id: str = Path(..., m
         }},
     }
 )
-async def read_monitor_by_target_id(db: DBDependency, target_id: str = Path(..., min_length=36, max_length=36, pattern="^[a-f0-9]{8}-?[a-f0-9]{4}-?4[a-f0-9]{3}-?[89ab][a-f0-9]{3}-?[a-f0-9]{12}$")):
+def read_monitor_by_target_id(db: DBDependency, target_id: str = Path(..., min_length=36, max_length=36, pattern="^[a-f0-9]{8}-?[a-f0-9]{4}-?4[a-f0-9]{3}-?[89ab][a-f0-9]{3}-?[a-f0-9]{12}$")):
     """ Get all monitors by target ID """
 
     # Get target from database
@@ -353,7 +353,7 @@ async def read_monitor_by_target_id(db: DBDependency, target_id: str = Path(...,
         }},
     }
 )
-async def create_monitor_id(db: DBDependency, monitor: MonitorModel):
+def create_monitor_id(db: DBDependency, monitor: MonitorModel):
     """ Create a monitor """
 
     # Get agent from database
@@ -394,6 +394,7 @@ async def create_monitor_id(db: DBDependency, monitor: MonitorModel):
     db.add(db_monitor)
     db.commit()
     db.refresh(db_monitor)
+    jobcache.invalidate(db_monitor.agent_id)
 
     # Return only certain fields
     return {
@@ -426,7 +427,7 @@ async def create_monitor_id(db: DBDependency, monitor: MonitorModel):
         }},
     }
 )
-async def update_monitor_id(db: DBDependency, monitor: MonitorUpdateModel, monitor_id: str = Path(..., min_length=36, max_length=36, pattern="^[a-f0-9]{8}-?[a-f0-9]{4}-?4[a-f0-9]{3}-?[89ab][a-f0-9]{3}-?[a-f0-9]{12}$")):
+def update_monitor_id(db: DBDependency, monitor: MonitorUpdateModel, monitor_id: str = Path(..., min_length=36, max_length=36, pattern="^[a-f0-9]{8}-?[a-f0-9]{4}-?4[a-f0-9]{3}-?[89ab][a-f0-9]{3}-?[a-f0-9]{12}$")):
     """ Update a monitor description and is_active and return updated monitor """
 
     # Get monitor from database
@@ -441,6 +442,7 @@ async def update_monitor_id(db: DBDependency, monitor: MonitorUpdateModel, monit
     db_monitor.is_active = monitor.is_active
     db.commit()
     db.refresh(db_monitor)
+    jobcache.invalidate(db_monitor.agent_id)
 
     # Return only certain fields
     return {
@@ -462,7 +464,7 @@ async def update_monitor_id(db: DBDependency, monitor: MonitorUpdateModel, monit
         }}
     }
 )
-async def clear_monitor_stats(db: DBDependency, monitor_id: str = Path(..., min_length=36, max_length=36, pattern="^[a-f0-9]{8}-?[a-f0-9]{4}-?4[a-f0-9]{3}-?[89ab][a-f0-9]{3}-?[a-f0-9]{12}$")):
+def clear_monitor_stats(db: DBDependency, monitor_id: str = Path(..., min_length=36, max_length=36, pattern="^[a-f0-9]{8}-?[a-f0-9]{4}-?4[a-f0-9]{3}-?[89ab][a-f0-9]{3}-?[a-f0-9]{12}$")):
     """ Clear monitor stats by ID """
 
     # Get monitor from database
@@ -477,6 +479,9 @@ async def clear_monitor_stats(db: DBDependency, monitor_id: str = Path(..., min_
         if field.name in ("sample", "avg_loss", "avg_median", "avg_min", "avg_max", "avg_stddev", "total_down"):
             setattr(db_monitor, field.name, 0)
 
+    # Drop the incremental statistics state
+    db_monitor.stats = None
+
     # Update last_clear to current time
     db_monitor.last_clear = datetime.now()
 
@@ -501,7 +506,7 @@ async def clear_monitor_stats(db: DBDependency, monitor_id: str = Path(..., min_
         }}
     }
 )
-async def delete_monitor_id(db: DBDependency, monitor_id: str = Path(..., min_length=36, max_length=36, pattern="^[a-f0-9]{8}-?[a-f0-9]{4}-?4[a-f0-9]{3}-?[89ab][a-f0-9]{3}-?[a-f0-9]{12}$")):
+def delete_monitor_id(db: DBDependency, monitor_id: str = Path(..., min_length=36, max_length=36, pattern="^[a-f0-9]{8}-?[a-f0-9]{4}-?4[a-f0-9]{3}-?[89ab][a-f0-9]{3}-?[a-f0-9]{12}$")):
     """ Delete a monitor by ID """
 
     # Get monitor from database
@@ -514,14 +519,10 @@ async def delete_monitor_id(db: DBDependency, monitor_id: str = Path(..., min_le
     # Delete monitor from database
     db.delete(monitor)
     db.commit()
+    jobcache.invalidate(monitor.agent_id)
 
-    # delete the rrd file
-    rrd_file = "./data/" + md5((str(monitor.agent_id) + "-" + str(monitor_id)).encode()).hexdigest() + ".rrd"
-    # check if file exists if so delete it
-    try:
-        remove(rrd_file)
-    except OSError:
-        pass
+    # delete the monitor's history
+    tsdb.delete(str(monitor.agent_id), str(monitor_id))
 
     # Return 204 if monitor deleted
     return {"detail": "No Content"}
\ No newline at end of file
@@ -10,6 +10,7 @@ from fastapi.encoders import jsonable_encoder
 from starlette import status
 from models import Targets
 from database import SessionLocal
+from jobcache import jobcache
 from uuid import uuid4 as UUID
 
 router = APIRouter(
@@ -57,7 +58,7 @@ class TargetModel(BaseModel):
         }
     }
 )
-async def read_target_all(db: DBDependency):
+def read_target_all(db: DBDependency):
     """ Get all targets """
     # Check the number of targets in the database
     count = db.query(Targets).count()
@@ -88,7 +89,7 @@ async def read_target_all(db: DBDependency):
         }
     }
 )
-async def read_target_id(db: DBDependency, target_id: str = Path(..., min_length=36, max_length=36, pattern="^[a-f0-9]{8}-?[a-f0-9]{4}-?4[a-f0-9]{3}-?[89ab][a-f0-9]{3}-?[a-f0-9]{12}$")):
+def read_target_id(db: DBDependency, target_id: str = Path(..., min_length=36, max_length=36, pattern="^[a-f0-9]{8}-?[a-f0-9]{4}-?4[a-f0-9]{3}-?[89ab][a-f0-9]{3}-?[a-f0-9]{12}$")):
     """ Get target by id """
     target = db.query(Targets).filter(Targets.id == target_id).first()
     if not target:
@@ -110,7 +111,7 @@ async def read_target_id(db: DBDependency, target_id: str = Path(..., min_length
         }
     }
 )
-async def create_target_id(db: DBDependency, target: TargetModel):
+def create_target_id(db: DBDependency, target: TargetModel):
     """ Create a target """
 
     # Check if target already exists from post data
@@ -155,7 +156,7 @@ async def create_target_id(db: DBDependency, target: TargetModel):
         }
     }
 )
-async def update_target_id(db: DBDependency, target: TargetModel, target_id: str = Path(..., min_length=36, max_length=36, pattern="^[a-f0-9]{8}-?[a-f0-9]{4}-?4[a-f0-9]{3}-?[89ab][a-f0-9]{3}-?[a-f0-9]{12}$")):
+def update_target_id(db: DBDependency, target: TargetModel, target_id: str = Path(..., min_length=36, max_length=36, pattern="^[a-f0-9]{8}-?[a-f0-9]{4}-?4[a-f0-9]{3}-?[89ab][a-f0-9]{3}-?[a-f0-9]{12}$")):
     """ Update a target """
     db_target = db.query(Targets).filter(Targets.id == target_id).first()
     if not db_target:
@@ -166,6 +167,9 @@ async def update_target_id(db: DBDependency, target: TargetModel, target_id: str
         db_target.is_active = target.is_active
         db.commit()
         db.refresh(db_target)
+
+        # every agent monitoring the target has its address in its job list
+        jobcache.invalidate()
     return db_target
 
 @router.delete("/{target_id}", status_code=status.HTTP_204_NO_CONTENT,
@@ -182,19 +186,20 @@ async def update_target_id(db: DBDependency, target: TargetModel, target_id: str
         }}
     }
 )
-async def delete_target_id(db: DBDependency, target_id: str = Path(..., min_length=36, max_length=36, pattern="^[a-f0-9]{8}-?[a-f0-9]{4}-?4[a-f0-9]{3}-?[89ab][a-f0-9]{3}-?[a-f0-9]{12}$")):
+def delete_target_id(db: DBDependency, target_id: str = Path(..., min_length=36, max_length=36, pattern="^[a-f0-9]{8}-?[a-f0-9]{4}-?4[a-f0-9]{3}-?[89ab][a-f0-9]{3}-?[a-f0-9]{12}$")):
     """ Delete a target """
     db_target = db.query(Targets).filter(Targets.id == target_id).first()
     if not db_target:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Target not found")
     db.delete(db_target)
     db.commit()
+    jobcache.invalidate()
 
     # Return 204 if monitor deleted
     return {"detail": "No Content"}
 
 @router.get("/address/{address}", status_code=status.HTTP_200_OK, summary="Get a single target by address")
-async def read_target_address(db: DBDependency, address: str = Path(..., min_length=7, max_length=45)):
+def read_target_address(db: DBDependency, address: str = Path(..., min_length=7, max_length=45)):
     """ Get target by address """
 
     # raise an error if address fails IPvAnyAddress validation
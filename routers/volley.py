@@ -2,25 +2,31 @@
 Kinetic - Operations for monitor jobs + reporting
 """
 
-from os import path, makedirs
-from hashlib import md5
-from datetime import datetime, timedelta
+from os import makedirs
+from datetime import datetime
 from typing import Annotated, Optional, Union
 from pydantic import BaseModel, Field, field_validator
+from sqlalchemy import update as sql_update
 from sqlalchemy.orm import Session
-from fastapi import APIRouter, Depends, HTTPException, Path, Request
+from fastapi import APIRouter, Depends, HTTPException, Path, Query, Request, Response
 from fastapi.responses import PlainTextResponse
 from fastapi.templating import Jinja2Templates
-from fastapi.encoders import jsonable_encoder
+from fastapi.concurrency import run_in_threadpool
 from starlette import status
-from models import Agents, Targets, Monitors, Env
+from models import Agents, Targets, Monitors
 from database import SessionLocal
-from rrdtool import update, create
 from json import loads as json_loads
-from humanize import naturaldelta, naturaltime
-from email.mime.multipart import MIMEMultipart
-from email.mime.text import MIMEText
-import smtplib
+from uuid import UUID
+from math import isnan, isinf
+import struct
+import logging
+from ingest import IngestQueue
+from jobcache import jobcache
+from tsdb import tsdb
+from notify import notifier
+from alerts import alerts, transitions
+from streamstats import StreamStats, load_states, dump_states, update_states, volley_matrix
+import numpy as np
 
 router = APIRouter(
     prefix="/volley",
@@ -38,12 +44,7 @@ def get_db():
 
 DBDependency = Annotated[Session, Depends(get_db)]
 templates = Jinja2Templates(directory="templates")
-
-def update_or_create_env_var(env_var, key, value):
-    if env_var:
-        env_var.value = value
-    else:
-        return Env(key=key, value=value)
+logger = logging.getLogger(__name__)
 
 # JobSubmissionModel for submitting job results
 class JobSubmissionModel(BaseModel):
@@ -72,10 +73,45 @@ class JobSubmissionModel(BaseModel):
                 raise ValueError("results must be a list of floats or 'U'")
         return v
 
+# Compact binary submission format advertised to agents on GET /volley/{agent_id}
+VOLLEY_FORMAT = "application/x-kinetic-volley"
+
+def decode_volley_results(body: bytes):
+    """
+    Decode a compact binary volley submission.
+
+    Per monitor: 16 byte monitor UUID, 1 byte result count (1-35), then that
+    many big-endian float32 latencies with NaN for "U". The layout is checked
+    once per record instead of validating every float through pydantic.
+
+    Returns:
+        list[dict]: [{"id": str, "results": list[Union[float, str]]}, ...]
+    """
+    results = []
+    offset = 0
+    while offset < len(body):
+        if len(body) < offset + 17:
+            raise ValueError("truncated submission")
+        count = body[offset + 16]
+        if count < 1 or count > 35:
+            raise ValueError("results must be between 1 and 35 items")
+        end = offset + 17 + count * 4
+        if len(body) < end:
+            raise ValueError("truncated submission")
+        latencies = struct.unpack_from(f"!{count}f", body, offset + 17)
+        if any(isinf(latency) for latency in latencies):
+            raise ValueError("results must be a list of floats or 'U'")
+        results.append({
+            "id": str(UUID(bytes=body[offset:offset + 16])),
+            "results": ["U" if isnan(latency) else round(latency, 2) for latency in latencies]
+        })
+        offset = end
+    return results
+
 # RRDHandler model for creating/updating RRD files
 class RRDHandler(BaseModel):
     """
-    Model for creating/updating RRD files.
+    Model for creating/updating RRD files, written through the time-series backend.
 
     Attributes:
         agent_id (str): ID of the agent
@@ -87,6 +123,7 @@ class RRDHandler(BaseModel):
     monitor_id: str = Field(..., pattern="^[0-9a-f]{8}-([0-9a-f]{4}-){3}[0-9a-f]{12}$", description="Monitor job id")
     step: int = Field(..., gt=0, le=3600, description="RRD step in seconds")
     results: list[Union[float, str]] = Field(..., description="List of latency results")
+    timestamp: Optional[int] = Field(None, description="Update time in epoch seconds, now if not set")
 
     @field_validator("results")
     def check_results(cls, v):
@@ -100,209 +137,181 @@ class RRDHandler(BaseModel):
         return v
 
     def __init__(self, **data):
-        """ Create/update RRD file """
+        """ Hand the update to the time-series backend """
         super().__init__(**data)
-        agent_id = self.agent_id
-        monitor_id = self.monitor_id
-        step = self.step
-        results = self.results
-        rrd_file = "./data/" + md5((str(agent_id) + "-" + str(monitor_id)).encode()).hexdigest() + ".rrd"
+        tsdb.append([(self.agent_id, self.monitor_id, self.step, self.results, self.timestamp)])
 
-        #print(f"agent_id: {agent_id}\nmonitor_id: {monitor_id}\nstep: {step}\nresults: {results}\nrrd_file: {rrd_file}")
+# Monitor columns read and written by volley_statistics
+MONITOR_STAT_COLUMNS = (Monitors.id, Monitors.sample, Monitors.pollcount, Monitors.pollinterval,
+    Monitors.current_loss, Monitors.current_median, Monitors.current_min, Monitors.current_max, Monitors.current_stddev,
+    Monitors.avg_loss, Monitors.avg_median, Monitors.avg_min, Monitors.avg_max, Monitors.avg_stddev,
+    Monitors.prev_loss, Monitors.last_down, Monitors.total_down, Monitors.stats)
 
-        # check if rrd file exists
-        if path.exists(rrd_file):
-            RRDHandler.rrd_update(agent_id=agent_id, results=results, rrd_file=rrd_file)
-        else:
-            RRDHandler.rrd_create(agent_id, step=step, results=results, rrd_file=rrd_file)
-
-    def rrd_create(agent_id: int, step: int, results: list[Union[float, str]], rrd_file: str):
-        """
-        Kinetic - Create RRD file with Kinetic results.
-
-        Args:
-            agent_id (str): ID of the agent
-            results (list[int]): List of latency results
-            rrd_file (str): Path to RRD file
-            step (int): RRD step in seconds
-        """
-
-        rrd = []
-        rrd.append(rrd_file)
-        rrd.append("--start")
-        rrd.append("now-2h")
-        rrd.append("--step")
-        rrd.append(f"{step}")
-        rrd.append(f"DS:loss:GAUGE:{step*2}:0:{len(results)}")
-        rrd.append(f"DS:median:GAUGE:{step*2}:0:180")
-        for i in range(1, len(results)+1):
-            rrd.append(f"DS:result{i}:GAUGE:{step*2}:0:180")
-        rrd.append("RRA:AVERAGE:0.5:1:1008")
-        rrd.append("RRA:AVERAGE:0.5:12:4320")
-        rrd.append("RRA:MIN:0.5:12:4320")
-        rrd.append("RRA:MAX:0.5:12:4320")
-        rrd.append("RRA:AVERAGE:0.5:144:720")
-        rrd.append("RRA:MAX:0.5:144:720")
-        rrd.append("RRA:MIN:0.5:144:720")
-
-        # create RRD file
-        create(rrd)
-
-    def rrd_update(agent_id: int, results: list[Union[float, str]], rrd_file: str):
-        """
-        Kinetic - Update RRD file with Kinetic results.
-        
-        Args:
-            agent_id (str): ID of the agent
-            results (list[int]): List of latency results
-            rrd_file (str): Path to RRD file
-        """
-        rrd = []
-        rrd.append(rrd_file)
-        rrd.append("--template")
-
-        rrd_names = "loss:median"
-
-        # calculate loss and median
-        rrd_loss = 0
-        rrd_median = 0
-        for i in results:
-            if i == "U":
-                rrd_loss += 1
-            else:
-                rrd_median += i
-        rrd_median = round(rrd_median / len(results), 3)
-
-        rrd_vals = f"N:{rrd_loss}:{rrd_median}"
-
-        # individual results
-        for i in range(1, len(results)+1):
-            rrd_names += f":result{i}"
-            if results[i-1] is None:
-                rrd_vals += ":NaN"
-            else:
-                rrd_vals += f":{results[i-1]}"
-
-        rrd.append(rrd_names)
-        rrd.append(rrd_vals)
-
-        # update RRD file
-        update(rrd)
+def volley_statistics(monitors: list[dict], job_results: list[list[Union[float, str]]], received: list[datetime]):
+    """
+    Apply one volley to each of a list of monitors, vectorized across the list.
 
-@router.get("/down", include_in_schema=False)
-async def down(request: Request, db: DBDependency):
-    """ Notification of Down Monitors """
-
-    # Get the value of NOTIFY_HASH database
-    NOTIFY_HASH = None
-    notify_hash_env = db.query(Env).filter(Env.key == "NOTIFY_HASH").first()
-    if notify_hash_env:
-        NOTIFY_HASH = notify_hash_env.value
-
-    # Get the value of NOTIFY_HASH database
-    NOTIFY_TIME = datetime.now().timestamp()
-    notify_time_env = db.query(Env).filter(Env.key == "NOTIFY_TIME").first()
-    if notify_time_env:
-        NOTIFY_HASH = notify_time_env.value
-
-    # Create context dictionary with app title
-    context = {
-        "request": request,
-        "title": request.app.title,
-        "description": request.app.description,
-        "server_localtime": datetime.now().strftime("%Y-%m-%d %H:%M:%S %Z"),
-        "server_timezone": request.app.server_timezone,
-        "server_start_time": request.app.server_start_time,
-        "server_run_time": naturaldelta(datetime.now() - request.app.server_start_time)
-    }
+    Args:
+        monitors (list[dict]): Current MONITOR_STAT_COLUMNS values, each monitor at most once
+        job_results (list): Latency results per monitor, floats or "U"
+        received (list[datetime]): Submission time per monitor
 
-    # create a flat list of all monitors that both current_loss and prev_loss are both equal to pollcount
-    down = [item for sublist in db.query(Monitors.id).filter(Monitors.is_active == True).\
-        filter(Monitors.current_loss == Monitors.pollcount).\
-        filter(Monitors.prev_loss == Monitors.pollcount).all() for item in sublist]
-
-    # create a hash of the down list
-    down_hash = str(hash(str(sorted(down))))
-    down_time = datetime.now().timestamp()
-
-    # get all down monitor details
-    context["monitors"] = []
-    for monitor in down:
-        monitor = db.query(Monitors).filter(Monitors.id == monitor).filter(Monitors.is_active == True).first()
-        agent = db.query(Agents).filter(Agents.id == monitor.agent_id).filter(Agents.is_active == True).first()
-        target = db.query(Targets).filter(Targets.id == monitor.target_id).filter(Targets.is_active == True).first()
-
-        # if down for 2hrs, blue, 5hrs, yellow, 24hrs, red
-        if datetime.now() - monitor.last_down > timedelta(hours=12):
-            color = "#DC4C64"
-        elif datetime.now() - monitor.last_down > timedelta(hours=5):
-            color = "#E4A11B"
-        elif datetime.now() - monitor.last_down > timedelta(hours=2):
-            color = "#54B4D3"
-
-        context["monitors"].append({
-            "title": request.app.title,
-            "description": request.app.description,
-            "agent": agent.name,
-            "target": target.address,
-            "description": monitor.description,
-            "last_down": naturaltime(monitor.last_down),
-            "color": color
-        })
+    Returns:
+        list[dict]: Updated column values keyed by column name, including the id
+    """
+
+    # Incremental state, monitors with history from before the state existed start from their averages
+    state = load_states([monitor["stats"] if monitor["stats"] or not monitor["sample"] else
+        StreamStats.seed(monitor["sample"], monitor["avg_median"], monitor["avg_min"], monitor["avg_max"],
+            monitor["avg_stddev"], monitor["avg_loss"]).dump() for monitor in monitors])
+    current = update_states(state, volley_matrix(job_results), np.array([monitor["pollcount"] for monitor in monitors]))
+    blobs = dump_states(state)
+
+    # Plain python values for the row updates
+    current = {key: np.round(value, 2).tolist() if value.dtype.kind == "f" else value.tolist() for key, value in current.items()}
+    averages = {field: np.round(state[field], 2).tolist() for field in ("mean_median", "mean_min", "mean_max", "mean_stddev")}
+    average_loss = np.round(state["mean_loss"]).astype(int).tolist()
+
+    rows = []
+    for i, monitor in enumerate(monitors):
+        monitor = dict(monitor)
+        monitor["sample"] += 1
+        monitor["stats"] = blobs[i]
+
+        # Previous Volley Loss
+        monitor["prev_loss"] = monitor["current_loss"]
+
+        # Current Volley Stats
+        monitor["current_loss"] = current["loss"][i]
+        if current["count"][i]:
+            monitor["current_median"] = current["median"][i]
+            monitor["current_min"] = current["min"][i]
+            monitor["current_max"] = current["max"][i]
+            monitor["current_stddev"] = current["stddev"][i]
+
+        # Average Volley Stats, rounded for display only
+        monitor["avg_median"] = averages["mean_median"][i]
+        monitor["avg_min"] = averages["mean_min"][i]
+        monitor["avg_max"] = averages["mean_max"][i]
+        monitor["avg_stddev"] = averages["mean_stddev"][i]
+        monitor["avg_loss"] = average_loss[i]
+
+        # Update last_down if target goes down from up or up from down
+        if (monitor["current_loss"] == monitor["pollcount"]) != (monitor["prev_loss"] == monitor["pollcount"]):
+            monitor["last_down"] = received[i]
+
+        # Update monitor job last_update
+        monitor["last_update"] = received[i]
+
+        # If down add pollinterval to total_down
+        if monitor["current_loss"] == monitor["pollcount"]:
+            monitor["total_down"] += monitor["pollinterval"]
+
+        rows.append(monitor)
+
+    return rows
+
+def ingest_volley_batch(submissions: list[dict]):
+    """
+    Write a batch of queued volley submissions to the database and time-series store.
+
+    Runs in an ingest worker thread. Agents and monitors are loaded with one
+    query each, statistics are applied in submission order and written back
+    in a single transaction, then the results go to the time-series backend. State transitions
+    go to the alert engine once the transaction is committed.
 
-    # get SMTP_SERVER, SMTP_PORT, SMTP_USERNAME, SMTP_PASSWORD and NOTIFY_EMAIL from database
-    SMTP_SERVER = None
-    smtp_server_env = db.query(Env).filter(Env.key == "SMTP_SERVER").first()
-    if smtp_server_env:
-        SMTP_SERVER = smtp_server_env.value
-    SMTP_PORT = None
-    smtp_port_env = db.query(Env).filter(Env.key == "SMTP_PORT").first()
-    if smtp_port_env:
-        SMTP_PORT = smtp_port_env.value
-    SMTP_USERNAME = None
-    smtp_username_env = db.query(Env).filter(Env.key == "SMTP_USERNAME").first()
-    if smtp_username_env:
-        SMTP_USERNAME = smtp_username_env.value
-    SMTP_PASSWORD = None
-    smtp_password_env = db.query(Env).filter(Env.key == "SMTP_PASSWORD").first()
-    if smtp_password_env:
-        SMTP_PASSWORD = smtp_password_env.value
-    NOTIFY_EMAIL = None
-    notify_email_env = db.query(Env).filter(Env.key == "NOTIFY_EMAIL").first()
-    if notify_email_env:
-        NOTIFY_EMAIL = notify_email_env.value
-
-    # if down_hash is not equal to NOTIFY_HASH and down_time is greater than NOTIFY_TIME + 1hr
-    if NOTIFY_HASH != down_hash and down_time > float(NOTIFY_TIME) + 3600:
-
-        # update NOTIFY_HASH and NOTIFY_TIME
-        NOTIFY_HASH = update_or_create_env_var(NOTIFY_HASH, "NOTIFY_HASH", down_hash)
-        NOTIFY_TIME = update_or_create_env_var(NOTIFY_TIME, "NOTIFY_TIME", down_time)
+    Args:
+        submissions (list[dict]): {"agent_id", "address", "received", "results"} as queued by update_agent_job
+    """
+    rrd_updates = []
+    db = SessionLocal()
+    try:
+        # Update agent address and last_seen
+        agents = {agent.id: agent for agent in db.query(Agents).\
+            filter(Agents.id.in_({submission["agent_id"] for submission in submissions})).filter(Agents.is_active == True).all()}
+        for submission in submissions:
+            agent = agents.get(submission["agent_id"])
+            if agent:
+                if agent.address != submission["address"]:
+                    agent.address = submission["address"]
+                agent.last_seen = submission["received"]
+
+        # Load every referenced monitor with one IN query
+        monitors = {row.id: row._asdict() for row in db.query(*MONITOR_STAT_COLUMNS).\
+            filter(Monitors.id.in_({job["id"] for submission in submissions for job in submission["results"]})).\
+            filter(Monitors.is_active == True).all()}
+
+        # Queue the volleys in submission order, a monitor may appear more than once in a batch
+        volleys = []
+        for submission in submissions:
+            if submission["agent_id"] not in agents:
+                continue
+            for job in submission["results"]:
+                monitor = monitors.get(job["id"])
+                if monitor:
+                    volleys.append((job["id"], job["results"], submission["received"]))
+                    rrd_updates.append((submission["agent_id"], monitor["id"], monitor["pollinterval"], job["results"], submission["received"]))
+
+        # Update the statistics in memory, one vectorized pass per round so repeats stay in order
+        updated = {}
+        events = []
+        latency, loss = alerts.thresholds(db)
+        while volleys:
+            batch, repeats, seen = [], [], set()
+            for item in volleys:
+                (repeats if item[0] in seen else batch).append(item)
+                seen.add(item[0])
+            rows = volley_statistics([monitors[monitor_id] for monitor_id, _, _ in batch],
+                [job_results for _, job_results, _ in batch], [received for _, _, received in batch])
+            for row, (_, _, received) in zip(rows, batch):
+                events.extend((row["id"], alert, received) for alert in transitions(monitors[row["id"]], row, latency, loss))
+                monitors[row["id"]] = updated[row["id"]] = row
+            volleys = repeats
+
+        # Write everything back in a single transaction (executemany by primary key)
+        if updated:
+            db.execute(sql_update(Monitors), list(updated.values()))
         db.commit()
+    finally:
+        db.close()
+
+    alerts.observe(events)
+
+    # Move the monitors in the job cache due-time index
+    for agent_id, monitor_id, _, _, received in rrd_updates:
+        jobcache.updated(agent_id, monitor_id, received.timestamp())
+
+    # store the results (validated on submission) as one batch
+    try:
+        tsdb.append([(agent_id, monitor_id, step, job_results, int(received.timestamp()))
+            for agent_id, monitor_id, step, job_results, received in rrd_updates])
+    except Exception:
+        logger.exception("ingest: time-series append failed for %d volleys", len(rrd_updates))
+
+# Ingest queue drained by worker threads, started and stopped by the app lifespan
+ingest = IngestQueue(ingest_volley_batch)
 
-        # if SMTP_SERVER, SMTP_PORT, SMTP_USERNAME and NOTIFY_EMAIL are set
-        if SMTP_SERVER and SMTP_PORT and NOTIFY_EMAIL:
+# Seconds an agent is asked to wait when the ingest queue is full
+INGEST_RETRY_AFTER = 5
 
-            # Create a MIMEMultipart message object
-            message = MIMEMultipart()
-            message["From"] = SMTP_USERNAME
-            message["To"] = NOTIFY_EMAIL
-            message["Subject"] = request.app.title + " - Down Monitor Notification"
-            message.attach(MIMEText(templates.get_template("volley_notify.html").render(context), "html"))
+# Longest long-poll on GET /volley/{agent_id}, and the shortest sleep between due checks
+JOB_WAIT_MAX = 300
+JOB_WAIT_STEP = 0.5
 
-            # Create a SMTP session to connect to Gmail's mail server
-            with smtplib.SMTP(SMTP_SERVER, SMTP_PORT) as server:
-                server.starttls()                                                   # Enable secure connection
-                if SMTP_USERNAME and SMTP_PASSWORD:
-                    server.login(SMTP_USERNAME, SMTP_PASSWORD)                      # Login to the sender's email account
-                server.sendmail(SMTP_USERNAME, NOTIFY_EMAIL, message.as_string())   # Send the email
+@router.get("/queue", status_code=status.HTTP_200_OK)
+async def ingest_queue():
+    """ Ingest queue depth and counters, and the time-series backend """
+    return {**ingest.stats(), "tsdb": tsdb.stats()}
 
-    # return email template
+@router.get("/down", include_in_schema=False)
+def down(request: Request):
+    """ Notification of Down Monitors, as of the notifier's last evaluation """
+    context = notifier.context()
+    context["request"] = request
     return templates.TemplateResponse("volley_notify.html", context=context)
-    #return None
 
 @router.get("/", status_code=status.HTTP_200_OK)
-async def volley_script():
+def volley_script():
     """ Retrun the volley.py script """
     response = PlainTextResponse(open("volley.py", "r").read())
     return response
@@ -317,11 +326,13 @@ async def volley_script():
                         "protocol": "icmp",
                         "port": 0,
                         "dscp": "BE",
-                        "pollcount": 20
+                        "pollcount": 20,
+                        "pollinterval": 60
                     }]
                 }
             }
         },
+        304: { "description": "Not Modified, the agent's jobs match If-None-Match" },
         404: { "content": {
             "application/json": {
                 "example": {
@@ -332,7 +343,9 @@ async def volley_script():
         }
     }
 )
-async def read_agent_job(request: Request, db: DBDependency, agent_id: str = Path(..., min_length=36, max_length=36, pattern="^[a-f0-9]{8}-?[a-f0-9]{4}-?4[a-f0-9]{3}-?[89ab][a-f0-9]{3}-?[a-f0-9]{12}$")):
+async def read_agent_job(request: Request, reply: Response, db: DBDependency, agent_id: str = Path(..., min_length=36, max_length=36, pattern="^[a-f0-9]{8}-?[a-f0-9]{4}-?4[a-f0-9]{3}-?[89ab][a-f0-9]{3}-?[a-f0-9]{12}$"),
+    all_jobs: bool = Query(False, alias="all", description="Return every active monitor, not only those due"),
+    wait: int = Query(0, ge=0, le=JOB_WAIT_MAX, description="Seconds to hold the request until a job is due or the configuration changes")):
     """ Get all monitor jobs by agent id """
 
     # Get agent address from request
@@ -345,49 +358,62 @@ async def read_agent_job(request: Request, db: DBDependency, agent_id: str = Pat
     if agent_address == "127.0.0.1":
         agent_address = None
 
-    # Get agent from database
-    agent = db.query(Agents).filter(Agents.id == agent_id).filter(Agents.is_active == True).first()
-
-    # If agent exists
-    if agent:
-        response = []
-
-        # Update agent address if changed
-        if agent_address and agent.address != agent_address:
-            agent.address = agent_address
-        
-        # Update agent last_seen
-        agent.last_seen = datetime.now()
-        db.commit()
-
-        # Get all monitor jobs by agent id with last_update older than pollinterval
-        monitors = db.query(Monitors).filter(Monitors.agent_id == agent_id).filter(Monitors.is_active == True).all()
-        monitors = [monitor for monitor in monitors if monitor.last_update < datetime.now() - timedelta(seconds=monitor.pollinterval)]
-        
-        # Lookup target names by id
-        for monitor in monitors:
-            target = db.query(Targets).filter(Targets.id == monitor.target_id).filter(Targets.is_active == True).first()
-
-            if target:
-                # Append target monitor to the response
-                response.append({
-                    "id": monitor.id,
-                    "address": target.address,
-                    "protocol": monitor.protocol,
-                    "port": monitor.port,
-                    "dscp": monitor.dscp,
-                    "pollcount": monitor.pollcount
-                })
-    else:
+    # Get the agent's job list from the cache, built with one query on a miss
+    entry = await run_in_threadpool(jobcache.load, db, agent_id)
+    if not entry:
         # Agent not found
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND)
 
-    # run down notification
-    await down(request, db)
+    # Update agent address and last_seen, at most once a minute unless the address changed
+    if jobcache.seen(entry, agent_address):
+        await run_in_threadpool(agent_seen, db, agent_id, agent_address)
+
+    # ETags the agent already holds, a 304 tells it to keep its jobs
+    known = {tag.strip() for tag in request.headers.get("If-None-Match", "").split(",") if tag.strip()}
+
+    deadline = datetime.now().timestamp() + wait
+    while True:
+        # Monitors due now from the due-time index, long-running agents schedule monitors themselves and ask for all of them
+        response = jobcache.jobs(entry, all_jobs)
+        etag = jobcache.etag(entry, response, all_jobs)
+        unchanged = etag in known or "*" in known
+
+        # Answer when there is something new for the agent or the wait is over
+        now = datetime.now().timestamp()
+        if (not unchanged and (response or all_jobs)) or now >= deadline:
+            break
+
+        # Hold the request until the next monitor is due or the configuration changes,
+        # without keeping a database connection checked out
+        timeout = deadline - now
+        next_due = jobcache.next_due(entry)
+        if not all_jobs and next_due is not None:
+            timeout = min(timeout, max(next_due - now, JOB_WAIT_STEP))
+        await run_in_threadpool(db.close)
+        await jobcache.wait(agent_id, entry, timeout)
+
+        entry = await run_in_threadpool(jobcache.load, db, agent_id)
+        if not entry:
+            # Agent deleted or disabled while waiting
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND)
+
+    # Advertise the compact submission format to the agent
+    headers = {"ETag": etag, "X-Kinetic-Submit": f"application/json, {VOLLEY_FORMAT}"}
+    if unchanged:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    reply.headers.update(headers)
 
     # Return the response
     return response
 
+def agent_seen(db: Session, agent_id: str, agent_address: Optional[str]):
+    """ Write agent address and last_seen """
+    agent = db.query(Agents).filter(Agents.id == agent_id).first()
+    if agent_address:
+        agent.address = agent_address
+    agent.last_seen = datetime.now()
+    db.commit()
+
 @router.put("/{agent_id}", status_code=status.HTTP_202_ACCEPTED,
     responses={
         202: { "content": {
@@ -405,106 +431,67 @@ async def read_agent_job(request: Request, db: DBDependency, agent_id: str = Pat
                     }
                 }
             }
+        },
+        503: { "content": {
+            "application/json": {
+                "example": {
+                    "detail": "Ingest queue full"
+                    }
+                }
+            }
         }
     }
 )
 async def update_agent_job(request: Request, db: DBDependency, agent_id: str = Path(..., min_length=36, max_length=36, pattern="^[a-f0-9]{8}-?[a-f0-9]{4}-?4[a-f0-9]{3}-?[89ab][a-f0-9]{3}-?[a-f0-9]{12}$")):
     """ Update monitor job by agent id """
 
+    # async to read the raw body, database work is pushed to the threadpool or the ingest queue
+
+    # compact binary submissions are checked while decoding
+    compact = request.headers.get("Content-Type", "").startswith(VOLLEY_FORMAT)
+
     try:
-        results = await request.json()
+        if compact:
+            results = decode_volley_results(await request.body())
+        else:
+            results = await request.json()
+
+            # older agents encode the json results twice
+            if isinstance(results, str):
+                results = json_loads(results)
     except ValueError as exc:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(exc))
 
-    # load json results
-    results = json_loads(results)
+    # validate job input, a list of {"id", "results"} objects, before anything is queued
+    if not compact:
+        if not isinstance(results, list) or not all(isinstance(job, dict) for job in results):
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="results must be a list of objects")
+        for job in results:
+            try:
+                JobSubmissionModel(**job)
+            except ValueError as exc:
+                raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(exc))
+
+    # Get agent address from request
+    if request.headers.get('X-Forwarded-For'):
+        agent_address = request.headers.get('X-Forwarded-For').split(',')[0]
+    else:
+        agent_address = request.client.host
+
+    # Dont update agent address if localhost
+    if agent_address == "127.0.0.1":
+        agent_address = None
 
-    for job in results:
+    # Get agent from database, off the event loop
+    agent = await run_in_threadpool(db.query(Agents.id).filter(Agents.id == agent_id).filter(Agents.is_active == True).first)
+    if not agent:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND)
 
-        # validate job input
-        try:
-            JobSubmissionModel(**job)
-        except ValueError as exc:
-            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(exc))
-        
-        job_id = job["id"]
-        job_results = job["results"]
+    # Hand the submission to the ingest workers, ask the agent to back off if they are behind
+    submission = {"agent_id": agent.id, "address": agent_address, "received": datetime.now(), "results": results}
+    if not ingest.put(agent.id, submission):
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Ingest queue full",
+            headers={"Retry-After": str(INGEST_RETRY_AFTER)})
 
-        # Get agent address from request
-        if request.headers.get('X-Forwarded-For'):
-            agent_address = request.headers.get('X-Forwarded-For').split(',')[0]
-        else:
-            agent_address = request.client.host
-
-        # Dont update agent address if localhost
-        if agent_address == "127.0.0.1":
-            agent_address = None
-
-        # Get agent from database
-        agent = db.query(Agents).filter(Agents.id == agent_id).filter(Agents.is_active == True).first()
-
-        # If agent exists
-        if agent:
-            # Update agent address if changed
-            if agent.address != agent_address:
-                agent.address = agent_address
-            
-            # Update agent last_seen
-            agent.last_seen = datetime.now()
-            db.commit()
-
-            # Get monitor job by id
-            monitor = db.query(Monitors).filter(Monitors.id == job_id).filter(Monitors.is_active == True).first()
-
-            # If monitor job exists
-            if monitor:
-                # Update monitor job results
-                latencies = jsonable_encoder(job_results)
-                valid = [x for x in latencies if isinstance(x, float)]
-                monitor.sample += 1
-
-                # Previous Volley Loss
-                monitor.prev_loss = monitor.current_loss
-
-                # Current Volley Stats
-                if valid:  # Check if the list is not empty
-                    monitor.current_loss = monitor.pollcount - len(valid)
-                    monitor.current_median = round(sorted(valid)[len(valid) // 2], 2)
-                    monitor.current_min = round(min(valid), 2)
-                    monitor.current_max = round(max(valid), 2)
-                    monitor.current_stddev = round((sum([((x - monitor.current_median) ** 2) for x in valid]) / len(valid)) ** 0.5, 2)
-
-                    # Aveage Volley Stats
-                    monitor.avg_median = round(((monitor.avg_median * (monitor.sample - 1)) + monitor.current_median) / monitor.sample, 2)
-                    monitor.avg_min = round(((monitor.avg_min * (monitor.sample - 1)) + monitor.current_min) / monitor.sample, 2)
-                    monitor.avg_max = round(((monitor.avg_max * (monitor.sample - 1)) + monitor.current_max) / monitor.sample, 2)
-                    monitor.avg_stddev = round(((monitor.avg_stddev * (monitor.sample - 1)) + monitor.current_stddev) / monitor.sample, 2)
-                else:
-                    monitor.current_loss = monitor.pollcount
-                
-                # Always update average loss
-                monitor.avg_loss = round(((monitor.avg_loss * (monitor.sample - 1)) + monitor.current_loss) / monitor.sample)
-
-                # Update last_down if target goes down from up
-                if monitor.current_loss == monitor.pollcount and monitor.prev_loss != monitor.pollcount:
-                    monitor.last_down = datetime.now()
-                # Update last_down if target goes up from down
-                elif monitor.current_loss != monitor.pollcount and monitor.prev_loss == monitor.pollcount:
-                    monitor.last_down = datetime.now()
-
-                # Update monitor job last_update
-                monitor.last_update = datetime.now()
-                monitor.results = jsonable_encoder(job_results)
-
-                # If down add pollinterval to total_down
-                if monitor.current_loss == monitor.pollcount:
-                    monitor.total_down += monitor.pollinterval
-
-                # Commit changes to database
-                db.commit()
-
-                # run RRHandler
-                RRDHandler(agent_id=agent.id, monitor_id=monitor.id, step=monitor.pollinterval, results=job_results)
-
-    # Return success
-    return { "status": "success" }
\ No newline at end of file
+    # Return accepted
+    return { "status": "success" }
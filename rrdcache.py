@@ -0,0 +1,297 @@
+"""
+Kinetic - Write-coalescing cache in front of the RRD files
+
+Volley results are buffered in memory per RRD file and written with one
+`rrdtool update` per file carrying every buffered value, instead of one small
+random write per monitor per submission. Each file is written at least every
+KINETIC_RRD_FLUSH seconds, all of them when KINETIC_RRD_PENDING values are
+buffered, and everything on shutdown. Graph rendering calls flush() for the
+files it is about to read so the console never shows stale data.
+
+Buffered updates always carry their own timestamp, so writing them later does
+not move them in time. Setting KINETIC_RRDCACHED to an rrdcached address (for
+example unix:/var/run/rrdcached.sock) hands the buffering to that daemon
+instead: every update is sent straight to it and flush() asks it to write.
+
+File names (md5 of agent and monitor id) and file existence are cached, so an
+update does not hash or stat anything after the first one for a monitor.
+
+Server environment variables:
+    KINETIC_RRD_FLUSH      seconds a buffered update may wait (default 300)
+    KINETIC_RRD_PENDING    buffered values before everything is written (default 100000)
+    KINETIC_RRDCACHED      rrdcached daemon address, in-process buffering if not set
+"""
+
+import logging
+from hashlib import md5
+from os import environ, path
+from threading import Event, Lock, Thread
+from time import time
+from typing import Optional, Union
+import rrdtool
+
+logger = logging.getLogger(__name__)
+
+# Directory holding the RRD files
+RRD_DIR = "./data/"
+
+class RRDCache:
+    """
+    Per-file update buffer flushed by a background thread.
+
+    Args:
+        interval (int): Seconds a buffered update may wait
+        limit (int): Buffered values before everything is written
+        daemon (str): rrdcached address, None to buffer in process
+    """
+
+    def __init__(self, interval: int = None, limit: int = None, daemon: str = None):
+        self.interval = max(1, interval or int(environ.get("KINETIC_RRD_FLUSH", 300)))
+        self.limit = max(1, limit or int(environ.get("KINETIC_RRD_PENDING", 100000)))
+        self.daemon = daemon or environ.get("KINETIC_RRDCACHED") or None
+        self.lock = Lock()
+        self.write_lock = Lock()
+        self.stopped = Event()
+        self.thread = None
+        self.names = {}
+        self.known = set()
+        self.widths = {}
+        self.pending = {}
+        self.last = {}
+        self.count = 0
+        self.updates = 0
+        self.writes = 0
+        self.failed = 0
+        self.dropped = 0
+
+    def start(self):
+        """ Start the flush thread """
+        if self.thread:
+            return
+        self.stopped.clear()
+        self.thread = Thread(target=self.worker, name="kinetic-rrdcache", daemon=True)
+        self.thread.start()
+
+    def stop(self, timeout: float = 30.0):
+        """ Stop the flush thread and write everything """
+        self.stopped.set()
+        if self.thread:
+            self.thread.join(timeout)
+        self.thread = None
+        self.flush()
+
+    def path(self, agent_id: str, monitor_id: str) -> str:
+        """ RRD file of a monitor """
+        key = (agent_id, monitor_id)
+        rrd_file = self.names.get(key)
+        if rrd_file is None:
+            rrd_file = self.names[key] = RRD_DIR + md5((str(agent_id) + "-" + str(monitor_id)).encode()).hexdigest() + ".rrd"
+        return rrd_file
+
+    def width(self, rrd_file: str, default: int) -> int:
+        """
+        Number of result data sources in an RRD file.
+
+        Files keep the pollcount they were created with, so reads must not
+        assume the monitor's current one.
+
+        Args:
+            rrd_file (str): Path to RRD file
+            default (int): Returned when the file does not say
+        """
+        width = self.widths.get(rrd_file)
+        if width is None:
+            try:
+                width = sum(1 for key in rrdtool.info(rrd_file) if key.startswith("ds[result") and key.endswith("].index"))
+            except rrdtool.OperationalError:
+                width = 0
+            if not width:
+                return default
+            self.widths[rrd_file] = width
+        return width
+
+    def create(self, rrd_file: str, step: int, count: int):
+        """
+        Create an RRD file for a monitor.
+
+        Args:
+            rrd_file (str): Path to RRD file
+            step (int): RRD step in seconds
+            count (int): Results per volley
+        """
+        rrd = []
+        rrd.append(rrd_file)
+        rrd.append("--start")
+        rrd.append("now-2h")
+        rrd.append("--step")
+        rrd.append(f"{step}")
+        rrd.append(f"DS:loss:GAUGE:{step*2}:0:{count}")
+        rrd.append(f"DS:median:GAUGE:{step*2}:0:1800")
+        for i in range(1, count+1):
+            rrd.append(f"DS:result{i}:GAUGE:{step*2}:0:1800")
+        rrd.append("RRA:AVERAGE:0.5:1:1008")
+        rrd.append("RRA:AVERAGE:0.5:12:4320")
+        rrd.append("RRA:MIN:0.5:12:4320")
+        rrd.append("RRA:MAX:0.5:12:4320")
+        rrd.append("RRA:AVERAGE:0.5:144:720")
+        rrd.append("RRA:MAX:0.5:144:720")
+        rrd.append("RRA:MIN:0.5:144:720")
+
+        # create RRD file
+        rrdtool.create(rrd)
+
+    @staticmethod
+    def values(results: list[Union[float, str]], timestamp: int) -> tuple[str, str]:
+        """ rrdtool update template and value string for one volley """
+        rrd_names = "loss:median"
+
+        # calculate loss and median
+        rrd_loss = 0
+        rrd_median = 0
+        for i in results:
+            if i == "U":
+                rrd_loss += 1
+            else:
+                rrd_median += i
+        rrd_median = round(rrd_median / len(results), 3)
+
+        rrd_vals = f"{timestamp}:{rrd_loss}:{rrd_median}"
+
+        # individual results
+        for i in range(1, len(results)+1):
+            rrd_names += f":result{i}"
+            if results[i-1] is None:
+                rrd_vals += ":NaN"
+            else:
+                rrd_vals += f":{results[i-1]}"
+
+        return rrd_names, rrd_vals
+
+    def add(self, agent_id: str, monitor_id: str, step: int, results: list[Union[float, str]], timestamp: Optional[int] = None):
+        """
+        Buffer one volley for a monitor's RRD file, creating the file on first sight.
+
+        Args:
+            agent_id (str): ID of the agent
+            monitor_id (str): ID of the monitor
+            step (int): RRD step in seconds
+            results (list): Latency results, floats or "U"
+            timestamp (int): Volley time in epoch seconds, now if not set
+        """
+        rrd_file = self.path(agent_id, monitor_id)
+        timestamp = int(timestamp or time())
+        if rrd_file not in self.known:
+            if not path.exists(rrd_file):
+                self.create(rrd_file, step, len(results))
+            self.known.add(rrd_file)
+
+        names, vals = RRDCache.values(results, timestamp)
+        if self.daemon:
+            rrdtool.update(rrd_file, "--daemon", self.daemon, "--template", names, vals)
+            with self.lock:
+                self.updates += 1
+            return
+
+        with self.lock:
+            # rrdtool refuses a time at or before the last update, and would drop the whole batch with it
+            if timestamp <= self.last.get(rrd_file, 0):
+                self.dropped += 1
+                return
+            self.last[rrd_file] = timestamp
+            stale = rrd_file in self.pending and self.pending[rrd_file][0] != names
+
+        # a different pollcount changes the template, write what has the old one first
+        if stale:
+            self.write_back(rrd_file)
+
+        with self.lock:
+            self.pending.setdefault(rrd_file, (names, [], time()))[1].append(vals)
+            self.count += 1
+            self.updates += 1
+            full = self.count >= self.limit
+        if full:
+            self.flush()
+
+    def discard(self, rrd_file: str):
+        """ Forget a file that is about to be deleted """
+        with self.lock:
+            entry = self.pending.pop(rrd_file, None)
+            if entry:
+                self.count -= len(entry[1])
+            self.last.pop(rrd_file, None)
+            self.known.discard(rrd_file)
+            self.widths.pop(rrd_file, None)
+
+    def flush(self, rrd_files: Optional[list[str]] = None, older: Optional[float] = None):
+        """
+        Write buffered updates.
+
+        Args:
+            rrd_files (list[str]): Only these files, every file if None
+            older (float): Only files whose oldest buffered update is from before this time
+        """
+        if self.daemon:
+            if rrd_files:
+                try:
+                    rrdtool.flushcached("--daemon", self.daemon, *rrd_files)
+                except rrdtool.OperationalError:
+                    logger.exception("rrdcache: rrdcached flush failed")
+            return
+
+        with self.lock:
+            files = [rrd_file for rrd_file, entry in self.pending.items() if older is None or entry[2] < older] \
+                if rrd_files is None else [rrd_file for rrd_file in rrd_files if rrd_file in self.pending]
+        for rrd_file in files:
+            self.write_back(rrd_file)
+
+    def write_back(self, rrd_file: str):
+        """ Write one file's buffered values with a single update, value by value if that fails """
+        with self.write_lock:
+            with self.lock:
+                entry = self.pending.pop(rrd_file, None)
+                if not entry:
+                    return
+                names, vals, _ = entry
+                self.count -= len(vals)
+
+            try:
+                rrdtool.update(rrd_file, "--template", names, *vals)
+                with self.lock:
+                    self.writes += 1
+                return
+            except rrdtool.OperationalError:
+                logger.warning("rrdcache: batch update of %s failed, writing %d values one by one", rrd_file, len(vals))
+
+            for value in vals:
+                try:
+                    rrdtool.update(rrd_file, "--template", names, value)
+                    with self.lock:
+                        self.writes += 1
+                except rrdtool.OperationalError as e:
+                    logger.error("rrdcache: %s %s: %s", rrd_file, value, e)
+                    with self.lock:
+                        self.failed += 1
+
+    def worker(self):
+        """ Write files whose oldest update is due, checked every few seconds """
+        while not self.stopped.wait(min(self.interval, 5)):
+            try:
+                self.flush(older=time() - self.interval)
+            except Exception:
+                logger.exception("rrdcache: flush failed")
+
+    def stats(self) -> dict:
+        """ Buffer size and counters """
+        with self.lock:
+            return {
+                "daemon": self.daemon,
+                "files": len(self.pending),
+                "pending": self.count,
+                "updates": self.updates,
+                "writes": self.writes,
+                "failed": self.failed,
+                "dropped": self.dropped
+            }
+
+# Shared by the ingest workers, the console graphs and the monitors router
+rrdcache = RRDCache()
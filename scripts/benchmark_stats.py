@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+Kinetic - Benchmark per-row against vectorized volley statistics
+
+Feeds the same random agent reports through StreamStats.add_volley one
+monitor at a time and through streamstats.update_states one report at a
+time, checks both end in the same state and prints the CPU time per report.
+The volley summary alone (loss, median, min, max, mean, stddev) is timed
+separately, since the P² quantile markers still advance one sample at a time.
+Every loss rate is measured on its own data: lost probes ("U") take a slower
+path through volley_matrix than all-numeric reports.
+
+Usage:
+    python scripts/benchmark_stats.py --monitors 200 --pollcount 20 --reports 50 --loss 0 0.02 0.5
+"""
+
+import argparse
+import random
+import sys
+import time
+from os import path
+
+import numpy as np
+
+sys.path.insert(0, path.dirname(path.dirname(path.abspath(__file__))))
+from streamstats import StreamStats, load_states, dump_states, update_states, volley_matrix, summarize
+
+def reports(monitors: int, pollcount: int, count: int, loss: float) -> list:
+    """ Random agent reports, every report has one volley per monitor """
+    return [[[round(random.lognormvariate(3, 0.5), 3) if random.random() > loss else "U" for _ in range(pollcount)]
+        for _ in range(monitors)] for _ in range(count)]
+
+def per_row(data: list, monitors: int, pollcount: int) -> tuple[float, list]:
+    """ One StreamStats per monitor, loaded and dumped per volley like a row at a time ingest """
+    blobs = [None] * monitors
+    start = time.process_time()
+    for report in data:
+        for i, results in enumerate(report):
+            stats = StreamStats.load(blobs[i])
+            stats.add_volley(results, pollcount)
+            blobs[i] = stats.dump()
+    return time.process_time() - start, blobs
+
+def per_row_summary(data: list, pollcount: int) -> float:
+    """ Volley summary one monitor at a time with list comprehensions """
+    start = time.process_time()
+    for report in data:
+        for results in report:
+            valid = [x for x in results if isinstance(x, float)]
+            if valid:
+                ordered = sorted(valid)
+                mean = sum(valid) / len(valid)
+                summary = (pollcount - len(valid), ordered[len(ordered) // 2], ordered[0], ordered[-1], mean,
+                    (sum((x - mean) ** 2 for x in valid) / len(valid)) ** 0.5)
+    return time.process_time() - start
+
+def vectorized_summary(data: list, monitors: int, pollcount: int) -> float:
+    """ Volley summary one summarize() pass per report """
+    counts = np.full(monitors, pollcount)
+    start = time.process_time()
+    for report in data:
+        summarize(volley_matrix(report), counts)
+    return time.process_time() - start
+
+def vectorized(data: list, monitors: int, pollcount: int) -> tuple[float, list]:
+    """ One update_states pass per report """
+    blobs = [None] * monitors
+    counts = np.full(monitors, pollcount)
+    start = time.process_time()
+    for report in data:
+        state = load_states(blobs)
+        update_states(state, volley_matrix(report), counts)
+        blobs = dump_states(state)
+    return time.process_time() - start, blobs
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark per-row against vectorized volley statistics")
+    parser.add_argument("--monitors", type=int, default=200, help="Monitors per agent report")
+    parser.add_argument("--pollcount", type=int, default=20, help="Probes per volley")
+    parser.add_argument("--reports", type=int, default=50, help="Agent reports to ingest")
+    parser.add_argument("--loss", type=float, nargs="+", default=[0.0, 0.02, 0.5], help="Probabilities of a lost probe, one run each")
+    args = parser.parse_args()
+
+    print(f"{args.reports} reports x {args.monitors} monitors x {args.pollcount} probes")
+    for loss in args.loss:
+        benchmark(args, loss)
+
+def benchmark(args: argparse.Namespace, loss: float):
+    """ Time both paths on one set of reports with this loss rate and print the results """
+    random.seed(0)
+    data = reports(args.monitors, args.pollcount, args.reports, loss)
+
+    row_summary = per_row_summary(data, args.pollcount)
+    vec_summary = vectorized_summary(data, args.monitors, args.pollcount)
+    row_time, row_blobs = per_row(data, args.monitors, args.pollcount)
+    vec_time, vec_blobs = vectorized(data, args.monitors, args.pollcount)
+
+    # both paths must agree
+    worst = 0.0
+    for a, b in zip(row_blobs, vec_blobs):
+        a, b = StreamStats.load(a), StreamStats.load(b)
+        for p in (0.50, 0.95, 0.99):
+            worst = max(worst, abs(a.percentile(p) - b.percentile(p)))
+        worst = max(worst, abs(a.mean_median - b.mean_median), abs(a.sample_stddev - b.sample_stddev))
+
+    print(f"loss {loss:.0%}")
+    print(f"summary     per-row {row_summary / args.reports * 1000:8.2f} ms  vectorized {vec_summary / args.reports * 1000:8.2f} ms"
+          f"  ({row_summary / vec_summary:.1f}x) per report")
+    print(f"full state  per-row {row_time / args.reports * 1000:8.2f} ms  vectorized {vec_time / args.reports * 1000:8.2f} ms"
+          f"  ({row_time / vec_time:.1f}x) per report")
+    print(f"largest difference {worst:.2e}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+Kinetic - Concurrent request load test
+
+Simulates agents polling and submitting results at the same moment while
+console users load pages, then reports throughput and latency per request
+kind. Run it against a server before and after a change to compare.
+
+Usage:
+    python scripts/loadtest.py --server http://localhost:8080 --agents 20 --users 10 --duration 30
+
+Every simulated agent uses the first active agent id on the server unless
+--agent is given; results are submitted for that agent's own monitors.
+"""
+
+import argparse
+import random
+import threading
+import time
+import requests
+
+def percentile(values: list, q: float) -> float:
+    """ Nearest-rank percentile of a list of numbers """
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q / 100 * len(values)))]
+
+class Recorder:
+    """ Thread-safe latency and error tally keyed by request kind """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latency = {}
+        self.errors = {}
+
+    def add(self, kind: str, seconds: float, ok: bool):
+        with self.lock:
+            self.latency.setdefault(kind, []).append(seconds)
+            if not ok:
+                self.errors[kind] = self.errors.get(kind, 0) + 1
+
+    def report(self, duration: float):
+        print(f"{'kind':<16}{'requests':>10}{'req/s':>10}{'errors':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+        total = 0
+        for kind, values in sorted(self.latency.items()):
+            total += len(values)
+            print(f"{kind:<16}{len(values):>10}{len(values) / duration:>10.1f}{self.errors.get(kind, 0):>8}"
+                  f"{percentile(values, 50) * 1000:>10.1f}{percentile(values, 95) * 1000:>10.1f}{percentile(values, 99) * 1000:>10.1f}")
+        print(f"{'total':<16}{total:>10}{total / duration:>10.1f}")
+
+def timed(recorder: Recorder, kind: str, call):
+    """ Run one request and record how long it took """
+    start = time.perf_counter()
+    try:
+        response = call()
+        ok = response.status_code < 400
+    except requests.RequestException:
+        response, ok = None, False
+    recorder.add(kind, time.perf_counter() - start, ok)
+    return response
+
+def agent_loop(server: str, agent_id: str, recorder: Recorder, stop: threading.Event, barrier: threading.Barrier):
+    """ Poll for jobs and submit fake results, all agents in lockstep """
+    session = requests.Session()
+    while not stop.is_set():
+        try:
+            barrier.wait(timeout=5)
+        except threading.BrokenBarrierError:
+            pass
+        response = timed(recorder, "agent GET", lambda: session.get(f"{server}/volley/{agent_id}", params={"all": "true"}, timeout=30))
+        if response is None or response.status_code != 200:
+            continue
+        results = [{
+            "id": job["id"],
+            "results": [round(random.uniform(1, 50), 3) if random.random() > 0.05 else "U" for _ in range(job["pollcount"])]
+        } for job in response.json()]
+        timed(recorder, "agent PUT", lambda: session.put(f"{server}/volley/{agent_id}", json=results, timeout=30))
+
+def user_loop(server: str, paths: list, recorder: Recorder, stop: threading.Event):
+    """ Load console pages back to back """
+    session = requests.Session()
+    while not stop.is_set():
+        path = random.choice(paths)
+        timed(recorder, "console GET", lambda: session.get(f"{server}{path}", timeout=30))
+
+def main():
+    parser = argparse.ArgumentParser(description="Kinetic concurrent request load test")
+    parser.add_argument("--server", default="http://localhost:8080", help="Kinetic server url")
+    parser.add_argument("--agent", default=None, help="Agent id to poll and submit as")
+    parser.add_argument("--agents", type=int, default=20, help="Simulated agents reporting at the same moment")
+    parser.add_argument("--users", type=int, default=10, help="Simulated console users")
+    parser.add_argument("--duration", type=float, default=30, help="Test length in seconds")
+    args = parser.parse_args()
+
+    server = args.server.rstrip("/")
+    agent_id = args.agent
+    if not agent_id:
+        agents = [agent for agent in requests.get(f"{server}/agents/", timeout=10).json() if agent["is_active"]]
+        if not agents:
+            raise SystemExit("no active agent on the server, pass --agent")
+        agent_id = agents[0]["id"]
+
+    # console pages for the agent and its monitors
+    paths = ["/console/", f"/console/agent/{agent_id}"]
+    paths += [f"/console/monitor/{monitor['id']}" for monitor in requests.get(f"{server}/monitors/agent/{agent_id}", timeout=10).json()]
+
+    recorder = Recorder()
+    stop = threading.Event()
+    barrier = threading.Barrier(max(1, args.agents))
+    threads = [threading.Thread(target=agent_loop, args=(server, agent_id, recorder, stop, barrier), daemon=True) for _ in range(args.agents)]
+    threads += [threading.Thread(target=user_loop, args=(server, paths, recorder, stop), daemon=True) for _ in range(args.users)]
+
+    print(f"{args.agents} agents, {args.users} console users, {args.duration}s against {server}")
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    time.sleep(args.duration)
+    stop.set()
+    barrier.abort()
+    for thread in threads:
+        thread.join(30)
+    recorder.report(time.perf_counter() - start)
+
+if __name__ == "__main__":
+    main()
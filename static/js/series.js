@@ -0,0 +1,214 @@
+// Kinetic - monitor charts drawn in the browser from /api/monitors/{id}/series
+//
+// <canvas class="kinetic-series" data-url="..."> is filled with a latency chart (min-max band,
+// p25-p75 band, p95 and median lines) over a loss strip. Drag across the chart to zoom into the
+// loaded data, double-click to zoom back out. Hovering shows the values under the cursor.
+(function () {
+    "use strict";
+
+    var COLORS = {
+        band: "rgba(13, 110, 253, 0.12)",
+        quartiles: "rgba(13, 110, 253, 0.28)",
+        p95: "#E4A11B",
+        median: "#0D6EFD",
+        loss: "#DC4C64",
+        grid: "#E0E0E0",
+        text: "#424242",
+        select: "rgba(0, 0, 0, 0.1)"
+    };
+    var LOSS_HEIGHT = 40;
+    var MARGIN = { left: 48, right: 12, top: 12, bottom: 34 };
+
+    // undo delta encoding: integers in 1/scale units, each the difference to the previous non-null value
+    function decode(series) {
+        if (series.encoding !== "delta") { return series.columns; }
+        var columns = {};
+        Object.keys(series.columns).forEach(function (name) {
+            var previous = 0;
+            columns[name] = series.columns[name].map(function (value) {
+                if (value === null) { return null; }
+                previous += value;
+                return previous / series.scale;
+            });
+        });
+        return columns;
+    }
+
+    function Chart(canvas) {
+        this.canvas = canvas;
+        this.ctx = canvas.getContext("2d");
+        this.view = null;
+        this.drag = null;
+        this.hover = null;
+        this.bind();
+    }
+
+    Chart.prototype.load = function (series) {
+        this.columns = decode(series);
+        this.times = [];
+        for (var i = 0; i < series.rows; i++) { this.times.push(series.start + i * series.step); }
+        this.full = [series.start, series.start + Math.max(series.rows - 1, 1) * series.step];
+        this.view = this.full.slice();
+        this.draw();
+    };
+
+    Chart.prototype.x = function (t) {
+        var w = this.canvas.width - MARGIN.left - MARGIN.right;
+        return MARGIN.left + (t - this.view[0]) / (this.view[1] - this.view[0]) * w;
+    };
+
+    Chart.prototype.time = function (x) {
+        var w = this.canvas.width - MARGIN.left - MARGIN.right;
+        return this.view[0] + (x - MARGIN.left) / w * (this.view[1] - this.view[0]);
+    };
+
+    Chart.prototype.visible = function () {
+        var rows = [];
+        for (var i = 0; i < this.times.length; i++) {
+            if (this.times[i] >= this.view[0] && this.times[i] <= this.view[1]) { rows.push(i); }
+        }
+        return rows;
+    };
+
+    Chart.prototype.draw = function () {
+        var ctx = this.ctx, c = this.columns, self = this;
+        var rows = this.visible();
+        var top = MARGIN.top, bottom = this.canvas.height - MARGIN.bottom - LOSS_HEIGHT - 8;
+        ctx.clearRect(0, 0, this.canvas.width, this.canvas.height);
+        ctx.font = "11px Arial";
+
+        // latency scale from the visible maxima
+        var peak = 1;
+        rows.forEach(function (i) { if (c.max[i] !== null && c.max[i] > peak) { peak = c.max[i]; } });
+        peak *= 1.1;
+        var y = function (v) { return bottom - v / peak * (bottom - top); };
+
+        // grid and labels
+        ctx.strokeStyle = COLORS.grid;
+        ctx.fillStyle = COLORS.text;
+        ctx.textAlign = "right";
+        for (var g = 0; g <= 4; g++) {
+            var v = peak * g / 4;
+            ctx.beginPath(); ctx.moveTo(MARGIN.left, y(v)); ctx.lineTo(this.canvas.width - MARGIN.right, y(v)); ctx.stroke();
+            ctx.fillText(v.toFixed(1), MARGIN.left - 4, y(v) + 4);
+        }
+        ctx.save(); ctx.translate(10, (top + bottom) / 2); ctx.rotate(-Math.PI / 2);
+        ctx.textAlign = "center"; ctx.fillText("ms", 0, 0); ctx.restore();
+        ctx.textAlign = "center";
+        for (var l = 0; l <= 4; l++) {
+            var t = this.view[0] + (this.view[1] - this.view[0]) * l / 4;
+            var d = new Date(t * 1000);
+            ctx.fillText(d.toLocaleTimeString([], { hour: "2-digit", minute: "2-digit" }), this.x(t), this.canvas.height - 8);
+        }
+
+        // a band between two columns, broken where either is missing
+        function band(low, high, color) {
+            ctx.fillStyle = color;
+            var run = [];
+            function flush() {
+                if (run.length) {
+                    ctx.beginPath();
+                    run.forEach(function (i, n) { ctx[n ? "lineTo" : "moveTo"](self.x(self.times[i]), y(c[high][i])); });
+                    run.slice().reverse().forEach(function (i) { ctx.lineTo(self.x(self.times[i]), y(c[low][i])); });
+                    ctx.closePath(); ctx.fill();
+                }
+                run = [];
+            }
+            rows.forEach(function (i) { if (c[low][i] === null || c[high][i] === null) { flush(); } else { run.push(i); } });
+            flush();
+        }
+        function line(name, color, width) {
+            ctx.strokeStyle = color; ctx.lineWidth = width;
+            ctx.beginPath();
+            var pen = false;
+            rows.forEach(function (i) {
+                if (c[name][i] === null) { pen = false; return; }
+                ctx[pen ? "lineTo" : "moveTo"](self.x(self.times[i]), y(c[name][i]));
+                pen = true;
+            });
+            ctx.stroke(); ctx.lineWidth = 1;
+        }
+        band("min", "max", COLORS.band);
+        band("p25", "p75", COLORS.quartiles);
+        line("p95", COLORS.p95, 1);
+        line("median", COLORS.median, 2);
+
+        // loss strip, bar height is the loss percentage
+        var strip = this.canvas.height - MARGIN.bottom - LOSS_HEIGHT;
+        var bar = Math.max(1, (this.canvas.width - MARGIN.left - MARGIN.right) / Math.max(rows.length, 1));
+        ctx.strokeStyle = COLORS.grid;
+        ctx.strokeRect(MARGIN.left, strip, this.canvas.width - MARGIN.left - MARGIN.right, LOSS_HEIGHT);
+        ctx.fillStyle = COLORS.loss;
+        rows.forEach(function (i) {
+            if (c.loss[i]) {
+                var h = c.loss[i] / 100 * LOSS_HEIGHT;
+                ctx.fillRect(self.x(self.times[i]) - bar / 2, strip + LOSS_HEIGHT - h, bar, h);
+            }
+        });
+        ctx.fillStyle = COLORS.text; ctx.textAlign = "right";
+        ctx.fillText("loss", MARGIN.left - 4, strip + LOSS_HEIGHT / 2 + 4);
+
+        // zoom selection
+        if (this.drag && this.drag.to !== null) {
+            ctx.fillStyle = COLORS.select;
+            ctx.fillRect(Math.min(this.drag.from, this.drag.to), top, Math.abs(this.drag.to - this.drag.from), this.canvas.height - MARGIN.bottom - top);
+        }
+
+        // values under the cursor
+        if (this.hover !== null && rows.length) {
+            var t0 = this.time(this.hover), near = rows[0];
+            rows.forEach(function (i) { if (Math.abs(self.times[i] - t0) < Math.abs(self.times[near] - t0)) { near = i; } });
+            var fmt = function (v) { return v === null ? "-" : v.toFixed(2); };
+            ctx.strokeStyle = COLORS.text;
+            ctx.beginPath(); ctx.moveTo(this.x(this.times[near]), top); ctx.lineTo(this.x(this.times[near]), this.canvas.height - MARGIN.bottom); ctx.stroke();
+            ctx.textAlign = "left"; ctx.fillStyle = COLORS.text;
+            ctx.fillText(new Date(this.times[near] * 1000).toLocaleString() +
+                "  median " + fmt(c.median[near]) + "  p95 " + fmt(c.p95[near]) +
+                "  min " + fmt(c.min[near]) + "  max " + fmt(c.max[near]) + "  loss " + fmt(c.loss[near]) + "%",
+                MARGIN.left + 4, top + 10);
+        }
+    };
+
+    Chart.prototype.bind = function () {
+        var self = this;
+        function offset(e) { return e.clientX - self.canvas.getBoundingClientRect().left; }
+        this.canvas.addEventListener("mousedown", function (e) { self.drag = { from: offset(e), to: null }; });
+        this.canvas.addEventListener("mousemove", function (e) {
+            self.hover = offset(e);
+            if (self.drag) { self.drag.to = offset(e); }
+            if (self.columns) { self.draw(); }
+        });
+        this.canvas.addEventListener("mouseleave", function () { self.hover = null; if (self.columns) { self.draw(); } });
+        this.canvas.addEventListener("mouseup", function () {
+            var drag = self.drag;
+            self.drag = null;
+            if (drag && drag.to !== null && Math.abs(drag.to - drag.from) > 5) {
+                self.view = [self.time(Math.min(drag.from, drag.to)), self.time(Math.max(drag.from, drag.to))];
+            }
+            if (self.columns) { self.draw(); }
+        });
+        this.canvas.addEventListener("dblclick", function () {
+            if (self.columns) { self.view = self.full.slice(); self.draw(); }
+        });
+    };
+
+    document.querySelectorAll("canvas.kinetic-series").forEach(function (canvas) {
+        var chart = new Chart(canvas);
+        fetch(canvas.dataset.url)
+            .then(function (response) {
+                if (!response.ok) { throw new Error(response.status); }
+                return response.json();
+            })
+            .then(function (series) { chart.load(series); })
+            .catch(function () {
+                // no data yet, show the server rendered graphs instead
+                canvas.style.display = "none";
+                var fallback = document.getElementById(canvas.dataset.fallback);
+                if (fallback) {
+                    // the images only carry data-src, so the server renders them only when they are shown
+                    fallback.querySelectorAll("img[data-src]").forEach(function (img) { img.src = img.dataset.src; });
+                    fallback.style.display = "";
+                }
+            });
+    });
+})();
@@ -0,0 +1,397 @@
+"""
+Kinetic - Incremental statistics for monitor volleys
+
+Every monitor carries a small packed state blob that is updated in O(1) per
+latency sample, so long-run averages and percentiles never need a rescan of
+the RRD history:
+
+    - running means of the per-volley median, min, max, stddev and loss
+      (Welford style mean updates, rounded only for display)
+    - Welford mean and variance over every individual latency sample
+    - an EWMA of the per-volley median
+    - P² (Jain & Chlamtac) estimators for the p50, p95 and p99 latency
+
+The state is kept as float64 in a fixed-size struct of a few hundred bytes
+and stored in the Monitors.stats column.
+"""
+
+import struct
+import numpy as np
+from math import isfinite
+from typing import Optional, Union
+
+# Smoothing factor of the per-volley median EWMA
+EWMA_ALPHA = 0.1
+
+# Quantiles tracked by P² estimators
+QUANTILES = (0.50, 0.95, 0.99)
+
+# version, volleys, means (median, min, max, stddev, loss), volleys with replies, samples,
+# sample mean, sample m2, ewma, P² marker heights and positions for every quantile
+STATE = struct.Struct(f"<BQ5d2Q3d{5 * len(QUANTILES)}d{5 * len(QUANTILES)}q")
+STATE_VERSION = 1
+
+class P2Quantile:
+    """
+    P² streaming quantile estimator: five markers, O(1) memory and time per sample.
+
+    Args:
+        p (float): Quantile between 0 and 1
+        heights (list[float]): Marker heights, restored from the packed state
+        positions (list[int]): Marker positions, restored from the packed state
+    """
+
+    def __init__(self, p: float, heights: list = None, positions: list = None):
+        self.p = p
+        self.q = list(heights) if heights else [0.0] * 5
+        self.n = list(positions) if positions else [0, 1, 2, 3, 4]
+        self.dn = (0.0, p / 2, p, (1 + p) / 2, 1.0)
+
+    def add(self, x: float, count: int):
+        """
+        Add one sample.
+
+        Args:
+            x (float): Sample value
+            count (int): Number of samples seen including this one
+        """
+        q, n = self.q, self.n
+
+        # the first five samples are kept sorted as the initial markers
+        if count <= 5:
+            q[count - 1] = x
+            q[:count] = sorted(q[:count])
+            return
+
+        # find the cell the sample falls in, stretching the extremes
+        if x < q[0]:
+            q[0] = x
+            k = 0
+        elif x >= q[4]:
+            q[4] = x
+            k = 3
+        else:
+            k = 0
+            while x >= q[k + 1]:
+                k += 1
+        for i in range(k + 1, 5):
+            n[i] += 1
+
+        # move the middle markers towards their desired positions
+        for i in (1, 2, 3):
+            d = self.dn[i] * (count - 1) - n[i]
+            if (d >= 1 and n[i + 1] - n[i] > 1) or (d <= -1 and n[i - 1] - n[i] < -1):
+                d = 1 if d > 0 else -1
+                qp = q[i] + d / (n[i + 1] - n[i - 1]) * (
+                    (n[i] - n[i - 1] + d) * (q[i + 1] - q[i]) / (n[i + 1] - n[i]) +
+                    (n[i + 1] - n[i] - d) * (q[i] - q[i - 1]) / (n[i] - n[i - 1]))
+                if not q[i - 1] < qp < q[i + 1]:
+                    qp = q[i] + d * (q[i + d] - q[i]) / (n[i + d] - n[i])
+                q[i] = qp
+                n[i] += d
+
+    def value(self, count: int) -> Optional[float]:
+        """ Current estimate, exact while fewer than five samples were seen """
+        if count == 0:
+            return None
+        if count <= 5:
+            return self.q[min(count - 1, int(self.p * count))]
+        return self.q[2]
+
+class StreamStats:
+    """
+    Incremental per-monitor statistics with a compact binary form.
+
+    Create with StreamStats.load(blob), feed volleys with add_volley() and
+    persist with dump().
+    """
+
+    def __init__(self):
+        self.volleys = 0
+        self.mean_median = 0.0
+        self.mean_min = 0.0
+        self.mean_max = 0.0
+        self.mean_stddev = 0.0
+        self.mean_loss = 0.0
+        self.replied = 0
+        self.samples = 0
+        self.sample_mean = 0.0
+        self.sample_m2 = 0.0
+        self.ewma = 0.0
+        self.quantiles = [P2Quantile(p) for p in QUANTILES]
+
+    @classmethod
+    def load(cls, blob: Optional[bytes]) -> "StreamStats":
+        """ Restore from Monitors.stats, empty state for None or an unknown version """
+        stats = cls()
+        if not blob or len(blob) != STATE.size or blob[0] != STATE_VERSION:
+            return stats
+        values = STATE.unpack(blob)
+        (_, stats.volleys, stats.mean_median, stats.mean_min, stats.mean_max, stats.mean_stddev, stats.mean_loss,
+            stats.replied, stats.samples, stats.sample_mean, stats.sample_m2, stats.ewma) = values[:12]
+        heights = values[12:12 + 5 * len(QUANTILES)]
+        positions = values[12 + 5 * len(QUANTILES):]
+        stats.quantiles = [P2Quantile(p, heights[i * 5:i * 5 + 5], positions[i * 5:i * 5 + 5]) for i, p in enumerate(QUANTILES)]
+        return stats
+
+    @classmethod
+    def seed(cls, volleys: int, median: float, minimum: float, maximum: float, stddev: float, loss: float) -> "StreamStats":
+        """ Start from the averages of a monitor that has history but no state yet """
+        stats = cls()
+        stats.volleys = stats.replied = volleys
+        stats.mean_median, stats.mean_min, stats.mean_max, stats.mean_stddev, stats.mean_loss = median, minimum, maximum, stddev, loss
+        stats.ewma = median
+        return stats
+
+    def dump(self) -> bytes:
+        """ Packed form for Monitors.stats """
+        return STATE.pack(STATE_VERSION, self.volleys, self.mean_median, self.mean_min, self.mean_max, self.mean_stddev,
+            self.mean_loss, self.replied, self.samples, self.sample_mean, self.sample_m2, self.ewma,
+            *[h for quantile in self.quantiles for h in quantile.q], *[n for quantile in self.quantiles for n in quantile.n])
+
+    def add_volley(self, results: list[Union[float, str]], pollcount: int) -> dict:
+        """
+        Add one volley.
+
+        Args:
+            results (list): Latency results, floats or "U"
+            pollcount (int): Probes the volley was meant to send
+
+        Returns:
+            dict: Current volley median, min, max, stddev (around the mean) and loss,
+                median/min/max/stddev are None if every probe was lost
+        """
+        valid = [x for x in results if isinstance(x, (int, float)) and isfinite(x)]
+        current = {"loss": pollcount - len(valid), "median": None, "min": None, "max": None, "stddev": None}
+
+        self.volleys += 1
+        self.mean_loss += (current["loss"] - self.mean_loss) / self.volleys
+
+        if valid:
+            ordered = sorted(valid)
+            middle = len(ordered) // 2
+            mean = sum(ordered) / len(ordered)
+            current["median"] = ordered[middle] if len(ordered) % 2 else (ordered[middle - 1] + ordered[middle]) / 2
+            current["min"] = ordered[0]
+            current["max"] = ordered[-1]
+            current["stddev"] = (sum((x - mean) ** 2 for x in ordered) / len(ordered)) ** 0.5
+
+            # latency averages only count volleys that got at least one reply
+            self.replied += 1
+            self.mean_median += (current["median"] - self.mean_median) / self.replied
+            self.mean_min += (current["min"] - self.mean_min) / self.replied
+            self.mean_max += (current["max"] - self.mean_max) / self.replied
+            self.mean_stddev += (current["stddev"] - self.mean_stddev) / self.replied
+            self.ewma = current["median"] if self.replied == 1 else self.ewma + EWMA_ALPHA * (current["median"] - self.ewma)
+
+            # every individual sample
+            for x in valid:
+                self.samples += 1
+                delta = x - self.sample_mean
+                self.sample_mean += delta / self.samples
+                self.sample_m2 += delta * (x - self.sample_mean)
+                for quantile in self.quantiles:
+                    quantile.add(x, self.samples)
+
+        return current
+
+    @property
+    def sample_stddev(self) -> float:
+        """ Population standard deviation of every latency sample """
+        return (self.sample_m2 / self.samples) ** 0.5 if self.samples else 0.0
+
+    def percentile(self, p: float) -> Optional[float]:
+        """ Streaming estimate of a tracked quantile, None before the first sample """
+        for quantile in self.quantiles:
+            if quantile.p == p:
+                return quantile.value(self.samples)
+        raise ValueError(f"quantile {p} is not tracked, use one of {QUANTILES}")
+
+# Same layout as STATE, so a batch of blobs is read and written with one frombuffer/tobytes
+STATE_DTYPE = np.dtype([
+    ("version", "u1"), ("volleys", "<u8"),
+    ("mean_median", "<f8"), ("mean_min", "<f8"), ("mean_max", "<f8"), ("mean_stddev", "<f8"), ("mean_loss", "<f8"),
+    ("replied", "<u8"), ("samples", "<u8"), ("sample_mean", "<f8"), ("sample_m2", "<f8"), ("ewma", "<f8"),
+    ("heights", "<f8", (len(QUANTILES), 5)), ("positions", "<i8", (len(QUANTILES), 5))
+])
+assert STATE_DTYPE.itemsize == STATE.size
+
+# P² desired position increments for every tracked quantile
+P2_DN = np.array([(0.0, p / 2, p, (1 + p) / 2, 1.0) for p in QUANTILES])
+
+def volley_matrix(rows: list[list[Union[float, str]]]) -> np.ndarray:
+    """
+    Stack volley results into a monitors × pollcount float array.
+
+    Args:
+        rows (list): One result list per monitor, floats or "U", lengths may differ
+
+    Returns:
+        np.ndarray: NaN for "U" and for the padding of shorter rows
+    """
+    width = max((len(row) for row in rows), default=0)
+    if all(len(row) == width for row in rows):
+        try:
+            matrix = np.array(rows, dtype=float).reshape(len(rows), width)
+            matrix[~np.isfinite(matrix)] = np.nan
+            return matrix
+        except (TypeError, ValueError):
+            matrix = np.array(rows, dtype=object).reshape(len(rows), width)
+    else:
+        matrix = np.full((len(rows), width), np.nan, dtype=object)
+        for i, row in enumerate(rows):
+            matrix[i, :len(row)] = row
+
+    # map "U" over the whole object array at once instead of element by element in Python
+    matrix[matrix == "U"] = np.nan
+    try:
+        matrix = matrix.astype(float)
+    except (TypeError, ValueError):
+        # anything else that is not a number is missing too
+        matrix = np.array([[x if isinstance(x, (int, float)) else np.nan for x in row] for row in matrix], dtype=float).reshape(matrix.shape)
+    matrix[~np.isfinite(matrix)] = np.nan
+    return matrix
+
+def summarize(matrix: np.ndarray, pollcount: np.ndarray) -> dict:
+    """
+    Per-row volley statistics in one vectorized pass.
+
+    Args:
+        matrix (np.ndarray): monitors × pollcount latencies, NaN for lost probes
+        pollcount (np.ndarray): Probes each monitor was meant to send
+
+    Returns:
+        dict: count, loss, median, min, max, mean and stddev arrays, NaN where a row has no replies
+    """
+    rows = np.arange(matrix.shape[0])
+    count = np.count_nonzero(~np.isnan(matrix), axis=1)
+    replied = count > 0
+
+    # NaN sorts last, so the replies of every row are its first count columns
+    ordered = np.sort(matrix, axis=1)
+    last = np.maximum(count - 1, 0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        median = (ordered[rows, last // 2] + ordered[rows, np.minimum(count // 2, last)]) / 2
+        mean = np.nansum(matrix, axis=1) / count
+        stddev = np.sqrt(np.nansum((matrix - mean[:, None]) ** 2, axis=1) / count)
+
+    return {
+        "count": count,
+        "loss": pollcount - count,
+        "median": np.where(replied, median, np.nan),
+        "min": np.where(replied, ordered[:, 0] if matrix.shape[1] else np.nan, np.nan),
+        "max": np.where(replied, ordered[rows, last] if matrix.shape[1] else np.nan, np.nan),
+        "mean": mean,
+        "stddev": stddev
+    }
+
+def p2_step(q: np.ndarray, n: np.ndarray, x: np.ndarray, count: np.ndarray, dn: np.ndarray, warm: np.ndarray):
+    """
+    Advance many P² estimators by one sample each, in place.
+
+    Markers are stored marker-major so every step works on contiguous rows.
+
+    Args:
+        q (np.ndarray): 5 × estimators marker heights
+        n (np.ndarray): 5 × estimators marker positions (float)
+        x (np.ndarray): One sample per estimator
+        count (np.ndarray): Samples seen per estimator including x
+        dn (np.ndarray): 5 × estimators desired position increments
+        warm (np.ndarray): Estimators past their first five samples, the others are left untouched
+    """
+
+    # stretch the extremes, the markers above the sample's cell shift up one position
+    np.minimum(q[0], np.where(warm, x, np.inf), out=q[0])
+    np.maximum(q[4], np.where(warm, x, -np.inf), out=q[4])
+    n[1:4] += warm & (x < q[1:4])
+    n[4] += warm
+
+    # move the middle markers towards their desired positions, a marker's
+    # drift only depends on its own position so it is worked out up front
+    drift = dn[1:4] * (count - 1) - n[1:4]
+    for i in (1, 2, 3):
+        d = drift[i - 1]
+        move = warm & (((d >= 1) & (n[i + 1] - n[i] > 1)) | ((d <= -1) & (n[i - 1] - n[i] < -1)))
+        if not move.any():
+            continue
+        d = np.where(d > 0, 1.0, -1.0)
+        qp = q[i] + d / (n[i + 1] - n[i - 1]) * (
+            (n[i] - n[i - 1] + d) * (q[i + 1] - q[i]) / (n[i + 1] - n[i]) +
+            (n[i + 1] - n[i] - d) * (q[i] - q[i - 1]) / (n[i] - n[i - 1]))
+        linear = ~((q[i - 1] < qp) & (qp < q[i + 1]))
+        if linear.any():
+            up = d > 0
+            qp = np.where(linear, q[i] + d * (np.where(up, q[i + 1], q[i - 1]) - q[i]) /
+                (np.where(up, n[i + 1], n[i - 1]) - n[i]), qp)
+        np.copyto(q[i], qp, where=move)
+        n[i] += np.where(move, d, 0.0)
+
+def load_states(blobs: list[Optional[bytes]]) -> np.ndarray:
+    """ Monitors.stats blobs as one STATE_DTYPE array, None or unknown versions start empty """
+    empty = StreamStats().dump()
+    return np.frombuffer(b"".join(blob if blob and len(blob) == STATE.size and blob[0] == STATE_VERSION else empty
+        for blob in blobs), dtype=STATE_DTYPE).copy()
+
+def dump_states(state: np.ndarray) -> list[bytes]:
+    """ One Monitors.stats blob per row of a STATE_DTYPE array """
+    raw = state.tobytes()
+    return [raw[i * STATE.size:(i + 1) * STATE.size] for i in range(len(state))]
+
+def update_states(state: np.ndarray, matrix: np.ndarray, pollcount: np.ndarray) -> dict:
+    """
+    Add one volley to many monitors at once, the vectorized form of StreamStats.add_volley.
+
+    Args:
+        state (np.ndarray): load_states() of the monitors, updated in place; one row per monitor
+        matrix (np.ndarray): monitors × pollcount latencies from volley_matrix
+        pollcount (np.ndarray): Probes each monitor was meant to send
+
+    Returns:
+        dict: summarize() of the volleys
+    """
+    summary = summarize(matrix, pollcount)
+    count, replied = summary["count"], summary["count"] > 0
+
+    # volley level means
+    state["volleys"] += 1
+    state["mean_loss"] += (summary["loss"] - state["mean_loss"]) / state["volleys"]
+    state["replied"] += replied
+    divisor = np.maximum(state["replied"], 1)
+    for field, key in (("mean_median", "median"), ("mean_min", "min"), ("mean_max", "max"), ("mean_stddev", "stddev")):
+        state[field] = np.where(replied, state[field] + (summary[key] - state[field]) / divisor, state[field])
+    state["ewma"] = np.where(replied, np.where(state["replied"] == 1, summary["median"],
+        state["ewma"] + EWMA_ALPHA * (summary["median"] - state["ewma"])), state["ewma"])
+
+    # sample level Welford state, merged per volley (Chan et al.)
+    before = state["samples"].astype(float)
+    total = before + count
+    with np.errstate(invalid="ignore", divide="ignore"):
+        delta = summary["mean"] - state["sample_mean"]
+        state["sample_mean"] = np.where(replied, state["sample_mean"] + delta * count / total, state["sample_mean"])
+        state["sample_m2"] = np.where(replied, state["sample_m2"] + summary["stddev"] ** 2 * count + delta ** 2 * before * count / total,
+            state["sample_m2"])
+
+    # P² quantiles, one column of samples at a time across every row and quantile
+    estimators = len(QUANTILES)
+    seen = state["samples"].astype(np.int64)
+    q = state["heights"].reshape(-1, 5).T.copy()
+    n = state["positions"].reshape(-1, 5).T.astype(float)
+    dn = np.tile(P2_DN, (len(state), 1)).T
+    repeated = np.repeat(matrix, estimators, axis=0).T
+    with np.errstate(invalid="ignore", divide="ignore"):
+        for column, samples in zip(matrix.T, repeated):
+            valid = ~np.isnan(column)
+            seen = seen + valid
+            warm = valid & (seen > 5)
+            if warm.any():
+                p2_step(q, n, samples, np.repeat(seen, estimators), dn, np.repeat(warm, estimators))
+            for row in np.flatnonzero(valid & (seen <= 5)):
+                # the first five samples of a monitor are kept sorted as the initial markers
+                cells = slice(row * estimators, (row + 1) * estimators)
+                q[seen[row] - 1, cells] = column[row]
+                q[:seen[row], cells] = np.sort(q[:seen[row], cells], axis=0)
+    state["heights"] = q.T.reshape(-1, estimators, 5)
+    state["positions"] = n.T.reshape(-1, estimators, 5)
+    state["samples"] = seen
+
+    return summary
@@ -0,0 +1,222 @@
+"""
+Kinetic - Pluggable time-series storage for volley results
+
+Everything that stores or reads monitor history goes through the backend
+returned by open_backend(), selected with KINETIC_TSDB:
+
+    rrd        one RRD file per monitor behind the rrdcache write buffer (default)
+    columnar   chunked columnar store with rollups, see colstore.py
+
+Both backends answer range queries with the same columns, one row per bucket
+of a regular grid: loss (percent of the volley), median, min, p25, p75, p95
+and max latency in ms, NaN where there is no data.
+
+The RRD backend keeps the existing files and the console PNG graphs. The
+columnar backend stores a fixed per-volley summary instead of one data source
+per probe, so a monitor's pollcount can change at any time, and keeps a few
+files per hour for the whole fleet instead of one file per monitor.
+
+Server environment variables:
+    KINETIC_TSDB   backend name (default rrd)
+"""
+
+import logging
+import warnings
+from os import environ, path, remove
+from typing import Optional, Union
+import numpy as np
+from rrdtool import xport
+from rrdcache import rrdcache
+from streamstats import volley_matrix, summarize
+
+logger = logging.getLogger(__name__)
+
+# Columns of every series, in display order
+SERIES_COLUMNS = ("loss", "median", "min", "p25", "p75", "p95", "max")
+
+# Percentile columns computed from the individual probe results
+PERCENTILES = {"p25": 25, "p75": 75, "p95": 95}
+
+def percentiles(matrix: np.ndarray) -> dict:
+    """
+    PERCENTILES of every row, skipping NaN, in one vectorized pass.
+
+    Same linear interpolation as np.nanpercentile, which loops over rows.
+
+    Args:
+        matrix (np.ndarray): rows × values, NaN for missing values
+
+    Returns:
+        dict: Column name -> float array, NaN for rows without values
+    """
+    if not matrix.shape[1]:
+        return {name: np.full(matrix.shape[0], np.nan) for name in PERCENTILES}
+
+    # NaN sorts last, so the values of every row are its first count columns
+    rows = np.arange(matrix.shape[0])
+    ordered = np.sort(matrix, axis=1)
+    last = np.maximum(np.count_nonzero(~np.isnan(matrix), axis=1) - 1, 0)
+    found = {}
+    for name, p in PERCENTILES.items():
+        position = last * p / 100
+        low = np.floor(position).astype(int)
+        high = np.minimum(low + 1, last)
+        found[name] = ordered[rows, low] + (ordered[rows, high] - ordered[rows, low]) * (position - low)
+    return found
+
+def volley_summary(rows: list[list[Union[float, str]]], pollcount: np.ndarray) -> dict:
+    """
+    SERIES_COLUMNS for a batch of volleys, one value per volley.
+
+    Args:
+        rows (list): Results per volley, floats or "U"
+        pollcount (np.ndarray): Probes sent per volley
+
+    Returns:
+        dict: Column name -> float array, NaN latencies for volleys without replies
+    """
+    matrix = volley_matrix(rows)
+    stats = summarize(matrix, pollcount)
+    return {
+        "loss": stats["loss"] * 100.0 / pollcount,
+        "median": stats["median"],
+        "min": stats["min"],
+        **percentiles(matrix),
+        "max": stats["max"]
+    }
+
+class TimeSeriesBackend:
+    """
+    Storage interface for volley results.
+
+    Implementations are shared by the ingest workers and request threads and
+    must be thread safe.
+    """
+
+    name = None
+
+    def start(self):
+        """ Start background work such as flushing """
+
+    def stop(self):
+        """ Write everything buffered and stop background work """
+
+    def append(self, updates: list[tuple]):
+        """
+        Store a batch of volleys.
+
+        Args:
+            updates (list[tuple]): (agent_id, monitor_id, step, results, timestamp) in time order per monitor
+        """
+        raise NotImplementedError
+
+    def flush(self, keys: Optional[list[tuple]] = None):
+        """ Make buffered volleys of these (agent_id, monitor_id) keys, or all of them, visible to readers """
+
+    def scan(self, keys: list[tuple], start: int, end: int, width: int) -> dict:
+        """
+        Read many monitors over one time range.
+
+        Args:
+            keys (list[tuple]): (agent_id, monitor_id, pollcount)
+            start (int): Range start, epoch seconds
+            end (int): Range end, epoch seconds
+            width (int): Most rows wanted, the backend picks the bucket size
+
+        Returns:
+            dict: (agent_id, monitor_id) -> {"start", "step", "rows", "columns": {name: np.ndarray}},
+                monitors without any stored data are left out
+        """
+        raise NotImplementedError
+
+    def series(self, agent_id: str, monitor_id: str, pollcount: int, start: int, end: int, width: int) -> Optional[dict]:
+        """ scan() for one monitor, None without data """
+        return self.scan([(agent_id, monitor_id, pollcount)], start, end, width).get((agent_id, monitor_id))
+
+    def delete(self, agent_id: str, monitor_id: str):
+        """ Drop a monitor's history """
+        raise NotImplementedError
+
+    def stats(self) -> dict:
+        """ Backend counters for /volley/queue """
+        return {"backend": self.name}
+
+class RRDBackend(TimeSeriesBackend):
+    """ One RRD file per monitor, written through rrdcache """
+
+    name = "rrd"
+
+    def start(self):
+        rrdcache.start()
+
+    def stop(self):
+        rrdcache.stop()
+
+    def append(self, updates: list[tuple]):
+        # one broken file must not hold back the rest of the batch
+        for agent_id, monitor_id, step, results, timestamp in updates:
+            try:
+                rrdcache.add(agent_id, monitor_id, step, results, timestamp)
+            except Exception:
+                logger.exception("tsdb: rrd update failed for monitor %s", monitor_id)
+
+    def flush(self, keys: Optional[list[tuple]] = None):
+        rrdcache.flush(None if keys is None else [rrdcache.path(agent_id, monitor_id) for agent_id, monitor_id in keys])
+
+    def scan(self, keys: list[tuple], start: int, end: int, width: int) -> dict:
+        found = {}
+        for agent_id, monitor_id, pollcount in keys:
+            rrd_file = rrdcache.path(agent_id, monitor_id)
+            if not path.exists(rrd_file):
+                continue
+            self.flush([(agent_id, monitor_id)])
+
+            # let rrdtool consolidate to fit the width
+            rrd = ["--start", f"{start}", "--end", f"{end}", "--maxrows", f"{width}"]
+            # the file keeps the pollcount it was created with, loss counts out of that too
+            count = rrdcache.width(rrd_file, pollcount)
+            names = ["loss", "median"] + [f"result{i}" for i in range(1, count + 1)]
+            for name in names:
+                rrd.append(f"DEF:{name}={rrd_file}:{name}:AVERAGE")
+                rrd.append(f"XPORT:{name}")
+            series = xport(rrd)
+
+            # rows x (loss, median, result1..N), NaN where rrdtool has no data
+            data = np.array(series["data"], dtype=float).reshape(-1, len(names))
+            results = data[:, 2:]
+            with warnings.catch_warnings():
+                # rows without any result are all NaN
+                warnings.simplefilter("ignore", RuntimeWarning)
+                columns = {
+                    "loss": data[:, 0] * 100 / count,
+                    "median": data[:, 1],
+                    "min": np.nanmin(results, axis=1),
+                    **percentiles(results),
+                    "max": np.nanmax(results, axis=1)
+                }
+            found[(agent_id, monitor_id)] = {"start": series["meta"]["start"], "step": series["meta"]["step"], "rows": len(data), "columns": columns}
+        return found
+
+    def delete(self, agent_id: str, monitor_id: str):
+        rrd_file = rrdcache.path(agent_id, monitor_id)
+        rrdcache.discard(rrd_file)
+        try:
+            remove(rrd_file)
+        except OSError:
+            pass
+
+    def stats(self) -> dict:
+        return {"backend": self.name, **rrdcache.stats()}
+
+def open_backend(name: Optional[str] = None) -> TimeSeriesBackend:
+    """ The backend named by KINETIC_TSDB """
+    name = (name or environ.get("KINETIC_TSDB", "rrd")).lower()
+    if name == "rrd":
+        return RRDBackend()
+    if name == "columnar":
+        from colstore import ColumnarBackend
+        return ColumnarBackend()
+    raise ValueError(f"unknown KINETIC_TSDB backend {name!r}, use rrd or columnar")
+
+# Shared by the ingest workers, the API and the monitors router
+tsdb = open_backend()
@@ -3,23 +3,45 @@ This script will send a volley of packets to a target and return the average lat
 
 If Running from CLI:
 $ watch KINETIC_AGENT_ID=<AGENT UUID> KINETIC_SERVER=<SERVER URL> timeout 90 python volley.py
+
+KINETIC_SWEEP_PPS=<packets per second> probes every target of a cycle in one
+interleaved sweep instead of a thread per monitor.
+
+Probes are paced by token buckets, KINETIC_PACE_PPS for the whole agent
+(default 1000) and KINETIC_PACE_DEST_PPS per destination (default 100).
+
+If Running as a long-lived agent:
+$ KINETIC_MODE=daemon KINETIC_AGENT_ID=<AGENT UUID> KINETIC_SERVER=<SERVER URL> python volley.py
+
+RTTs are measured from kernel receive timestamps where available,
+KINETIC_TIMESTAMP=user switches to time.perf_counter_ns() on both ends.
+
+ICMP uses unprivileged ping sockets where the kernel allows them, then raw
+sockets, then scapy; KINETIC_BACKEND=dgram|raw|scapy forces one. TCP times
+non-blocking connect() handshakes; KINETIC_TCP_BACKEND=syn sends raw SYNs.
 """
 
 from uuid import UUID
 from pydantic import BaseModel, Field, field_validator, IPvAnyAddress, ValidationError
-from scapy.all import sr1, IP, IPv6, ICMP, ICMPv6EchoRequest, TCP
-from json import dumps as json_dumps, loads as json_loads
-from os import environ
-from sys import argv
-from socket import gethostbyname, gaierror
+from json import dumps as json_dumps
+from os import environ, getpid
+from sys import argv, platform
+from socket import socket, socketpair, gethostbyname, gaierror, inet_pton, AF_INET, AF_INET6, SOCK_RAW, SOCK_DGRAM, SOCK_STREAM, IPPROTO_IP, IPPROTO_IPV6, IPPROTO_ICMP, IPPROTO_ICMPV6, IPPROTO_TCP, IP_TOS, IPV6_TCLASS, SOL_SOCKET, SO_LINGER, CMSG_SPACE
+from select import select
+from itertools import count
+from random import randrange
+from heapq import heappush, heappop
+from hashlib import md5
 import concurrent.futures
+import asyncio
+import threading
+import struct
 import requests
 import time
 import logging
 
 # Set the logging formatting and level
 logging.basicConfig(format='%(asctime)s - %(levelname)s: %(message)s',level=logging.INFO)
-logging.getLogger("scapy.runtime").setLevel(logging.ERROR)
 #logging.disable(logging.DEBUG)
 
 # Define TOS hex mapping of DSCP names
@@ -34,6 +56,610 @@ dscp_name_map = {
     "CS7": 0xE0
 } #dscp_name_map[key]
 
+# Linux SO_TIMESTAMPNS/SCM_TIMESTAMPNS (not exported by the socket module) and struct timespec
+SO_TIMESTAMPNS = 35
+TIMESPEC = struct.Struct("@ll")
+
+# ICMP sequence numbers are unique across every engine in the process
+icmp_sequence = count()
+
+def checksum(data):
+    """ RFC 1071 internet checksum """
+    if len(data) % 2:
+        data += b"\x00"
+    total = sum(struct.unpack(f"!{len(data) // 2}H", data))
+    total = (total >> 16) + (total & 0xFFFF)
+    total += total >> 16
+    return ~total & 0xFFFF
+
+class Probe:
+    """
+    A single packet waiting in the Receiver dispatch table.
+
+    Attributes:
+    key (tuple): (destination, id, seq) for ICMP or (destination, sport, dport) for TCP
+    sent (int): Receiver.clock() in ns taken right before the packet was sent
+    received (int): Kernel receive timestamp (or Receiver.clock()) in ns, None until then
+    reply (int): ICMP type or TCP flags of the reply
+    waiter (Waiter): Signalled once the reply has been dispatched
+    """
+    __slots__ = ("key", "sent", "received", "reply", "waiter")
+
+    def __init__(self, key, waiter):
+        self.key = key
+        self.sent = None
+        self.received = None
+        self.reply = None
+        self.waiter = waiter
+
+    def latency(self):
+        """ Return the RTT in ms or "U" if no reply was received """
+        if self.received is None:
+            return "U"
+        return round((self.received - self.sent) / 1000000, 2)
+
+class Waiter:
+    """
+    Count down the replies still owed to a volley and wake the sender at zero.
+
+    Threads block on `event`; coroutines await `wait()`, which is resolved on
+    their event loop from the receiver thread.
+    """
+
+    def __init__(self, outstanding):
+        self.lock = threading.Lock()
+        self.outstanding = outstanding
+        self.event = threading.Event()
+        self.loop = None
+        self.future = None
+        if outstanding <= 0:
+            self.event.set()
+
+    def done(self):
+        with self.lock:
+            self.outstanding -= 1
+            if self.outstanding <= 0:
+                self.event.set()
+                if self.future:
+                    self.loop.call_soon_threadsafe(self.wake)
+
+    def wake(self):
+        if not self.future.done():
+            self.future.set_result(None)
+
+    async def wait(self, timeout):
+        """ Wait on the running event loop until all replies are in or timeout expires """
+        with self.lock:
+            if self.event.is_set():
+                return
+            self.loop = asyncio.get_running_loop()
+            self.future = self.loop.create_future()
+        try:
+            await asyncio.wait_for(self.future, timeout)
+        except asyncio.TimeoutError:
+            pass
+
+class Receiver:
+    """
+    One receive loop per agent process.
+
+    Every socket (raw ICMP, ICMPv6 and TCP, or unprivileged ICMP datagram
+    "ping" sockets) is opened once and read by a single thread. Replies are demultiplexed to the waiting probes through a lookup
+    table keyed by (destination, id, seq) for ICMP or (destination, sport, dport)
+    for TCP, so each captured packet is parsed once no matter how many monitors
+    are running.
+
+    With timestamps="kernel" every reply carries its SO_TIMESTAMPNS receive
+    time from the kernel and sends are stamped with time.time_ns() right before
+    sendto, so the RTT no longer includes the time a busy agent takes to get
+    round to reading the socket. With timestamps="user" (or where the kernel
+    option is unavailable) both ends use time.perf_counter_ns().
+
+    Parameters:
+    timestamps (str): "kernel" or "user"
+    """
+
+    def __init__(self, timestamps="kernel"):
+        self.kernel = timestamps == "kernel" and platform.startswith("linux")
+        self.clock = time.time_ns if self.kernel else time.perf_counter_ns
+        self.lock = threading.Lock()
+        self.send_lock = threading.Lock()
+        self.pending = {}
+        self.sockets = {}
+        self.thread = None
+        self.idents = {}
+        self.wakeup_r, self.wakeup_w = socketpair()
+        self.ident = getpid() & 0xFFFF
+
+    def open(self, family, proto, kind=SOCK_RAW):
+        """ Open (or reuse) the shared socket for an address family, protocol and socket type """
+        with self.lock:
+            sock = self.sockets.get((family, proto, kind))
+            if sock is None:
+                sock = socket(family, kind, proto)
+                sock.setblocking(False)
+                if kind == SOCK_DGRAM:
+                    # ping sockets: the kernel rewrites the ICMP id to the bound port
+                    sock.bind(("::" if family == AF_INET6 else "0.0.0.0", 0))
+                    self.idents[(family, proto, kind)] = sock.getsockname()[1]
+                else:
+                    self.idents[(family, proto, kind)] = self.ident
+                if self.kernel:
+                    try:
+                        sock.setsockopt(SOL_SOCKET, SO_TIMESTAMPNS, 1)
+                    except OSError as e:
+                        logging.debug(f"Receiver: kernel timestamps unavailable: {e}")
+                self.sockets[(family, proto, kind)] = sock
+                self.wakeup_w.send(b"\x00")
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.loop, name="volley-receiver", daemon=True)
+                self.thread.start()
+        return sock
+
+    def ident_for(self, family, proto, kind=SOCK_RAW):
+        """ ICMP id that replies on this socket will carry """
+        self.open(family, proto, kind)
+        return self.idents[(family, proto, kind)]
+
+    def register(self, probe):
+        """ Add a probe to the dispatch table """
+        with self.lock:
+            self.pending[probe.key] = probe
+
+    def unregister(self, probes):
+        """ Remove probes (answered or timed out) from the dispatch table """
+        with self.lock:
+            for probe in probes:
+                if self.pending.get(probe.key) is probe:
+                    del self.pending[probe.key]
+
+    def send(self, family, proto, packet, target, tos, probe, kind=SOCK_RAW):
+        """ Send a packet on the shared socket with the requested TOS/traffic class """
+        sock = self.open(family, proto, kind)
+        self.register(probe)
+        with self.send_lock:
+            if family == AF_INET6:
+                sock.setsockopt(IPPROTO_IPV6, IPV6_TCLASS, tos)
+            else:
+                sock.setsockopt(IPPROTO_IP, IP_TOS, tos)
+            probe.sent = self.clock()
+            try:
+                sock.sendto(packet, (target, 0))
+            except OSError as e:
+                logging.debug(f"Receiver: send to {target} failed: {e}")
+
+    def dispatch(self, key, received, reply):
+        """ Hand a reply to the probe waiting on key """
+        with self.lock:
+            probe = self.pending.pop(key, None)
+        if probe:
+            probe.received = received
+            probe.reply = reply
+            probe.waiter.done()
+
+    def parse(self, family, proto, kind, packet, address):
+        """ Return (key, reply) for an echo reply or TCP SYN-ACK/RST, else None """
+        if proto == IPPROTO_ICMPV6 or kind == SOCK_DGRAM:
+            offset = 0
+        else:
+            offset = (packet[0] & 0x0F) * 4
+        if len(packet) < offset + 8:
+            return None
+        source = inet_pton(family, address[0])
+
+        if proto == IPPROTO_TCP:
+            sport, dport, _, _, _, flags = struct.unpack("!HHIIBB", packet[offset:offset + 14])
+            if not flags & 0x12 == 0x12 and not flags & 0x04:
+                return None
+            return (source, dport, sport), flags
+
+        icmp_type, _, _, ident, seq = struct.unpack("!BBHHH", packet[offset:offset + 8])
+        if icmp_type not in (0, 129) or ident != self.idents[(family, proto, kind)]:
+            return None
+        return (source, ident, seq), icmp_type
+
+    def timestamp(self, ancillary):
+        """ Kernel receive time in ns from SCM_TIMESTAMPNS, or the clock if absent """
+        for level, kind, data in ancillary:
+            if level == SOL_SOCKET and kind == SO_TIMESTAMPNS and len(data) >= TIMESPEC.size:
+                seconds, nanoseconds = TIMESPEC.unpack(data[:TIMESPEC.size])
+                return seconds * 1000000000 + nanoseconds
+        return self.clock()
+
+    def loop(self):
+        """ Read every shared socket once and dispatch replies to their probes """
+        while True:
+            with self.lock:
+                sockets = {sock: key for key, sock in self.sockets.items()}
+            readable, _, _ = select([self.wakeup_r, *sockets], [], [])
+            for sock in readable:
+                if sock is self.wakeup_r:
+                    self.wakeup_r.recv(64)
+                    continue
+                family, proto, kind = sockets[sock]
+                while True:
+                    try:
+                        packet, ancillary, _, address = sock.recvmsg(2048, CMSG_SPACE(TIMESPEC.size))
+                    except (BlockingIOError, InterruptedError):
+                        break
+                    received = self.timestamp(ancillary)
+                    match = self.parse(family, proto, kind, packet, address)
+                    if match:
+                        self.dispatch(match[0], received, match[1])
+
+# Shared receiver for every probe in this agent process
+receiver = Receiver(timestamps=environ.get('KINETIC_TIMESTAMP', 'kernel').lower())
+
+class Pacer:
+    """
+    Token-bucket pacing that every probe backend passes through before sending.
+
+    One bucket limits the agent as a whole and one bucket per destination keeps
+    a single target from being hit harder than its routers will answer. Tokens
+    are reserved up front, so callers only need to sleep for the returned delay
+    (time.sleep in threads, asyncio.sleep in coroutines). Send timestamps are
+    taken after the pause, so pacing never shows up in the RTT.
+
+    Parameters:
+    rate (float): Packets per second for the whole agent, 0 for no limit
+    destination_rate (float): Packets per second per destination, 0 for no limit
+    """
+
+    def __init__(self, rate=1000, destination_rate=100):
+        self.lock = threading.Lock()
+        self.rate = rate
+        self.destination_rate = destination_rate
+        self.bucket = [max(rate / 10, 1), time.monotonic()]
+        self.buckets = {}
+        self.sent = 0
+        self.held = 0
+
+    def take(bucket, rate, packets, now):
+        """ Refill a bucket, reserve packets tokens and return the wait for them """
+        burst = max(rate / 10, 1)
+        bucket[0] = min(burst, bucket[0] + (now - bucket[1]) * rate)
+        bucket[1] = now
+        bucket[0] -= packets
+        return -bucket[0] / rate if bucket[0] < 0 else 0
+
+    def reserve(self, destination, packets=1):
+        """ Reserve tokens for packets to destination and return seconds to wait """
+        now = time.monotonic()
+        delay = 0
+        with self.lock:
+            if self.rate > 0:
+                delay = Pacer.take(self.bucket, self.rate, packets, now)
+            if self.destination_rate > 0:
+                if len(self.buckets) > 4096:
+                    self.buckets = {key: bucket for key, bucket in self.buckets.items() if bucket[0] < max(self.destination_rate / 10, 1)}
+                bucket = self.buckets.setdefault(destination, [max(self.destination_rate / 10, 1), now])
+                delay = max(delay, Pacer.take(bucket, self.destination_rate, packets, now))
+            self.sent += packets
+            if delay > 0:
+                self.held += packets
+        return delay
+
+    def wait(self, destination, packets=1):
+        """ Block the calling thread until packets may be sent to destination """
+        delay = self.reserve(destination, packets)
+        if delay > 0:
+            time.sleep(delay)
+
+    async def pause(self, destination, packets=1):
+        """ Coroutine version of wait() """
+        delay = self.reserve(destination, packets)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    def summary(self):
+        """ Return and reset (sent, held back) probe counts """
+        with self.lock:
+            counts = (self.sent, self.held)
+            self.sent = 0
+            self.held = 0
+        return counts
+
+# Shared pacing for every probe in this agent process
+pacer = Pacer(rate=float(environ.get('KINETIC_PACE_PPS', 1000)), destination_rate=float(environ.get('KINETIC_PACE_DEST_PPS', 100)))
+
+class TCPEngine:
+    """
+    Send TCP SYN probes on the shared Receiver raw TCP socket.
+
+    Parameters:
+    timeout (float): Seconds to wait for a SYN-ACK before counting the probe lost
+    """
+
+    def __init__(self, timeout=5.0):
+        self.timeout = timeout
+
+    def source(target, port):
+        """ Return the local address the kernel would route target through """
+        probe = socket(AF_INET, SOCK_DGRAM)
+        try:
+            probe.connect((target, port))
+            return probe.getsockname()[0]
+        finally:
+            probe.close()
+
+    def syn(target, sport, dport):
+        """ Build a TCP SYN segment (the kernel adds the IP header) """
+        seq = randrange(0, 0xFFFFFFFF)
+        header = struct.pack("!HHIIBBHHH", sport, dport, seq, 0, 5 << 4, 0x02, 64240, 0, 0)
+        pseudo = inet_pton(AF_INET, TCPEngine.source(target, dport)) + inet_pton(AF_INET, target) + struct.pack("!BBH", 0, IPPROTO_TCP, len(header))
+        return struct.pack("!HHIIBBHHH", sport, dport, seq, 0, 5 << 4, 0x02, 64240, checksum(pseudo + header), 0)
+
+    def result(probe):
+        """ Latency of a SYN-ACK answered probe, "U" for RST or no reply """
+        if probe.reply is not None and probe.reply & 0x12 == 0x12:
+            return probe.latency()
+        return "U"
+
+    def run(self, target, volley, port, tos):
+        """ Send a volley of SYNs one at a time and return the latencies """
+        latencies = []
+        packet = TCPEngine.syn(target, port, port)
+
+        # Send the volley of connections, replies come back through the shared receiver
+        for i in range(volley):
+            waiter = Waiter(1)
+            probe = Probe((inet_pton(AF_INET, target), port, port), waiter)
+            pacer.wait(target)
+            receiver.send(AF_INET, IPPROTO_TCP, packet, target, tos, probe)
+
+            # wait for the SYN-ACK (or RST) to be dispatched
+            waiter.event.wait(self.timeout)
+            receiver.unregister([probe])
+            latencies.append(TCPEngine.result(probe))
+
+        return latencies
+
+    async def arun(self, target, volley, port, tos):
+        """ Coroutine version of run() for the asyncio agent runtime """
+        latencies = []
+        packet = TCPEngine.syn(target, port, port)
+
+        for i in range(volley):
+            waiter = Waiter(1)
+            probe = Probe((inet_pton(AF_INET, target), port, port), waiter)
+            await pacer.pause(target)
+            receiver.send(AF_INET, IPPROTO_TCP, packet, target, tos, probe)
+            await waiter.wait(self.timeout)
+            receiver.unregister([probe])
+            latencies.append(TCPEngine.result(probe))
+
+        return latencies
+
+class ConnectEngine:
+    """
+    TCP connect-time probes built on non-blocking connect() driven by asyncio.
+
+    Every connection of a volley runs concurrently from a kernel-assigned
+    ephemeral source port, each bounded by `timeout`; refused or unanswered
+    connects count as loss. No raw socket or root is needed.
+
+    Parameters:
+    timeout (float): Seconds to wait for the handshake to complete
+    interval (float): Seconds between connection attempts of a volley
+    """
+
+    def __init__(self, timeout=2.0, interval=0.02):
+        self.timeout = timeout
+        self.interval = interval
+
+    async def connect(self, target, port, tos, delay):
+        """ Time one TCP handshake to target:port """
+        await asyncio.sleep(delay)
+        await pacer.pause(target)
+
+        family = AF_INET6 if ":" in target else AF_INET
+        sock = socket(family, SOCK_STREAM)
+        sock.setblocking(False)
+        try:
+            if family == AF_INET6:
+                sock.setsockopt(IPPROTO_IPV6, IPV6_TCLASS, tos)
+            else:
+                sock.setsockopt(IPPROTO_IP, IP_TOS, tos)
+            # reset on close so hundreds of probes do not pile up in TIME_WAIT
+            sock.setsockopt(SOL_SOCKET, SO_LINGER, struct.pack("ii", 1, 0))
+
+            start = time.perf_counter_ns()
+            await asyncio.wait_for(asyncio.get_running_loop().sock_connect(sock, (target, port)), self.timeout)
+            return round((time.perf_counter_ns() - start) / 1000000, 2)
+        except (OSError, asyncio.TimeoutError):
+            return "U"
+        finally:
+            sock.close()
+
+    async def arun(self, target, volley, port, tos):
+        """ Run every connect of the volley concurrently and return the latencies """
+        return list(await asyncio.gather(*[self.connect(target, port, tos, i * self.interval) for i in range(volley)]))
+
+    def run(self, target, volley, port, tos):
+        """ Blocking wrapper around arun() for the thread pool """
+        return asyncio.run(self.arun(target, volley, port, tos))
+
+class ICMPEngine:
+    """
+    Keep one or many ICMP volleys in flight at once.
+
+    Packets go out on the shared Receiver sockets and replies are matched back
+    by (target, id, sequence); each packet RTT is taken from its own send and
+    receive timestamps.
+
+    Parameters:
+    timeout (float): Seconds to wait for a reply after the last packet is sent
+    interval (float): Seconds between packets sent to the same target
+    kind (int): SOCK_DGRAM for unprivileged ping sockets, SOCK_RAW for raw sockets
+    """
+
+    def __init__(self, timeout=1.0, interval=0.02, kind=SOCK_RAW):
+        self.timeout = timeout
+        self.interval = interval
+        self.kind = kind
+
+    def echo_request(family, ident, seq):
+        """ Build an ICMP/ICMPv6 echo request with the given id and sequence """
+        payload = b"kinetic-volley\x00\x00"
+        if family == AF_INET6:
+            # kernel fills in the ICMPv6 checksum for raw and ping sockets
+            return struct.pack("!BBHHH", 128, 0, 0, ident, seq) + payload
+        header = struct.pack("!BBHHH", 8, 0, 0, ident, seq)
+        return struct.pack("!BBHHH", 8, 0, checksum(header + payload), ident, seq) + payload
+
+    def plan(self, volleys):
+        """ Return the waiter, probe grid and round-robin send schedule for volleys """
+        waiter = Waiter(sum([packets for _, packets, _ in volleys]))
+        probes = [[None] * packets for _, packets, _ in volleys]
+
+        # Build the send schedule round-robin so each target sees `interval` spacing
+        schedule = []
+        for i in range(max([packets for _, packets, _ in volleys], default=0)):
+            for v, (target, packets, tos) in enumerate(volleys):
+                if i < packets:
+                    schedule.append((i * self.interval, v, i, target, tos))
+
+        return waiter, probes, schedule
+
+    def fire(self, waiter, probes, v, i, target, tos):
+        """ Send one echo request and record its probe """
+        family = AF_INET6 if ":" in target else AF_INET
+        proto = IPPROTO_ICMPV6 if family == AF_INET6 else IPPROTO_ICMP
+        ident = receiver.ident_for(family, proto, self.kind)
+        seq = next(icmp_sequence) & 0xFFFF
+        probe = Probe((inet_pton(family, target), ident, seq), waiter)
+        probes[v][i] = probe
+        receiver.send(family, proto, ICMPEngine.echo_request(family, ident, seq), target, tos, probe, self.kind)
+
+    def collect(probes):
+        """ Drop unanswered probes from the receiver and return the latencies """
+        receiver.unregister([probe for volley_probes in probes for probe in volley_probes])
+        return [[probe.latency() for probe in volley_probes] for volley_probes in probes]
+
+    def run(self, volleys):
+        """
+        Send every volley concurrently and return one latencies list per volley
+
+        Parameters:
+        volleys (list): List of (target, volley, tos) tuples
+
+        Returns:
+        list: Latency list per volley, in ms or "U" when no reply was received
+        """
+
+        waiter, probes, schedule = self.plan(volleys)
+
+        start = time.perf_counter()
+        for offset, v, i, target, tos in schedule:
+            delay = start + offset - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            pacer.wait(target)
+            self.fire(waiter, probes, v, i, target, tos)
+
+        # Wait until every probe is answered or the timeout window closes
+        waiter.event.wait(self.timeout)
+
+        return ICMPEngine.collect(probes)
+
+    async def arun(self, volleys):
+        """ Coroutine version of run() for the asyncio agent runtime """
+
+        waiter, probes, schedule = self.plan(volleys)
+
+        start = time.perf_counter()
+        for offset, v, i, target, tos in schedule:
+            delay = start + offset - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            await pacer.pause(target)
+            self.fire(waiter, probes, v, i, target, tos)
+
+        # Wait until every probe is answered or the timeout window closes
+        await waiter.wait(self.timeout)
+
+        return ICMPEngine.collect(probes)
+
+class ScapyEngine:
+    """
+    Fallback ICMP backend for hosts without ping or raw socket support.
+
+    scapy is imported on first use only; the whole volley is handed to sr() so
+    it is still in flight at once.
+
+    Parameters:
+    timeout (float): Seconds to wait for replies after the last packet is sent
+    interval (float): Seconds between packets
+    """
+
+    def __init__(self, timeout=1.0, interval=0.02):
+        self.timeout = timeout
+        self.interval = interval
+
+    def run(self, volleys):
+        """ Send every volley and return one latencies list per volley """
+        from scapy.all import sr, IP, IPv6, ICMP, ICMPv6EchoRequest
+        logging.getLogger("scapy.runtime").setLevel(logging.ERROR)
+
+        results = []
+        for target, packets, tos in volleys:
+            if ":" in target:
+                packet = [IPv6(dst=target, hlim=64, tc=tos)/ICMPv6EchoRequest(id=receiver.ident, seq=i) for i in range(packets)]
+            else:
+                packet = [IP(dst=target, tos=tos)/ICMP(type=8, code=0, id=receiver.ident, seq=i) for i in range(packets)]
+
+            latencies = ["U"] * packets
+            pacer.wait(target, packets)
+            answered, _ = sr(packet, timeout=self.timeout, inter=self.interval, verbose=False)
+            for sent, reply in answered:
+                latencies[sent.seq] = round((reply.time - sent.sent_time) * 1000, 2)
+            results.append(latencies)
+
+        return results
+
+    async def arun(self, volleys):
+        """ Coroutine version of run(), scapy blocks so it runs in a thread """
+        return await asyncio.to_thread(self.run, volleys)
+
+# ICMP probe backend picked once per process, see icmp_engine()
+icmp_backend = None
+
+def icmp_engine():
+    """
+    Return an ICMP engine for the best backend available on this host.
+
+    KINETIC_BACKEND may force "dgram" (unprivileged ping sockets), "raw" or
+    "scapy"; the default "auto" tries them in that order.
+    """
+    global icmp_backend
+
+    if icmp_backend is None:
+        icmp_backend = environ.get('KINETIC_BACKEND', 'auto').lower()
+        if icmp_backend == 'auto':
+            for backend, kind in (('dgram', SOCK_DGRAM), ('raw', SOCK_RAW)):
+                try:
+                    socket(AF_INET, kind, IPPROTO_ICMP).close()
+                    icmp_backend = backend
+                    break
+                except OSError:
+                    continue
+            else:
+                icmp_backend = 'scapy'
+        logging.info(f"icmp_engine: {icmp_backend} backend")
+
+    if icmp_backend == 'scapy':
+        return ScapyEngine()
+    return ICMPEngine(kind=SOCK_DGRAM if icmp_backend == 'dgram' else SOCK_RAW)
+
+def tcp_engine():
+    """
+    Return the TCP probe engine: non-blocking connect() by default, or raw SYN
+    probes on the shared receiver with KINETIC_TCP_BACKEND=syn.
+    """
+    if environ.get('KINETIC_TCP_BACKEND', 'connect').lower() == 'syn':
+        return TCPEngine()
+    return ConnectEngine()
+
 class ReadJobInput(BaseModel):
     id: str = Field(..., pattern="^[0-9a-f]{8}-([0-9a-f]{4}-){3}[0-9a-f]{12}$", description="Monitor by id")
     address: str
@@ -70,6 +696,10 @@ class ReadJobInput(BaseModel):
             else:
                 raise ValueError("Invalid DSCP, must be one of the following:", list(dscp_name_map.keys()))
 
+def probe_protocol(protocol: str, port: int) -> str:
+    """ Protocol a job is actually probed with: TCP needs a port, port 0 falls back to ICMP """
+    return 'tcp' if protocol == 'tcp' and port != 0 else 'icmp'
+
 class volley(BaseModel):
     ip: str
     protocol: str = "icmp"
@@ -119,18 +749,21 @@ class volley(BaseModel):
             else:
                 raise ValueError("Invalid DSCP name provided. Must be one of the following:", list(dscp_name_map.keys()))
 
+    def latencies(self):
+        """ Run the volley and return the raw latency list, floats or "U" """
+
+        if probe_protocol(self.protocol, self.port) == 'tcp':
+            # run the TCP function and return the results
+            return volley.TCP(self.ip, self.volley, self.port, self.dscp)
+
+        # run the ping function and return the results
+        return volley.ICMP(self.ip, self.volley, self.dscp)
+
     def __str__(self):
         """ Return the string representation of the object """
         result = {}
+        latencies = self.latencies()
 
-        if self.protocol == 'icmp':
-            # run the ping function and return the results
-            latencies = volley.ICMP(self.ip, self.volley, self.dscp)
-        
-        if self.protocol == 'tcp' and self.port != 0:
-            # run the TCP function and return the results
-            latencies = volley.TCP(self.ip, self.volley, self.port, self.dscp)
-            
         # create a list of all floats in the list
         valid = [x for x in latencies if isinstance(x, float)]
 
@@ -168,49 +801,8 @@ class volley(BaseModel):
         tos (int): TOS value to set on the packet
         """
 
-        latencies = []
-        
-        if ":" in target:
-            packet = IPv6(dst=target, hlim=64, tc=tos)/ICMPv6EchoRequest()
-        else:
-            packet = IP(dst=target, tos=tos)/ICMP(type=8, code=0)
-
-        # Send the volley of packets
-        for i in range(volley):
-            # note the time before sending the packet
-            start_time = time.time()
-
-            # send the packet and receive the response
-            response = sr1(packet, timeout=1, verbose=False)
-
-            # note the time after the packet has been sent
-            end_time = time.time()
-
-            # DEBUG: print the response type
-            #print(response)
-
-            # check if the response is an echo reply
-            if ":" in target:
-                try:
-                    response_type = response.haslayer(ICMPv6EchoRequest)
-                except AttributeError:
-                    response_type = None
-            else:
-                try:
-                    response_type = response.getlayer(ICMP).type
-                except AttributeError:
-                    response_type = None
-
-            # calculate the difference in time and convert to ms if response and echo reply
-            if response and response_type == 0:
-                latency = round((end_time - start_time) * 100, 2)
-            else:
-                latency = "U"
-
-            # add the latency to the list
-            latencies.append(latency)
-
-        return latencies
+        # keep the whole volley in flight at once instead of one blocking sr1 per packet
+        return icmp_engine().run([(target, volley, tos)])[0]
 
     def TCP(target, volley=5, port=443, tos=0x00):
         """
@@ -223,47 +815,73 @@ class volley(BaseModel):
         tos (int): TOS value to set on the packet
         """
 
-        latencies = []
-        packet = IP(dst=target, tos=tos)/TCP(sport=port, dport=port, flags="S")
+        return tcp_engine().run(target, volley, port, tos)
 
-        # Send the volley of connections
-        for i in range(volley):
-            # note the time before sending the packet
-            start_time = time.time()
+# Submission encoding, switched to the binary format when the server advertises it
+submit_format = "application/json"
+VOLLEY_FORMAT = "application/x-kinetic-volley"
 
-            # send the packet and receive the response
-            response = sr1(packet, timeout=5, verbose=False)
+def encode_volley_results(results: list):
+    """
+    Pack volley results in the compact binary submission format.
 
-            # note the time after the packet has been sent
-            end_time = time.time()
+    Per monitor: 16 byte monitor UUID, 1 byte result count, then that many
+    big-endian float32 latencies with NaN for "U".
+    """
+    packed = []
+    for result in results:
+        latencies = [float("nan") if latency == "U" else latency for latency in result['results']]
+        packed.append(UUID(result['id']).bytes + struct.pack(f"!B{len(latencies)}f", len(latencies), *latencies))
+    return b"".join(packed)
 
-            # DEBUG: print the response
-            #print(response.getlayer(TCP).flags)
+# ETag of the last job list, None until the server sends one
+jobs_etag = None
 
-            # calculate the difference in time and convert to ms
-            if response.getlayer(TCP).flags == "SA":
-                latency = round((end_time - start_time) * 100, 2)
-            else:
-                latency = "U"
-            
-            # add the latency to the list
-            latencies.append(latency)
+# Seconds a job list refresh must have been held for before the agent asks again without backing off
+JOB_POLL_MIN = 1
 
-        return latencies
+# Longest long-poll the server accepts (JOB_WAIT_MAX in routers/volley.py)
+JOB_WAIT_MAX = 300
+
+def collect_volley_jobs(agent_id: UUID, server: str, session=requests, params=None, etag=None, timeout=30):
+    """
+    Collect volley jobs
+
+    Parameters:
+    etag (str): ETag of the jobs already held, the server answers 304 and this returns None if they are unchanged
+    timeout (int): Request timeout, long-polls need the wait on top of it
 
-def collect_volley_jobs(agent_id: UUID, server: str):
-    """ Collect volley jobs """
+    Returns None as well when the server cannot be reached or answers with an error.
+    """
+    global submit_format, jobs_etag
 
     DEF_START_TIME = time.time()
 
+    headers = {"Content-Type": "application/json"}
+    if etag:
+        headers["If-None-Match"] = etag
+
     # http request against server
     try:
-        jobs = requests.get(f"{server}/volley/{agent_id}", verify=False, timeout=30, headers={"Content-Type": "application/json"})
+        jobs = session.get(f"{server}/volley/{agent_id}", params=params, verify=False, timeout=timeout, headers=headers)
     except requests.exceptions.ConnectionError as e:
         print("Connection Error:", e)
+        return None
 
     logging.info(f"collect_volley_jobs: {round(time.time() - DEF_START_TIME, 2)}")
 
+    # anything but a job list or 304 is a failed fetch, keep the jobs and ETag we have
+    if jobs.status_code not in (200, 304):
+        logging.error(f"collect_volley_jobs: server answered {jobs.status_code}: {jobs.text[:200]}")
+        return None
+
+    # negotiate the submission format with the server
+    if VOLLEY_FORMAT in jobs.headers.get("X-Kinetic-Submit", ""):
+        submit_format = VOLLEY_FORMAT
+    jobs_etag = jobs.headers.get("ETag")
+
+    if jobs.status_code == 304:
+        return None
     return jobs.json()
 
 def execute_volley_job(job: dict):
@@ -280,33 +898,368 @@ def execute_volley_job(job: dict):
             print(e.json())
             quit()
 
-        # Run the volley function and return the results as data
-        data = volley(ip=job['address'], protocol=job['protocol'], port=job['port'], volley=job['pollcount'], dscp=job['dscp'])
-        data = json_loads(str(data))
-
+        # Run the volley, the server works out the statistics itself
         submit = {
             "id": job['id'],
-            "results": data['results']
+            "results": volley(ip=job['address'], protocol=job['protocol'], port=job['port'], volley=job['pollcount'], dscp=job['dscp']).latencies()
         }
 
         logging.info(f"{job['id']}: {round(time.time() - DEF_START_TIME, 2)}")
         return submit
     return None
 
-def submit_volley_result(agent_id: UUID, server: str, results: dict):
-    """ Submit volley results and return the status code """
+def submit_volley_result(agent_id: UUID, server: str, results: list, session=requests):
+    """ Submit volley results and return the response, None if the server could not be reached """
 
     DEF_START_TIME = time.time()
 
+    # encode once, compact binary if the server accepts it
+    if submit_format == VOLLEY_FORMAT:
+        data = encode_volley_results(results)
+    else:
+        data = json_dumps(results)
+
     # send results back to the server as a put request
+    response = None
     try:
-        requests.put(f"{server}/volley/{agent_id}", verify=False, timeout=30, headers={"Content-Type": "application/json"}, data=json_dumps(results))
+        response = session.put(f"{server}/volley/{agent_id}", verify=False, timeout=30, headers={"Content-Type": submit_format}, data=data)
     except requests.exceptions.ConnectionError as e:
         print("Connection Error:", e)
 
-    logging.info(f"submit_volley_result: {round(time.time() - JOBS_START_TIME, 2)}")
+    logging.info(f"submit_volley_result: {round(time.time() - DEF_START_TIME, 2)}")
+
+    return response
+
+class Sweep:
+    """
+    Probe every job of a cycle in one interleaved pass.
+
+    Packets for all targets are sent round-robin (the first packet of every
+    job, then the second, ...) at a fixed packets-per-second rate, so a cycle
+    takes roughly total packets / pps plus one timeout window no matter how
+    many monitors there are. Results land in a preallocated per-monitor array.
+    Backends that cannot send single packets (scapy, raw SYN) run their
+    volleys whole alongside the sweep.
+
+    Parameters:
+    pps (float): Packets per second across all targets
+    """
+
+    def __init__(self, pps=500):
+        self.pps = pps
+
+    async def arun(self, jobs):
+        """ Sweep the job list and return one submission per job """
+
+        results = [["U"] * job['pollcount'] for job in jobs]
+        protocols = [probe_protocol(job['protocol'], job['port']) for job in jobs]
+        icmp = icmp_engine()
+        tcp = tcp_engine()
+        sweep_icmp = isinstance(icmp, ICMPEngine)
+        sweep_tcp = isinstance(tcp, ConnectEngine)
+
+        # Whole-volley fallback for backends that cannot be interleaved
+        tasks = []
+        for j, job in enumerate(jobs):
+            tos = dscp_name_map[job['dscp'].upper()]
+            if protocols[j] == 'tcp' and not sweep_tcp:
+                tasks.append((j, None, asyncio.create_task(tcp.arun(job['address'], job['pollcount'], job['port'], tos))))
+            elif protocols[j] == 'icmp' and not sweep_icmp:
+                tasks.append((j, None, asyncio.create_task(icmp.arun([(job['address'], job['pollcount'], tos)]))))
+
+        # Round-robin schedule over every interleaved job
+        schedule = []
+        for i in range(max([job['pollcount'] for job in jobs], default=0)):
+            for j, job in enumerate(jobs):
+                if i < job['pollcount'] and (sweep_tcp if protocols[j] == 'tcp' else sweep_icmp):
+                    schedule.append((j, i))
+
+        icmp_packets = sum([1 for j, _ in schedule if protocols[j] == 'icmp'])
+        waiter = Waiter(icmp_packets)
+        probes = [[None] * job['pollcount'] for job in jobs]
+
+        start = time.perf_counter()
+        for slot, (j, i) in enumerate(schedule):
+            delay = start + slot / self.pps - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            job = jobs[j]
+            tos = dscp_name_map[job['dscp'].upper()]
+            if protocols[j] == 'tcp':
+                tasks.append((j, i, asyncio.create_task(tcp.connect(job['address'], job['port'], tos, 0))))
+            else:
+                await pacer.pause(job['address'])
+                icmp.fire(waiter, probes, j, i, job['address'], tos)
+
+        # One timeout window after the last packet for every ICMP reply
+        if icmp_packets:
+            await waiter.wait(icmp.timeout)
+            receiver.unregister([probe for job_probes in probes for probe in job_probes if probe])
+            for j, job_probes in enumerate(probes):
+                for i, probe in enumerate(job_probes):
+                    if probe:
+                        results[j][i] = probe.latency()
+
+        for j, i, task in tasks:
+            latencies = await task
+            if i is not None:
+                results[j][i] = latencies
+            elif protocols[j] == 'tcp':
+                results[j] = latencies
+            else:
+                results[j] = latencies[0]
 
-    return requests.status_codes
+        return [{"id": job['id'], "results": results[j]} for j, job in enumerate(jobs)]
+
+    def run(self, jobs):
+        """ Validate the job list and sweep it, invalid jobs are skipped """
+        valid = []
+        for job in jobs:
+            try:
+                ReadJobInput(**job)
+            except ValidationError as e:
+                logging.error(e.json())
+                continue
+            valid.append(job)
+        return asyncio.run(self.arun(valid))
+
+class Scheduler:
+    """
+    Heap of next-due times per monitor id.
+
+    Every monitor gets a fixed phase inside its pollinterval, derived from a
+    hash of its id, so monitors sharing an interval are spread evenly across
+    it instead of firing together, and a restarted agent keeps the same slots.
+
+    Parameters:
+    late (float): Seconds past its due time after which a probe is reported late
+    """
+
+    def __init__(self, late=1.0):
+        self.heap = []
+        self.due = {}
+        self.late = late
+
+    def phase(monitor_id, interval):
+        """ Deterministic offset of a monitor inside its interval """
+        return int(md5(monitor_id.encode()).hexdigest()[:8], 16) / 0x100000000 * interval
+
+    def slot(monitor_id, interval, after):
+        """ First due time at or after `after` that falls on the monitor's phase """
+        due = after - (after % interval) + Scheduler.phase(monitor_id, interval)
+        return due if due >= after else due + interval
+
+    def add(self, monitor_id, interval, now=None):
+        """ Schedule a monitor at its next slot """
+        due = Scheduler.slot(monitor_id, interval, time.time() if now is None else now)
+        self.due[monitor_id] = due
+        heappush(self.heap, (due, monitor_id))
+
+    def remove(self, monitor_id):
+        """ Unschedule a monitor, its heap entry is dropped lazily """
+        self.due.pop(monitor_id, None)
+
+    def reschedule(self, monitor_id, interval, due, now=None):
+        """ Move a monitor one interval on, skipping slots it has already missed """
+        now = time.time() if now is None else now
+        due += interval
+        if due < now:
+            due = Scheduler.slot(monitor_id, interval, now)
+        self.due[monitor_id] = due
+        heappush(self.heap, (due, monitor_id))
+
+    def next(self):
+        """ Earliest due time or None when nothing is scheduled """
+        while self.heap and self.due.get(self.heap[0][1]) != self.heap[0][0]:
+            heappop(self.heap)
+        return self.heap[0][0] if self.heap else None
+
+    def pop(self, now=None):
+        """ Return (monitor_id, due) for every monitor that is due """
+        now = time.time() if now is None else now
+        ready = []
+        while self.next() is not None and self.heap[0][0] <= now:
+            due, monitor_id = heappop(self.heap)
+            del self.due[monitor_id]
+            ready.append((monitor_id, due))
+        return ready
+
+class Agent:
+    """
+    Long-running asyncio agent.
+
+    Keeps the full job list for the agent in memory, refreshed from
+    GET /volley/{agent_id}?all=true, runs each monitor
+    as a coroutine in its Scheduler slot and reuses one keep-alive HTTP session
+    for every request to the server. Servers that send an ETag hold the
+    refresh open for up to `refresh` seconds and answer as soon as the
+    configuration changes, or with 304 if it did not; the agent asks again
+    right away, backing off if an unchanged or empty answer came back without
+    being held. Older servers are polled every `refresh` seconds.
+
+    Parameters:
+    agent_id (str): Agent UUID
+    server (str): Kinetic server URL
+    refresh (int): Seconds between job list refreshes, or the long-poll wait
+    """
+
+    def __init__(self, agent_id, server, refresh=300):
+        self.agent_id = agent_id
+        self.server = server
+        self.refresh = refresh
+        self.session = requests.Session()
+        self.jobs = {}
+        self.scheduler = Scheduler()
+        self.running = set()
+        self.tasks = set()
+        self.late = 0
+        self.wakeup = None
+        self.results = None
+
+    async def probe(self, job):
+        """ Run one volley for a job and return its submission """
+        tos = dscp_name_map[job['dscp'].upper()]
+        if probe_protocol(job['protocol'], job['port']) == 'tcp':
+            latencies = await tcp_engine().arun(job['address'], job['pollcount'], job['port'], tos)
+        else:
+            latencies = (await icmp_engine().arun([(job['address'], job['pollcount'], tos)]))[0]
+        return {"id": job['id'], "results": latencies}
+
+    async def execute(self, job):
+        """ Probe a job and queue its result """
+        try:
+            await self.results.put(await self.probe(job))
+        except Exception as e:
+            logging.error(f"{job['id']}: {e}")
+        finally:
+            self.running.discard(job['id'])
+
+    async def dispatch(self):
+        """ Start every monitor when its slot comes up and report probes that ran late """
+        while True:
+            now = time.time()
+            for job_id, due in self.scheduler.pop(now):
+                job = self.jobs.get(job_id)
+                if not job:
+                    continue
+                self.scheduler.reschedule(job_id, job['pollinterval'], due, now)
+
+                if job_id in self.running:
+                    self.late += 1
+                    logging.warning(f"{job_id}: previous volley still running, slot skipped")
+                    continue
+                if now - due > self.scheduler.late:
+                    self.late += 1
+                    logging.warning(f"{job_id}: started {round(now - due, 2)}s late")
+
+                self.running.add(job_id)
+                # the loop only keeps weak references to tasks, hold them until they finish
+                task = asyncio.create_task(self.execute(job))
+                self.tasks.add(task)
+                task.add_done_callback(self.tasks.discard)
+
+            # sleep until the next slot or until sync changes the schedule
+            upcoming = self.scheduler.next()
+            self.wakeup.clear()
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), None if upcoming is None else max(upcoming - time.time(), 0))
+            except asyncio.TimeoutError:
+                pass
+
+    async def sync(self):
+        """
+        Refresh the job list, long-polling while the jobs we hold are current
+
+        Returns:
+        bool: True if the server sent a new, non-empty job list
+        """
+        # the last ETag goes out even for an empty (or all invalid) job list, so the server holds the request
+        jobs = await asyncio.to_thread(collect_volley_jobs, self.agent_id, self.server, self.session,
+            {"all": "true", "wait": min(self.refresh, JOB_WAIT_MAX)}, jobs_etag, min(self.refresh, JOB_WAIT_MAX) + 30)
+
+        # None is a 304 (the jobs we have are current) or a failed request
+        if jobs is not None:
+            self.update(jobs)
+
+        sent, held = pacer.summary()
+        logging.info(f"sync: {len(self.jobs)} monitors, {self.late} late probes, {held}/{sent} probes held back by pacing since last sync")
+        self.late = 0
+        return bool(jobs)
+
+    def update(self, jobs):
+        """ Replace the job list and add/remove monitors from the scheduler """
+        if not isinstance(jobs, list):
+            raise ValueError(f"unexpected job list: {jobs}")
+
+        current = {}
+        for job in jobs:
+            try:
+                ReadJobInput(**job)
+            except ValidationError as e:
+                logging.error(e.json())
+                continue
+            job.setdefault('pollinterval', 60)
+            current[job['id']] = job
+
+        for job_id, job in self.jobs.items():
+            if job_id not in current or current[job_id]['pollinterval'] != job['pollinterval']:
+                self.scheduler.remove(job_id)
+        for job_id, job in current.items():
+            if job_id not in self.jobs or self.jobs[job_id]['pollinterval'] != job['pollinterval']:
+                self.scheduler.add(job_id, job['pollinterval'])
+
+        self.jobs = current
+        self.wakeup.set()
+
+    async def submit(self):
+        """ Submit results as they arrive, batching whatever is already queued """
+        batch = []
+        while True:
+            if not batch:
+                batch.append(await self.results.get())
+            while not self.results.empty():
+                batch.append(self.results.get_nowait())
+            try:
+                response = await asyncio.to_thread(submit_volley_result, self.agent_id, self.server, batch, self.session)
+            except Exception as e:
+                logging.error(f"submit: {e}")
+                response = None
+
+            # server ingest queue is full, keep the batch and try again when asked to
+            if response is not None and response.status_code == 503:
+                delay = float(response.headers.get("Retry-After", 5))
+                logging.warning(f"submit: server busy, retrying {len(batch)} results in {delay}s")
+                await asyncio.sleep(delay)
+                continue
+            batch = []
+
+    async def run(self):
+        """ Loop forever """
+        self.results = asyncio.Queue()
+        self.wakeup = asyncio.Event()
+        self.tasks.update([asyncio.create_task(self.submit()), asyncio.create_task(self.dispatch())])
+        backoff = 1
+        while True:
+            started = time.time()
+            try:
+                changed = await self.sync()
+            except Exception as e:
+                logging.error(f"sync: {e}")
+                await asyncio.sleep(self.refresh)
+                continue
+
+            # without an ETag the server does not long-poll
+            if jobs_etag is None:
+                await asyncio.sleep(self.refresh)
+                continue
+
+            # the server held the request, ask again at once; an unchanged or empty answer that came
+            # straight back was not held, back off instead of asking in a tight loop
+            if not changed and time.time() - started < JOB_POLL_MIN:
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, self.refresh)
+            else:
+                backoff = 1
 
 if __name__ == '__main__':
     '''
@@ -333,9 +1286,9 @@ if __name__ == '__main__':
         if not addresses:
             print("KINETIC_AGENT_ID and KINETIC_SERVER must be set!")
         else:
-            # If addresses are provided, run the ICMP function and print the results.
-            for address in addresses:
-                print(volley.ICMP(address, 20))
+            # If addresses are provided, run all ICMP volleys at once and print the results.
+            for latencies in icmp_engine().run([(address, 20, 0x00) for address in addresses]):
+                print(latencies)
         quit()
 
     START_TIME = time.time()
@@ -344,6 +1297,10 @@ if __name__ == '__main__':
     logging.info(f"  AGENT {agent_id}  ")
     logging.info("==============================================")
 
+    # Long-running asyncio agent instead of a single cycle
+    if environ.get('KINETIC_MODE', 'oneshot').lower() == 'daemon':
+        asyncio.run(Agent(agent_id, server, refresh=int(environ.get('KINETIC_REFRESH', 300))).run())
+
     # Collect jobs from the server.
     jobs = collect_volley_jobs(agent_id, server)
 
@@ -354,18 +1311,27 @@ if __name__ == '__main__':
     if jobs:
         JOBS_START_TIME = time.time()
 
+        # Sweep every target in one interleaved pass at a fixed packet rate
+        if float(environ.get('KINETIC_SWEEP_PPS', 0)) > 0:
+            job_results = Sweep(pps=float(environ['KINETIC_SWEEP_PPS'])).run(jobs)
+
         # Execute the jobs with a thread pool
-        with concurrent.futures.ThreadPoolExecutor() as executor:
-            job_results = list(executor.map(execute_volley_job, jobs))
+        else:
+            with concurrent.futures.ThreadPoolExecutor() as executor:
+                job_results = list(executor.map(execute_volley_job, jobs))
 
         # # Execute each of the jobs in serial
         # job_results = [execute_volley_job(job) for job in jobs]
 
         logging.info(f"execute_volley_job: {round(time.time() - JOBS_START_TIME, 2)}")
 
+        sent, held = pacer.summary()
+        logging.info(f"pacer: {held}/{sent} probes held back")
+
     # Submit the job results if there are any
+    job_results = [result for result in job_results if result]
     if job_results and len(job_results) > 0:
-        submit_volley_result(agent_id, server, json_dumps(job_results))
+        submit_volley_result(agent_id, server, job_results)
 
     # Total time to execute all jobs
     logging.info("==============================================")